@@ -5,6 +5,7 @@ from rps.utilities.misc import *
 from rps.utilities.controllers import *
 
 import numpy as np
+import matplotlib.pyplot as plt
 import time
 
 # Instantiate Robotarium object
@@ -0,0 +1,92 @@
+import itertools
+import os
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# ExperimentRunner: Fans a scenario out over a grid of parameters on a pool of
+# worker processes and streams the results back as the runs finish.
+
+ExperimentResult = namedtuple('ExperimentResult', ['index', 'parameters', 'seed', 'output', 'wall_time'])
+ExperimentResult.__doc__ = """Result of one run of a scenario.
+
+index: int (position of the run in the order the runs were generated)
+parameters: dictionary (keyword arguments the scenario was called with)
+seed: int (seed of the numpy and python random number generators for this run)
+output: whatever the scenario returned (e.g., a dictionary with the trajectory and r.get_errors())
+wall_time: double (seconds the scenario took to run)
+"""
+
+def parameter_grid(parameters):
+    """Expands a dictionary of parameter values into every combination of them.
+
+    parameters: dictionary (parameter name -> list of values)
+
+    -> list of dictionaries (one per combination)
+    """
+
+    #Check user input types
+    assert isinstance(parameters, dict), "In the parameter_grid function, the parameter values (parameters) must be a dictionary. Recieved type %r." % type(parameters).__name__
+
+    names = list(parameters)
+    return [dict(zip(names, values)) for values in itertools.product(*(parameters[name] for name in names))]
+
+def run_experiments(scenario, parameters, repetitions=1, seed=0, max_workers=None):
+    """Runs a scenario once per parameter combination (and repetition) on a pool of
+    processes.  Results are yielded as soon as each run finishes, so they generally
+    arrive out of order.
+
+    Every run seeds numpy's and python's global random number generators from its own
+    seed, which is derived from seed and the run index only.  Results are therefore
+    reproducible regardless of the number of workers or of which worker ran them.
+
+    The scenario must be a function defined at module level (so that it can be sent to
+    the worker processes) and should create its Robotarium with show_figure=False.
+
+    scenario: function (called as scenario(**parameters), its return value is the output of the run)
+    parameters: dictionary of lists (expanded with parameter_grid) or list of dictionaries
+    repetitions: int (number of runs with different seeds per parameter combination)
+    seed: int (base seed of the sweep)
+    max_workers: int (number of worker processes, defaults to the number of CPUs)
+
+    -> generator of ExperimentResult
+    """
+
+    #Check user input types
+    assert callable(scenario), "In the run_experiments function, the scenario (scenario) must be callable. Recieved type %r." % type(scenario).__name__
+    assert isinstance(parameters, (dict, list)), "In the run_experiments function, the parameters (parameters) must be a dictionary of lists or a list of dictionaries. Recieved type %r." % type(parameters).__name__
+    assert isinstance(repetitions, int), "In the run_experiments function, the number of repetitions (repetitions) must be an integer. Recieved type %r." % type(repetitions).__name__
+    assert isinstance(seed, int), "In the run_experiments function, the seed (seed) must be an integer. Recieved type %r." % type(seed).__name__
+
+    #Check user input ranges/sizes
+    assert repetitions > 0, "In the run_experiments function, the number of repetitions (repetitions) must be positive. Recieved %r." % repetitions
+
+    if isinstance(parameters, dict):
+        parameters = parameter_grid(parameters)
+
+    runs = [p for p in parameters for _ in range(repetitions)]
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(len(runs))]
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = [executor.submit(_run, scenario, index, p, s) for index, (p, s) in enumerate(zip(runs, seeds))]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Do not start the remaining runs if the caller stops early.
+            for future in futures:
+                future.cancel()
+
+def _run(scenario, index, parameters, seed):
+    # Executed in a worker process.
+    np.random.seed(seed)
+    random.seed(seed)
+
+    start = time.perf_counter()
+    output = scenario(**parameters)
+    wall_time = time.perf_counter() - start
+
+    return ExperimentResult(index, parameters, seed, output, wall_time)
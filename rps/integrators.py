@@ -0,0 +1,81 @@
+import numpy as np
+
+# Integrators for the unicycle model used by the simulator.  Each integrator
+# advances the poses in place by one time step under constant unicycle
+# velocities.  They operate on the last two axes, so they accept both 3xN pose
+# arrays and stacks of them (e.g., Mx3xN for ensembles).
+
+def euler_step(poses, velocities, time_step):
+    """Advances unicycle poses by one forward Euler step.
+
+    poses: 3xN numpy array (of unicycle poses, updated in place)
+    velocities: 2xN numpy array (of unicycle velocities [v;w])
+    time_step: double (length of the step in seconds)
+
+    -> 3xN numpy array (the updated poses)
+    """
+    v = velocities[..., 0, :]
+    w = velocities[..., 1, :]
+    theta = poses[..., 2, :]
+
+    poses[..., 0, :] += time_step*np.cos(theta)*v
+    poses[..., 1, :] += time_step*np.sin(theta)*v
+    poses[..., 2, :] += time_step*w
+
+    return poses
+
+def exact_arc_step(poses, velocities, time_step):
+    """Advances unicycle poses along the exact circular arc traced under constant
+    velocities.  Unlike the Euler step this has no integration error, so it is accurate
+    for arbitrarily large time steps.
+
+    poses: 3xN numpy array (of unicycle poses, updated in place)
+    velocities: 2xN numpy array (of unicycle velocities [v;w])
+    time_step: double (length of the step in seconds)
+
+    -> 3xN numpy array (the updated poses)
+    """
+    v = velocities[..., 0, :]
+    w = velocities[..., 1, :]
+
+    # Half of the heading change.  Written with sinc, the displacement is well defined
+    # (and equal to the straight line one) when w is zero.
+    half_turn = 0.5*time_step*w
+    distance = time_step*v*np.sinc(half_turn/np.pi)
+    heading = poses[..., 2, :] + half_turn
+
+    poses[..., 0, :] += distance*np.cos(heading)
+    poses[..., 1, :] += distance*np.sin(heading)
+    poses[..., 2, :] += time_step*w
+
+    return poses
+
+def create_substep_integrator(integrator=euler_step, substeps=1):
+    """Creates an integrator that splits every time step into a fixed number of equal
+    sub-steps of another integrator.
+
+    integrator: function (the integrator applied on every sub-step)
+    substeps: int (number of sub-steps per time step)
+
+    -> function (the sub-stepping integrator)
+    """
+
+    #Check user input types
+    assert callable(integrator), "In the function create_substep_integrator, the sub-step integrator (integrator) must be a function. Recieved type %r." % type(integrator).__name__
+    assert isinstance(substeps, int), "In the function create_substep_integrator, the number of sub-steps (substeps) must be an integer. Recieved type %r." % type(substeps).__name__
+
+    #Check user input ranges/sizes
+    assert substeps > 0, "In the function create_substep_integrator, the number of sub-steps (substeps) must be positive. Recieved %r." % substeps
+
+    if substeps == 1:
+        return integrator
+
+    def substep_integrator(poses, velocities, time_step):
+        dt = time_step/substeps
+        for _ in range(substeps):
+            integrator(poses, velocities, dt)
+        return poses
+
+    return substep_integrator
+
+INTEGRATORS = {'euler': euler_step, 'exact': exact_arc_step}
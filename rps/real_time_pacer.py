@@ -0,0 +1,77 @@
+# real_time_pacer.py
+
+import time
+
+
+class RealTimePacer:
+    """
+    Paces a loop so that it runs at most once per period of wall clock time.
+
+    The pacer sleeps until an absolute deadline on the monotonic clock instead of
+    spinning, so a paced simulation leaves the CPU idle between frames. Deadlines are
+    advanced by exactly one period per frame, which means oversleeping on one frame is
+    absorbed by the next one and the loop does not drift away from real time.
+
+    When the loop falls behind by one or more whole periods, the missed deadlines are
+    dropped rather than replayed back to back, and they are counted as skipped frames.
+    """
+
+    def __init__(self, period, tolerance=0.002):
+        """
+        Parameters:
+        - period: Target time between two frames (s).
+        - tolerance: How far past its deadline a frame may start before it is counted as late (s).
+        """
+        assert isinstance(period, (int, float)), "In the RealTimePacer class, the pacing period (period) must be an integer or float. Recieved type %r." % type(period).__name__
+        assert period > 0, "In the RealTimePacer class, the pacing period (period) must be positive. Recieved %r." % period
+        assert tolerance >= 0, "In the RealTimePacer class, the lateness tolerance (tolerance) must not be negative. Recieved %r." % tolerance
+
+        self.period = period
+        self.tolerance = tolerance
+        self.reset()
+
+    def reset(self):
+        """Forgets the current schedule and statistics. The next call to wait() returns immediately."""
+        self._deadline = None
+        self.frames = 0
+        self.late_frames = 0
+        self.skipped_frames = 0
+        self.max_lateness = 0.0
+
+    def wait(self):
+        """
+        Blocks until the start of the next frame.
+
+        Returns:
+        - The lateness of this frame in seconds (0 when it started on time).
+        """
+        now = time.monotonic()
+        self.frames += 1
+
+        if self._deadline is None:
+            # First frame starts the schedule.
+            self._deadline = now + self.period
+            return 0.0
+
+        if now < self._deadline:
+            time.sleep(self._deadline - now)
+            lateness = 0.0
+        else:
+            lateness = now - self._deadline
+            if lateness > self.tolerance:
+                self.late_frames += 1
+                self.max_lateness = max(self.max_lateness, lateness)
+
+            # Drop whole periods that can no longer be met.
+            missed = int(lateness // self.period)
+            if missed > 0:
+                self.skipped_frames += missed
+                self._deadline += missed*self.period
+
+        self._deadline += self.period
+
+        return lateness
+
+    def summary(self):
+        """Returns a one line description of the pacing statistics."""
+        return '{0} of {1} frames started late (worst by {2:.1f} ms), {3} frames skipped.'.format(self.late_frames, self.frames, 1000*self.max_lateness, self.skipped_frames)
@@ -1,7 +1,5 @@
 # robot_configuration.py
 
-import matplotlib.patches as patches
-
 class RobotConfigurator:
     def __init__(self, robotarium_instance, default_settings=None):
         self.robotarium_instance = robotarium_instance
@@ -88,7 +86,7 @@ class RobotConfigurator:
 
     def _apply_visual_settings(self, robot_id, shape, colors, transparency):
         """
-        Internal helper to apply visual settings like shape, color, and transparency to the robot's Matplotlib patches.
+        Internal helper to apply visual settings like shape, color, and transparency to the robot's renderer.
         
         Parameters:
         - robot_id: The identifier of the robot.
@@ -101,25 +99,16 @@ class RobotConfigurator:
         outline_color = colors['outline_color']
         head_marker_color = colors['head_marker_color']
         
-        # Apply settings to the robot's chassis patch
-        chassis = self.robotarium_instance.chassis_patches[robot_id]
-        chassis.set_facecolor(fill_color)
-        chassis.set_edgecolor(outline_color)
-        chassis.set_alpha(transparency)
-        chassis.set_linewidth(shape['outline_thickness'])
-        
-        # Configure the head marker
-        head_marker = patches.Circle(
-            self.robotarium_instance.poses[:2, robot_id],
-            shape['head_marker_size'],
-            facecolor=head_marker_color,
-            edgecolor=outline_color
-        )
-        # Remove any existing head marker, then add the new one
-        if len(self.robotarium_instance.left_led_patches) > robot_id:
-            self.robotarium_instance.left_led_patches[robot_id].remove()
-        self.robotarium_instance.left_led_patches[robot_id] = head_marker
-        self.robotarium_instance.axes.add_patch(head_marker)
+        renderer = self.robotarium_instance.renderer
+        if renderer is None:
+            # Nothing is drawn, the settings are only stored.
+            return
+
+        # Apply settings to the robot's chassis
+        renderer.set_chassis_style(robot_id, facecolor=fill_color, edgecolor=outline_color, alpha=transparency, linewidth=shape['outline_thickness'])
+
+        # Configure the head marker, which replaces the robot's left LED
+        renderer.set_head_marker(robot_id, shape['head_marker_size'], facecolor=head_marker_color, edgecolor=outline_color)
 
     def set_robot_colors_with_head(self, robot_id: int, fill_color: str, outline_color: str, head_marker_color: str) -> None:
         """
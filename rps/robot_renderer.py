@@ -0,0 +1,279 @@
+# robot_renderer.py
+
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.patches as patches
+from matplotlib.collections import PolyCollection, EllipseCollection
+from matplotlib.colors import to_rgba
+
+
+def create_robotarium_figure(boundaries):
+    """
+    Creates the interactive figure and axes that show the Robotarium arena.
+
+    Parameters:
+    - boundaries: [x, y, width, height] of the arena (lower left point, width and height).
+
+    Returns:
+    - (figure, axes)
+    """
+    figure, axes = plt.subplots()
+    axes.set_axis_off()
+
+    # Draw arena
+    axes.add_patch(patches.Rectangle(boundaries[:2], boundaries[2], boundaries[3], fill=False))
+
+    axes.set_xlim(boundaries[0]-0.1, boundaries[0]+boundaries[2]+0.1)
+    axes.set_ylim(boundaries[1]-0.1, boundaries[1]+boundaries[3]+0.1)
+
+    plt.ion()
+    plt.show()
+
+    plt.subplots_adjust(left=-0.03, right=1.03, bottom=-0.03, top=1.03, wspace=0, hspace=0)
+
+    return figure, axes
+
+
+class RobotRenderer:
+    """
+    Draws every robot in the Robotarium using one matplotlib collection per robot part
+    (chassis, wheels and LEDs) instead of one patch per part per robot.
+
+    All part positions are expressed once in the robot body frame (forward, left) and are
+    moved into the world frame for all robots at once with a single cos/sin evaluation per
+    frame, so the Python overhead of a redraw does not grow with the number of robots.
+    """
+
+    def __init__(self, axes, number_of_robots, robot_length=0.095, robot_width=0.09, robot_color='#FFD700'):
+        """
+        Parameters:
+        - axes: Matplotlib axes the robots are drawn on.
+        - number_of_robots: Number of robots to draw.
+        - robot_length: Length of the robot chassis (m).
+        - robot_width: Width of the robot chassis (m).
+        - robot_color: Initial fill color of every chassis.
+        """
+        N = number_of_robots
+        L = robot_length
+        W = robot_width
+
+        self.axes = axes
+        self.number_of_robots = N
+
+        # Body frame (forward, left) coordinates of every part.
+        self._chassis_local = np.array([[L/2 - 0.04, L/2], [L/2 - 0.04, -L/2], [L/2 - 0.04 + W, -L/2], [L/2 - 0.04 + W, L/2]])
+        # Right part first, left part second.
+        self._wheels_local = np.array([[L/2 - 0.04, L/2], [L/2 - 0.04, -L/2]])
+        self._leds_local = np.array([[0.875*L, -0.04], [0.875*L, -0.015]])
+
+        # Preallocated per-frame buffers.  Wheels and LEDs are stored as (2, N, 2) so that
+        # the flattened (2N, 2) offsets hold all right parts followed by all left parts.
+        self._cos = np.zeros(N)
+        self._sin = np.zeros(N)
+        self._chassis_verts = np.zeros((N, 4, 2))
+        self._wheel_offsets = np.zeros((2, N, 2))
+        self._led_offsets = np.zeros((2, N, 2))
+
+        # Per-robot style state
+        self._chassis_facecolors = np.tile(to_rgba(robot_color), (N, 1))
+        self._chassis_edgecolors = np.tile(to_rgba('k'), (N, 1))
+        self._chassis_linewidths = np.ones(N)
+        self._led_facecolors = np.tile(to_rgba('none'), (2*N, 1))
+        self._led_edgecolors = np.tile(to_rgba('k'), (2*N, 1))
+        self._led_widths = np.full(2*N, L/5)
+
+        self.wheels = EllipseCollection(np.full(2*N, 0.04), np.full(2*N, 0.04), np.zeros(2*N), units='xy',
+                                        offsets=self._wheel_offsets.reshape(-1, 2), offset_transform=axes.transData,
+                                        facecolors='k', edgecolors='k', zorder=2)
+        self.chassis = PolyCollection(self._chassis_verts, closed=True, facecolors=self._chassis_facecolors,
+                                      edgecolors=self._chassis_edgecolors, linewidths=self._chassis_linewidths, zorder=2)
+        self.leds = EllipseCollection(self._led_widths, self._led_widths, np.zeros(2*N), units='xy',
+                                      offsets=self._led_offsets.reshape(-1, 2), offset_transform=axes.transData,
+                                      facecolors=self._led_facecolors, edgecolors=self._led_edgecolors, zorder=2)
+
+        axes.add_collection(self.wheels, autolim=False)
+        axes.add_collection(self.chassis, autolim=False)
+        axes.add_collection(self.leds, autolim=False)
+
+    def update(self, poses):
+        """
+        Moves every robot part to the given poses.
+
+        Parameters:
+        - poses: 3xN numpy array of robot poses.
+        """
+        c = np.cos(poses[2, :], out=self._cos)
+        s = np.sin(poses[2, :], out=self._sin)
+
+        # Chassis vertices: (N, 4, 2), robots along the first axis
+        _body_to_world(poses[0, :, None], poses[1, :, None], c[:, None], s[:, None], self._chassis_local[None, :, :], self._chassis_verts)
+        # Wheel and LED centers: (2, N, 2), robots along the second axis
+        _body_to_world(poses[0, :], poses[1, :], c, s, self._wheels_local[:, None, :], self._wheel_offsets)
+        _body_to_world(poses[0, :], poses[1, :], c, s, self._leds_local[:, None, :], self._led_offsets)
+
+        self.chassis.set_verts(self._chassis_verts)
+        self.wheels.set_offsets(self._wheel_offsets.reshape(-1, 2))
+        self.leds.set_offsets(self._led_offsets.reshape(-1, 2))
+
+    def set_chassis_style(self, robot_ids, facecolor=None, edgecolor=None, alpha=None, linewidth=None):
+        """
+        Changes the appearance of the chassis of one or more robots.
+
+        Parameters:
+        - robot_ids: Robot index or array of robot indices.
+        - facecolor: Fill color of the chassis.
+        - edgecolor: Outline color of the chassis.
+        - alpha: Transparency applied to both the fill and the outline.
+        - linewidth: Outline thickness.
+        """
+        if facecolor is not None:
+            self._chassis_facecolors[robot_ids, :3] = to_rgba(facecolor)[:3]
+        if edgecolor is not None:
+            self._chassis_edgecolors[robot_ids, :3] = to_rgba(edgecolor)[:3]
+        if alpha is not None:
+            self._chassis_facecolors[robot_ids, 3] = alpha
+            self._chassis_edgecolors[robot_ids, 3] = alpha
+        if linewidth is not None:
+            self._chassis_linewidths[robot_ids] = linewidth
+
+        self.chassis.set_facecolor(self._chassis_facecolors)
+        self.chassis.set_edgecolor(self._chassis_edgecolors)
+        self.chassis.set_linewidth(self._chassis_linewidths)
+
+    def set_head_marker(self, robot_id, size, facecolor, edgecolor):
+        """
+        Replaces the left LED of a robot with a filled head marker.
+
+        Parameters:
+        - robot_id: The identifier of the robot.
+        - size: Radius of the head marker (m).
+        - facecolor: Fill color of the head marker.
+        - edgecolor: Outline color of the head marker.
+        """
+        i = self.number_of_robots + robot_id
+        self._led_widths[i] = 2*size
+        self._led_facecolors[i] = to_rgba(facecolor)
+        self._led_edgecolors[i] = to_rgba(edgecolor)
+
+        self.leds.set_widths(self._led_widths)
+        self.leds.set_heights(self._led_widths)
+        self.leds.set_facecolor(self._led_facecolors)
+        self.leds.set_edgecolor(self._led_edgecolors)
+
+
+class SwarmRenderer:
+    """
+    Draws every robot as a filled disc with a heading dot.  Meant for large swarm
+    simulations with hundreds or thousands of robots, where the detailed robot drawing
+    is too small to read and too slow to redraw.
+
+    A redraw only moves the disc and dot centers of the two collections.
+    """
+
+    def __init__(self, axes, number_of_robots, robot_diameter=0.11, robot_color='#FFD700'):
+        """
+        Parameters:
+        - axes: Matplotlib axes the robots are drawn on.
+        - number_of_robots: Number of robots to draw.
+        - robot_diameter: Diameter of the disc drawn for every robot (m).
+        - robot_color: Initial fill color of every disc.
+        """
+        N = number_of_robots
+
+        self.axes = axes
+        self.number_of_robots = N
+
+        # The heading dot sits just inside the front of the disc.
+        self._head_distance = 0.3*robot_diameter
+        self._body_offsets = np.zeros((N, 2))
+        self._head_offsets = np.zeros((N, 2))
+
+        # Per-robot style state
+        self._body_facecolors = np.tile(to_rgba(robot_color), (N, 1))
+        self._body_edgecolors = np.tile(to_rgba('k'), (N, 1))
+        self._body_linewidths = np.full(N, 0.5)
+        self._head_widths = np.full(N, 0.25*robot_diameter)
+        self._head_facecolors = np.tile(to_rgba('k'), (N, 1))
+
+        self.bodies = EllipseCollection(np.full(N, robot_diameter), np.full(N, robot_diameter), np.zeros(N), units='xy',
+                                        offsets=self._body_offsets, offset_transform=axes.transData,
+                                        facecolors=self._body_facecolors, edgecolors=self._body_edgecolors,
+                                        linewidths=self._body_linewidths, zorder=2)
+        self.heads = EllipseCollection(self._head_widths, self._head_widths, np.zeros(N), units='xy',
+                                       offsets=self._head_offsets, offset_transform=axes.transData,
+                                       facecolors=self._head_facecolors, edgecolors='none', zorder=2)
+
+        axes.add_collection(self.bodies, autolim=False)
+        axes.add_collection(self.heads, autolim=False)
+
+    def update(self, poses):
+        """
+        Moves every robot to the given poses.
+
+        Parameters:
+        - poses: 3xN numpy array of robot poses.
+        """
+        self._body_offsets[:, 0] = poses[0, :]
+        self._body_offsets[:, 1] = poses[1, :]
+        np.cos(poses[2, :], out=self._head_offsets[:, 0])
+        np.sin(poses[2, :], out=self._head_offsets[:, 1])
+        self._head_offsets *= self._head_distance
+        self._head_offsets += self._body_offsets
+
+        self.bodies.set_offsets(self._body_offsets)
+        self.heads.set_offsets(self._head_offsets)
+
+    def set_chassis_style(self, robot_ids, facecolor=None, edgecolor=None, alpha=None, linewidth=None):
+        """
+        Changes the appearance of the disc of one or more robots.
+
+        Parameters:
+        - robot_ids: Robot index or array of robot indices.
+        - facecolor: Fill color of the disc.
+        - edgecolor: Outline color of the disc.
+        - alpha: Transparency applied to both the fill and the outline.
+        - linewidth: Outline thickness.
+        """
+        if facecolor is not None:
+            self._body_facecolors[robot_ids, :3] = to_rgba(facecolor)[:3]
+        if edgecolor is not None:
+            self._body_edgecolors[robot_ids, :3] = to_rgba(edgecolor)[:3]
+        if alpha is not None:
+            self._body_facecolors[robot_ids, 3] = alpha
+            self._body_edgecolors[robot_ids, 3] = alpha
+        if linewidth is not None:
+            self._body_linewidths[robot_ids] = linewidth
+
+        self.bodies.set_facecolor(self._body_facecolors)
+        self.bodies.set_edgecolor(self._body_edgecolors)
+        self.bodies.set_linewidth(self._body_linewidths)
+
+    def set_head_marker(self, robot_id, size, facecolor, edgecolor):
+        """
+        Changes the heading dot of a robot.  The outline color is ignored, heading dots
+        are drawn without an outline.
+
+        Parameters:
+        - robot_id: The identifier of the robot.
+        - size: Radius of the heading dot (m).
+        - facecolor: Fill color of the heading dot.
+        - edgecolor: Unused, kept for compatibility with RobotRenderer.set_head_marker.
+        """
+        self._head_widths[robot_id] = 2*size
+        self._head_facecolors[robot_id] = to_rgba(facecolor)
+
+        self.heads.set_widths(self._head_widths)
+        self.heads.set_heights(self._head_widths)
+        self.heads.set_facecolor(self._head_facecolors)
+
+
+def _body_to_world(x, y, c, s, local, out):
+    """Rotates body frame (forward, left) points by the robot headings and translates them
+    onto the robot positions.  All arguments must broadcast against out[..., 0]."""
+    np.multiply(c, local[..., 0], out=out[..., 0])
+    out[..., 0] -= s*local[..., 1]
+    out[..., 0] += x
+    np.multiply(s, local[..., 0], out=out[..., 1])
+    out[..., 1] += c*local[..., 1]
+    out[..., 1] += y
+    return out
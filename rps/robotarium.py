@@ -2,10 +2,9 @@ import math
 import time
 
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 from rps.robotarium_abc import *
 from rps.robot_configuration import RobotConfigurator
+from rps.real_time_pacer import RealTimePacer
 
 # Robotarium This object provides routines to interface with the Robotarium.
 #
@@ -13,22 +12,20 @@ from rps.robot_configuration import RobotConfigurator
 
 class Robotarium(RobotariumABC):
 
-        def __init__(self, number_of_robots=-1, show_figure=True, sim_in_real_time = True, initial_conditions=np.array([])):
-            super().__init__(number_of_robots, show_figure, sim_in_real_time, initial_conditions)
+        def __init__(self, number_of_robots=-1, show_figure=True, sim_in_real_time = True, initial_conditions=np.array([]), large_swarm=False):
+            super().__init__(number_of_robots, show_figure, sim_in_real_time, initial_conditions, large_swarm)
             # Initialize RobotConfigurator for robot visualization control
             self.configurator = RobotConfigurator(self)
            
             #Initialize some rendering variables
-            self.previous_render_time = time.time()
             self.sim_in_real_time = sim_in_real_time
+            self.pacer = RealTimePacer(self.time_step)
+            self.set_render_policy()
 
             #Initialize checks for step and get poses calls
             self._called_step_already = True
             self._checked_poses_already = False
 
-            #Initialization of error collection.
-            self._errors = {}
-
             #Initialize steps
             self._iterations = 0 
             # Grid properties
@@ -41,6 +38,9 @@ class Robotarium(RobotariumABC):
             self.grid_added = True
             self.cell_width = cell_width
             self.cell_height = cell_height
+            if self.axes is None:
+                # Headless simulation, there is no background to draw on.
+                return
             print("Adding grid to world background...")
 
 
@@ -79,6 +79,58 @@ class Robotarium(RobotariumABC):
             print(f"Added a dynamic grid with {num_cols} columns and {num_rows} rows based on cell size {cell_size}.")
 
 
+        def set_integrator(self, integrator='euler', substeps=1, time_step=None):
+            """See RobotariumABC.set_integrator.  Real time pacing follows the new time step."""
+            super().set_integrator(integrator, substeps, time_step)
+            self.pacer = RealTimePacer(self.time_step)
+
+        def set_render_policy(self, policy='every_step', every_k_steps=1, target_fps=30):
+            """Chooses how often step() redraws the figure.  Rendering is the most expensive
+            part of a step, so rendering less often lets the physics run faster.
+
+            policy: string ('every_step' redraws on every call of step(),
+                            'every_k_steps' redraws on every every_k_steps-th call of step(),
+                            'target_fps' redraws at most target_fps times per wall clock second,
+                            'on_demand' only redraws when render() is called)
+            every_k_steps: int (number of steps between redraws for the 'every_k_steps' policy)
+            target_fps: double (redraw rate for the 'target_fps' policy)
+            """
+
+            #Check user input types
+            assert policy in ('every_step', 'every_k_steps', 'target_fps', 'on_demand'), "The render policy (policy) must be one of 'every_step', 'every_k_steps', 'target_fps' or 'on_demand'. Recieved %r." % policy
+            assert isinstance(every_k_steps, int), "The number of steps between redraws (every_k_steps) must be an integer. Recieved type %r." % type(every_k_steps).__name__
+            assert isinstance(target_fps, (int, float)), "The target redraw rate (target_fps) must be an integer or float. Recieved type %r." % type(target_fps).__name__
+
+            #Check user input ranges/sizes
+            assert every_k_steps > 0, "The number of steps between redraws (every_k_steps) must be positive. Recieved %r." % every_k_steps
+            assert target_fps > 0, "The target redraw rate (target_fps) must be positive. Recieved %r." % target_fps
+
+            self.render_policy = policy
+            self.render_every_k_steps = every_k_steps
+            self.render_period = 1/target_fps
+            self._previous_render_time = -math.inf
+
+        def render(self):
+            """Redraws the robots at their current poses.  Does nothing for headless simulations."""
+            if self.renderer is None:
+                return
+
+            self.renderer.update(self.poses)
+
+            self.figure.canvas.draw_idle()
+            self.figure.canvas.flush_events()
+
+            self._previous_render_time = time.monotonic()
+
+        def _render_due(self):
+            if self.render_policy == 'every_step':
+                return True
+            if self.render_policy == 'every_k_steps':
+                return self._iterations % self.render_every_k_steps == 0
+            if self.render_policy == 'target_fps':
+                return time.monotonic() - self._previous_render_time >= self.render_period
+            return False
+
         def get_poses(self):
             """Returns the states of the agents.
 
@@ -100,18 +152,22 @@ class Robotarium(RobotariumABC):
             print('##### DEBUG OUTPUT #####')
             print('Your simulation will take approximately {0} real seconds when deployed on the Robotarium. \n'.format(math.ceil(self._iterations*self.time_step)))
             # TODO: check collision string and boundary string
-            if bool(self._errors):
-                if "boundary" in self._errors:
-                    boundary_violations = max(self._errors["boundary"].values())
-                    print('\t Simulation had {0} {1}\n'.format(boundary_violations, self._errors["boundary_string"]))
-                if "collision" in self._errors:
-                    collision_violations = max(self._errors["collision"].values())
-                    print('\t Simulation had {0} {1}\n'.format(collision_violations, self._errors["collision_string"]))
-                if "actuator" in self._errors:
-                    print('\t Simulation had {0} {1}'.format(self._errors["actuator"], self._errors["actuator_string"]))
+            errors = self.get_errors()
+            if bool(errors):
+                if "boundary" in errors:
+                    boundary_violations = max(errors["boundary"].values())
+                    print('\t Simulation had {0} {1}\n'.format(boundary_violations, errors["boundary_string"]))
+                if "collision" in errors:
+                    collision_violations = max(errors["collision"].values())
+                    print('\t Simulation had {0} {1}\n'.format(collision_violations, errors["collision_string"]))
+                if "actuator" in errors:
+                    print('\t Simulation had {0} {1}'.format(errors["actuator"], errors["actuator_string"]))
             else:
                 print('No errors in your simulation! Acceptance of your experiment is likely!')
 
+            if self.pacer.late_frames > 0:
+                print('\t Real-time pacing: {0}'.format(self.pacer.summary()))
+
             return
 
         def step(self):
@@ -123,65 +179,76 @@ class Robotarium(RobotariumABC):
             self._called_step_already = True
             self._checked_poses_already = False
 
+            self._advance()
+
+        def run(self, n_steps, controller, record_trajectory=False):
+            """Runs the simulation for a number of steps with a controller in the loop.  This
+            is equivalent to calling get_poses, set_velocities and step n_steps times, with
+            identical error accounting, rendering and real time pacing, but without the per
+            step call overhead.
+
+            n_steps: int (number of steps to run)
+            controller: function (called as controller(poses) with the 3xN poses of the current
+                        step, must return the 2xN unicycle velocities of the robots)
+            record_trajectory: bool (whether to record the poses of every step)
+
+            -> (n_steps+1)x3xN numpy array (the poses before every step and after the last one)
+               if record_trajectory is True, None otherwise
+            """
+
+            #Check user input types
+            assert isinstance(n_steps, int), "The number of steps (n_steps) provided to run must be an integer. Recieved type %r." % type(n_steps).__name__
+            assert callable(controller), "The controller (controller) provided to run must be a function. Recieved type %r." % type(controller).__name__
+            assert isinstance(record_trajectory, bool), "The trajectory recording flag (record_trajectory) provided to run must be boolean type. Recieved type %r." % type(record_trajectory).__name__
+
+            #Check user input ranges/sizes
+            assert n_steps >= 0, "The number of steps (n_steps) provided to run must not be negative. Recieved %r." % n_steps
+
+            trajectory = None
+            if record_trajectory:
+                trajectory = np.empty((n_steps+1, 3, self.number_of_robots))
+
+            shape = (2, self.number_of_robots)
+            for k in range(n_steps):
+                if trajectory is not None:
+                    trajectory[k] = self.poses
+
+                velocities = controller(self.poses)
+                assert velocities.shape == shape, "The controller provided to run must return the 2xN unicycle velocities of the robots. Expected a %r array but recieved a %r array on step %r." % (shape, velocities.shape, k)
+                self.velocities = velocities
+
+                self._advance()
+
+            if trajectory is not None:
+                trajectory[n_steps] = self.poses
+
+            # Leave the handshake as it is after a call of step().
+            self._called_step_already = True
+            self._checked_poses_already = False
+
+            return trajectory
+
+        def _advance(self):
+            # Advances the simulation by one step with the current velocities.  Shared by
+            # step() and run() so both paths account for errors in exactly the same way.
+
             # Validate before thresholding velocities
-            self._errors = self._validate()
+            self._validate()
             self._iterations += 1
 
             #Perform Thresholding of Motors
             self.velocities = self._threshold(self.velocities)
 
             # Update dynamics of agents
-            self.poses[0, :] = self.poses[0, :] + self.time_step*np.cos(self.poses[2,:])*self.velocities[0, :]
-            self.poses[1, :] = self.poses[1, :] + self.time_step*np.sin(self.poses[2,:])*self.velocities[0, :]
-            self.poses[2, :] = self.poses[2, :] + self.time_step*self.velocities[1, :]
+            self._integrate(self.poses, self.velocities, self.time_step)
             # Ensure angles are wrapped
-            self.poses[2, :] = np.arctan2(np.sin(self.poses[2, :]), np.cos(self.poses[2, :]))
+            np.arctan2(np.sin(self.poses[2, :]), np.cos(self.poses[2, :]), out=self.poses[2, :])
 
             # Update graphics
             if(self.show_figure):
                 if(self.sim_in_real_time):
-                    t = time.time()
-                    while(t - self.previous_render_time < self.time_step):
-                        t=time.time()
-                    self.previous_render_time = t
-
-                for i in range(self.number_of_robots):
-                    settings = self.configurator.get_robot_settings(i)
-                    self.chassis_patches[i].xy = self.poses[:2, i]+self.robot_length/2*np.array((np.cos(self.poses[2, i]+math.pi/2), np.sin(self.poses[2, i]+math.pi/2)))+\
-                                            0.04*np.array((-np.sin(self.poses[2, i]+math.pi/2), np.cos(self.poses[2, i]+math.pi/2)))  + self.robot_length/2*np.array((np.cos(self.poses[2, i]), np.sin(self.poses[2, i])))
-                    
-                    self.chassis_patches[i].angle = (self.poses[2, i] - math.pi/2) * 180/math.pi
-
-                    self.chassis_patches[i].zorder = 2
-
-                    self.right_wheel_patches[i].center = self.poses[:2, i]+self.robot_length/2*np.array((np.cos(self.poses[2, i]+math.pi/2), np.sin(self.poses[2, i]+math.pi/2)))+\
-                                            0.04*np.array((-np.sin(self.poses[2, i]+math.pi/2), np.cos(self.poses[2, i]+math.pi/2)))  + self.robot_length/2*np.array((np.cos(self.poses[2, i]), np.sin(self.poses[2, i])))
-                    self.right_wheel_patches[i].orientation = self.poses[2, i] + math.pi/4
-
-                    self.right_wheel_patches[i].zorder = 2
-
-                    self.left_wheel_patches[i].center = self.poses[:2, i]+self.robot_length/2*np.array((np.cos(self.poses[2, i]-math.pi/2), np.sin(self.poses[2, i]-math.pi/2)))+\
-                                            0.04*np.array((-np.sin(self.poses[2, i]+math.pi/2), np.cos(self.poses[2, i]+math.pi/2))) + self.robot_length/2*np.array((np.cos(self.poses[2, i]), np.sin(self.poses[2, i])))
-                    self.left_wheel_patches[i].orientation = self.poses[2,i] + math.pi/4
-
-                    self.left_wheel_patches[i].zorder = 2
-                    #  # Set chassis to green
-                    # self.chassis_patches[i].set_facecolor([0, 1, 0])
-                    # self.chassis_patches[i].set_edgecolor([0, 1, 0])
-
-                    #  # Set LEDs to green as well (if they are currently set to a color)
-                    # self.left_led_patches[i].set_facecolor([0, 1, 0])
-                    # self.right_led_patches[i].set_facecolor([0, 1, 0])
-                    # self.left_led_patches[i].set_edgecolor([0, 1, 0])
-                    # self.right_led_patches[i].set_edgecolor([0, 1, 0])
-                    
-                    self.right_led_patches[i].center = self.poses[:2, i]+0.75*self.robot_length/2*np.array((np.cos(self.poses[2,i]), np.sin(self.poses[2,i])))-\
-                                    0.04*np.array((-np.sin(self.poses[2, i]), np.cos(self.poses[2, i]))) + self.robot_length/2*np.array((np.cos(self.poses[2, i]), np.sin(self.poses[2, i])))
-                    self.left_led_patches[i].center = self.poses[:2, i]+0.75*self.robot_length/2*np.array((np.cos(self.poses[2,i]), np.sin(self.poses[2,i])))-\
-                                    0.015*np.array((-np.sin(self.poses[2, i]), np.cos(self.poses[2, i]))) + self.robot_length/2*np.array((np.cos(self.poses[2, i]), np.sin(self.poses[2, i])))
-                    self.left_led_patches[i].zorder = 2
-                    self.right_led_patches[i].zorder = 2 
-
-                self.figure.canvas.draw_idle()
-                self.figure.canvas.flush_events()
+                    self.pacer.wait()
+
+                if(self._render_due()):
+                    self.render()
 
@@ -3,27 +3,50 @@ import math
 from abc import ABC, abstractmethod
 
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 
 import rps.utilities.misc as misc
+from rps.integrators import INTEGRATORS, create_substep_integrator
+from rps.utilities.spatial import pairs_within
 
 # RobotariumABC: This is an interface for the Robotarium class that
 # ensures the simulator and the robots match up properly.  
 
 # THIS FILE SHOULD NEVER BE MODIFIED OR SUBMITTED!
 
+# Above this many robots, collisions are found with a uniform cell grid instead of
+# checking every pair.
+DENSE_COLLISION_CHECK_MAX_ROBOTS = 100
+
+# Largest number of robots deployed on the real testbed.  Only large swarm
+# simulations may use more.
+MAX_TESTBED_ROBOTS = 50
+
+def arena_scale(number_of_robots, large_swarm):
+    """Returns how much the testbed arena is enlarged.  Large swarms get an arena scaled up to
+    the robot density of a full testbed, all other simulations use the testbed itself.
+
+    number_of_robots: int (number of robots N)
+    large_swarm: bool (whether the simulation is a large swarm simulation)
+
+    -> double (scale factor of the arena, at least 1)
+    """
+    return max(1.0, math.sqrt(number_of_robots/MAX_TESTBED_ROBOTS)) if large_swarm else 1.0
+
 class RobotariumABC(ABC):
 
-    def __init__(self, number_of_robots=-1, show_figure=True, sim_in_real_time=True, initial_conditions=np.array([])):
+    def __init__(self, number_of_robots=-1, show_figure=True, sim_in_real_time=True, initial_conditions=np.array([]), large_swarm=False):
         #Check user input types
         assert isinstance(number_of_robots,int), "The number of robots used argument (number_of_robots) provided to create the Robotarium object must be an integer type. Recieved type %r." % type(number_of_robots).__name__
         assert isinstance(initial_conditions,np.ndarray), "The initial conditions array argument (initial_conditions) provided to create the Robotarium object must be a numpy ndarray. Recieved type %r." % type(initial_conditions).__name__
         assert isinstance(show_figure,bool), "The display figure window argument (show_figure) provided to create the Robotarium object must be boolean type. Recieved type %r." % type(show_figure).__name__
         assert isinstance(sim_in_real_time,bool), "The simulation running at 0.033s per loop (sim_real_time) provided to create the Robotarium object must be boolean type. Recieved type %r." % type(show_figure).__name__
+        assert isinstance(large_swarm,bool), "The large swarm simulation argument (large_swarm) provided to create the Robotarium object must be boolean type. Recieved type %r." % type(large_swarm).__name__
         
         #Check user input ranges/sizes
-        assert (number_of_robots >= 0 and number_of_robots <= 50), "Requested %r robots to be used when creating the Robotarium object. The deployed number of robots must be between 0 and 50." % number_of_robots 
+        if large_swarm:
+            assert number_of_robots >= 0, "Requested %r robots to be used when creating the Robotarium object. The number of robots must not be negative." % number_of_robots
+        else:
+            assert (number_of_robots >= 0 and number_of_robots <= MAX_TESTBED_ROBOTS), "Requested %r robots to be used when creating the Robotarium object. The deployed number of robots must be between 0 and 50. Use large_swarm=True to simulate more robots." % number_of_robots 
         if (initial_conditions.size > 0):
             assert initial_conditions.shape == (3, number_of_robots), "Initial conditions provided when creating the Robotarium object must of size 3xN, where N is the number of robots used. Expected a 3 x %r array but recieved a %r x %r array." % (number_of_robots, initial_conditions.shape[0], initial_conditions.shape[1])
 
@@ -32,9 +55,12 @@ class RobotariumABC(ABC):
         self.number_of_robots = number_of_robots
         self.show_figure = show_figure
         self.initial_conditions = initial_conditions
+        self.large_swarm = large_swarm
 
         # Boundary stuff -> lower left point / width / height
-        self.boundaries = [-1.6, -1, 3.2, 2]
+        # Large swarms get an arena scaled up to the robot density of a full testbed.
+        scale = arena_scale(number_of_robots, large_swarm)
+        self.boundaries = [-1.6*scale, -1*scale, 3.2*scale, 2*scale]
 
         self.file_path = None
         self.current_file_size = 0
@@ -55,91 +81,67 @@ class RobotariumABC(ABC):
         self.collision_offset = 0.025 # May want to increase this
         self.collision_diameter = 0.135
 
+        # Forward Euler integration of the unicycle dynamics by default
+        self._integrate = INTEGRATORS['euler']
+
 
-        self.velocities = np.zeros((2, number_of_robots))
         self.poses = self.initial_conditions
         if self.initial_conditions.size == 0:
-            self.poses = misc.generate_initial_conditions(self.number_of_robots, spacing=0.2, width=2.5, height=1.5)
-        
+            self.poses = misc.generate_initial_conditions(self.number_of_robots, spacing=0.2, width=2.5*scale, height=1.5*scale)
+        self._allocate_buffers()
+
         self.left_led_commands = []
         self.right_led_commands = []
 
         # Visualization
-        self.figure = []
-        self.axes = []
-        self.left_led_patches = []
-        self.right_led_patches = []
-        self.chassis_patches = []
-        self.right_wheel_patches = []
-        self.left_wheel_patches = []
-        self.base_patches = []
-
-        self.figure, self.axes = plt.subplots()
+        self.figure = None
+        self.axes = None
+        self.renderer = None
+
         if(self.show_figure):
-            self.axes.set_axis_off()
-            for i in range(number_of_robots):
-                
-                # p = patches.RegularPolygon((self.poses[:2, i]), 4, math.sqrt(2)*self.robot_radius, self.poses[2,i]+math.pi/4, facecolor='#FFD700', edgecolor = 'k')
-                print(f"Setting robot color for robot {i}: facecolor={self.robot_color}")
-
-                p = patches.Rectangle((self.poses[:2, i]+self.robot_length/2*np.array((np.cos(self.poses[2, i]+math.pi/2), np.sin(self.poses[2, i]+math.pi/2)))+\
-                                                0.04*np.array((-np.sin(self.poses[2, i]+math.pi/2), np.cos(self.poses[2, i]+math.pi/2)))), self.robot_length, self.robot_width, angle=(self.poses[2, i] + math.pi/4) * 180/math.pi, facecolor=self.robot_color , edgecolor='k')
-
-                rled = patches.Circle(self.poses[:2, i]+0.75*self.robot_length/2*np.array((np.cos(self.poses[2, i]), np.sin(self.poses[2, i]))+0.04*np.array((-np.sin(self.poses[2, i]+math.pi/2), np.cos(self.poses[2, i]+math.pi/2)))),
-                                       self.robot_length/2/5, fill=False)
-                lled = patches.Circle(self.poses[:2, i]+0.75*self.robot_length/2*np.array((np.cos(self.poses[2, i]), np.sin(self.poses[2, i]))+\
-                                        0.015*np.array((-np.sin(self.poses[2, i]+math.pi/2), np.cos(self.poses[2, i]+math.pi/2)))),\
-                                       self.robot_length/2/5, fill=False)
-                rw = patches.Circle(self.poses[:2, i]+self.robot_length/2*np.array((np.cos(self.poses[2, i]+math.pi/2), np.sin(self.poses[2, i]+math.pi/2)))+\
-                                                0.04*np.array((-np.sin(self.poses[2, i]+math.pi/2), np.cos(self.poses[2, i]+math.pi/2))),\
-                                                0.02, facecolor='k')
-                lw = patches.Circle(self.poses[:2, i]+self.robot_length/2*np.array((np.cos(self.poses[2, i]-math.pi/2), np.sin(self.poses[2, i]-math.pi/2)))+\
-                                                0.04*np.array((-np.sin(self.poses[2, i]+math.pi/2))),\
-                                                0.02, facecolor='k')
-
-                # base = patches.Circle(self.poses[:2, i], self.robot_radius/5, facecolor='r')
-
-                #lw = patches.RegularPolygon(self.poses[:2, i]+self.robot_radius*np.array((np.cos(self.poses[2, i]-math.pi/2), np.sin(self.poses[2, i]-math.pi/2)))+\
-                #                                0.035*np.array((-np.sin(self.poses[2, i]+math.pi/2), np.cos(self.poses[2, i]+math.pi/2))),\
-                #                                4, math.sqrt(2)*0.02, self.poses[2,i]+math.pi/4, facecolor='k')
-
-                self.chassis_patches.append(p)
-                self.left_led_patches.append(lled)
-                self.right_led_patches.append(rled)
-                self.right_wheel_patches.append(rw)
-                self.left_wheel_patches.append(lw)
-                # self.base_patches.append(base)
-
-                self.axes.add_patch(rw)
-                self.axes.add_patch(lw)
-                self.axes.add_patch(p)
-                self.axes.add_patch(lled)
-                self.axes.add_patch(rled)
-                # self.axes.add_patch(base)
-
-            # Draw arena
-            self.boundary_patch = self.axes.add_patch(patches.Rectangle(self.boundaries[:2], self.boundaries[2], self.boundaries[3], fill=False))
-
-            self.axes.set_xlim(self.boundaries[0]-0.1, self.boundaries[0]+self.boundaries[2]+0.1)
-            self.axes.set_ylim(self.boundaries[1]-0.1, self.boundaries[1]+self.boundaries[3]+0.1)
-
-            plt.ion()
-            plt.show()
-
-            plt.subplots_adjust(left=-0.03, right=1.03, bottom=-0.03, top=1.03, wspace=0, hspace=0)
-        else:
-            self.figure.set_visible(False)
-            plt.draw()
+            # Plotting code is only imported when a figure is requested, so headless
+            # runs (show_figure=False) never load matplotlib.
+            from rps.robot_renderer import RobotRenderer, SwarmRenderer, create_robotarium_figure
+
+            self.figure, self.axes = create_robotarium_figure(self.boundaries)
+            if large_swarm:
+                self.renderer = SwarmRenderer(self.axes, number_of_robots, self.robot_diameter, self.robot_color)
+            else:
+                self.renderer = RobotRenderer(self.axes, number_of_robots, self.robot_length, self.robot_width, self.robot_color)
+            self.renderer.update(self.poses)
+
+    def _allocate_buffers(self):
+        # Allocates the velocities, the error tallies and the buffers of _validate.
+        # Subclasses that store their state differently (e.g., several worlds) override this.
+        number_of_robots = self.number_of_robots
+        self.velocities = np.zeros((2, number_of_robots))
+
+        # Error tallies, counted per robot over the whole simulation.
+        self._boundary_errors = np.zeros(number_of_robots, dtype=int)
+        self._collision_errors = np.zeros(number_of_robots, dtype=int)
+        self._actuator_errors = 0
+
+        # Preallocated buffers for _validate
+        self._collision_points = np.zeros((2, number_of_robots))
+        self._outside = np.zeros(number_of_robots, dtype=bool)
+        self._outside_tmp = np.zeros(number_of_robots, dtype=bool)
+        if number_of_robots <= DENSE_COLLISION_CHECK_MAX_ROBOTS:
+            self._pairs_i, self._pairs_j = np.triu_indices(number_of_robots, 1)
+            self._pair_diffs = np.zeros((2, self._pairs_i.size))
+            self._pair_diffs_tmp = np.zeros((2, self._pairs_i.size))
+            self._pair_distances = np.zeros(self._pairs_i.size)
+            self._pair_collided = np.zeros(self._pairs_i.size, dtype=bool)
 
     def set_robot_color(self, color):
         """Sets the face color of the robots dynamically."""
         print("Changing robot color to:", color)
         self.robot_color = color
-        
-        # Apply color to all existing robot chassis patches
-        for i, chassis in enumerate(self.chassis_patches):
-            chassis.set_facecolor(self.robot_color)
-            print(f"Updated color for robot {i}: facecolor={self.robot_color}")
+
+        if self.renderer is None:
+            return
+
+        # Apply color to all existing robot chassis
+        self.renderer.set_chassis_style(slice(None), facecolor=self.robot_color)
 
         # Redraw the canvas to immediately apply the color changes
         self.figure.canvas.draw_idle()
@@ -149,6 +151,29 @@ class RobotariumABC(ABC):
     def set_velocities(self, ids, velocities):
         self.velocities = velocities
 
+    def set_integrator(self, integrator='euler', substeps=1, time_step=None):
+        """Selects how the unicycle dynamics are integrated on every step.  The exact
+        integrator and sub-stepping keep the error bounded for time steps that are much
+        larger than the default 0.033s, which makes long offline evaluations faster.
+
+        integrator: string ('euler' for forward Euler, 'exact' for exact constant velocity arcs)
+        substeps: int (number of equal sub-steps each step is split into)
+        time_step: double (new length of one step in seconds, unchanged if None)
+        """
+
+        #Check user input types
+        assert integrator in INTEGRATORS, "The integrator (integrator) must be one of %r. Recieved %r." % (sorted(INTEGRATORS), integrator)
+        assert isinstance(substeps, int), "The number of sub-steps (substeps) must be an integer. Recieved type %r." % type(substeps).__name__
+        assert time_step is None or isinstance(time_step, (int, float)), "The time step (time_step) must be an integer or float. Recieved type %r." % type(time_step).__name__
+
+        #Check user input ranges/sizes
+        assert substeps > 0, "The number of sub-steps (substeps) must be positive. Recieved %r." % substeps
+        assert time_step is None or time_step > 0, "The time step (time_step) must be positive. Recieved %r." % time_step
+
+        self._integrate = create_substep_integrator(INTEGRATORS[integrator], substeps)
+        if time_step is not None:
+            self.time_step = time_step
+
     @abstractmethod
     def get_poses(self):
         raise NotImplementedError()
@@ -158,6 +183,8 @@ class RobotariumABC(ABC):
         raise NotImplementedError()
 
     #Protected Functions
+    # The unicycle/differential drive conversions operate on the last two axes, so they
+    # accept both 2xN arrays and stacks of them (e.g., Mx2xN for ensembles).
     def _threshold(self, dxu):
         dxdd = self._uni_to_diff(dxu)
 
@@ -170,71 +197,85 @@ class RobotariumABC(ABC):
     def _uni_to_diff(self, dxu):
         r = self.wheel_radius
         l = self.base_length
-        dxdd = np.vstack((1/(2*r)*(2*dxu[0,:]-l*dxu[1,:]),1/(2*r)*(2*dxu[0,:]+l*dxu[1,:])))
+        dxdd = np.stack((1/(2*r)*(2*dxu[...,0,:]-l*dxu[...,1,:]),1/(2*r)*(2*dxu[...,0,:]+l*dxu[...,1,:])), axis=-2)
 
         return dxdd
 
     def _diff_to_uni(self, dxdd):
         r = self.wheel_radius
         l = self.base_length
-        dxu = np.vstack((r/(2)*(dxdd[0,:]+dxdd[1,:]),r/l*(dxdd[1,:]-dxdd[0,:])))
+        dxu = np.stack((r/(2)*(dxdd[...,0,:]+dxdd[...,1,:]),r/l*(dxdd[...,1,:]-dxdd[...,0,:])), axis=-2)
 
         return dxu
 
-    def _validate(self, errors = {}):
+    def _validate(self):
         # This is meant to be called on every iteration of step.
-        # Checks to make sure robots are operating within the bounds of reality.
+        # Checks to make sure robots are operating within the bounds of reality and
+        # adds any violations to the error tallies.
 
         p = self.poses
         b = self.boundaries
         N = self.number_of_robots
 
-        for i in range(N):
-            x = p[0,i]
-            y = p[1,i]
-
-            if(x < b[0] or x > (b[0] + b[2]) or y < b[1] or y > (b[1] + b[3])):
-                    if "boundary" in errors:
-                        if i in errors["boundary"]:
-                            errors["boundary"][i] += 1
-                        else:
-                            errors["boundary"][i] = 1
-                            
-                    else:
-                        errors["boundary"] = {i: 1}
-                        errors["boundary_string"] = "iteration(s) robots were outside the boundaries."
-
-        for j in range(N-1):
-            for k in range(j+1,N):
-                first_position = p[:2, j] + self.collision_offset*np.array([np.cos(p[2,j]), np.sin(p[2, j])])
-                second_position = p[:2, k] + self.collision_offset*np.array([np.cos(p[2,k]), np.sin(p[2, k])])
-                if(np.linalg.norm(first_position - second_position) <= (self.collision_diameter)):
-                # if (np.linalg.norm(p[:2,j]-p[:2,k]) <= self.robot_diameter):
-                    if "collision" in errors:
-                        if j in errors["collision"]:
-                            errors["collision"][j] += 1
-                        else:
-                            errors["collision"][j] = 1
-                        # if k == N:
-                        if k in errors["collision"]:
-                            errors["collision"][k] += 1
-                        else:
-                            errors["collision"][k] = 1
-                    else:
-                        errors["collision"]= {j: 1}
-                        errors["collision"][k] = 1
-                        # if k == N:
-
-                        errors["collision_string"] = "iteration(s) where robots collided."
+        # Boundary
+        outside = np.less(p[0, :], b[0], out=self._outside)
+        outside |= np.greater(p[0, :], b[0] + b[2], out=self._outside_tmp)
+        outside |= np.less(p[1, :], b[1], out=self._outside_tmp)
+        outside |= np.greater(p[1, :], b[1] + b[3], out=self._outside_tmp)
+        self._boundary_errors += outside
+
+        # Collisions between the offset collision circles of every pair of robots
+        points = self._collision_points
+        np.cos(p[2, :], out=points[0, :])
+        np.sin(p[2, :], out=points[1, :])
+        points *= self.collision_offset
+        points += p[:2, :]
+
+        if N <= DENSE_COLLISION_CHECK_MAX_ROBOTS:
+            diffs = np.take(points, self._pairs_i, axis=1, out=self._pair_diffs)
+            diffs -= np.take(points, self._pairs_j, axis=1, out=self._pair_diffs_tmp)
+            diffs *= diffs
+            distances = np.add(diffs[0, :], diffs[1, :], out=self._pair_distances)
+            collided = np.less_equal(distances, self.collision_diameter**2, out=self._pair_collided)
+            if collided.any():
+                np.add.at(self._collision_errors, self._pairs_i[collided], 1)
+                np.add.at(self._collision_errors, self._pairs_j[collided], 1)
+        else:
+            i, j = pairs_within(points, self.collision_diameter)
+            np.add.at(self._collision_errors, i, 1)
+            np.add.at(self._collision_errors, j, 1)
 
+        # Actuator limits
         dxdd = self._uni_to_diff(self.velocities)
-        exceeding = np.absolute(dxdd) > self.max_wheel_velocity
-        if(np.any(exceeding)):
-            if "actuator" in errors:
-                errors["actuator"] += 1
-            else:
-                errors["actuator"] = 1
-                errors["actuator_string"] = "iteration(s) where the actuator limits of at least one robot were exceeded and thresholded to their maximum rotational velocity."
+        if(np.any(np.absolute(dxdd) > self.max_wheel_velocity)):
+            self._actuator_errors += 1
+
+    def get_errors(self):
+        """Returns the error tallies in the format reported by call_at_scripts_end."""
+        return errors_from_tallies(self._boundary_errors, self._collision_errors, self._actuator_errors)
+
+
+def errors_from_tallies(boundary_errors, collision_errors, actuator_errors):
+    """Builds the error dictionary reported at the end of a simulation from error tallies.
+
+    boundary_errors: length N integer numpy array (iterations each robot spent outside the boundaries)
+    collision_errors: length N integer numpy array (collisions each robot took part in)
+    actuator_errors: int (iterations where an actuator limit was exceeded)
+
+    -> dictionary (only contains the error types that occurred, and only the robots that caused them)
+    """
+    errors = {}
+
+    if boundary_errors.any():
+        errors["boundary"] = {int(i): int(boundary_errors[i]) for i in np.flatnonzero(boundary_errors)}
+        errors["boundary_string"] = "iteration(s) robots were outside the boundaries."
+
+    if collision_errors.any():
+        errors["collision"] = {int(i): int(collision_errors[i]) for i in np.flatnonzero(collision_errors)}
+        errors["collision_string"] = "iteration(s) where robots collided."
 
-        return errors
+    if actuator_errors > 0:
+        errors["actuator"] = int(actuator_errors)
+        errors["actuator_string"] = "iteration(s) where the actuator limits of at least one robot were exceeded and thresholded to their maximum rotational velocity."
 
+    return errors
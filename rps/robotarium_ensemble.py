@@ -0,0 +1,160 @@
+import math
+
+import numpy as np
+from rps.robotarium_abc import *
+
+# RobotariumEnsemble: Steps M independent, headless Robotarium worlds with the
+# same number of robots at once.  Poses are stored as one Mx3xN array, and
+# thresholding, integration, angle wrapping and validation are applied to all
+# worlds in single vectorized operations.
+
+class RobotariumEnsemble(RobotariumABC):
+
+        def __init__(self, number_of_worlds=1, number_of_robots=-1, initial_conditions=np.array([]), large_swarm=False):
+            #Check user input types
+            assert isinstance(number_of_worlds, int), "The number of worlds (number_of_worlds) provided to create the RobotariumEnsemble object must be an integer type. Recieved type %r." % type(number_of_worlds).__name__
+            assert isinstance(number_of_robots, int), "The number of robots (number_of_robots) provided to create the RobotariumEnsemble object must be an integer type. Recieved type %r." % type(number_of_robots).__name__
+            assert isinstance(initial_conditions, np.ndarray), "The initial conditions array argument (initial_conditions) provided to create the RobotariumEnsemble object must be a numpy ndarray. Recieved type %r." % type(initial_conditions).__name__
+            assert isinstance(large_swarm, bool), "The large swarm simulation argument (large_swarm) provided to create the RobotariumEnsemble object must be boolean type. Recieved type %r." % type(large_swarm).__name__
+
+            #Check user input ranges/sizes
+            assert number_of_worlds > 0, "The number of worlds (number_of_worlds) provided to create the RobotariumEnsemble object must be positive. Recieved %r." % number_of_worlds
+            assert number_of_robots > 0, "The number of robots (number_of_robots) provided to create the RobotariumEnsemble object must be positive. Recieved %r." % number_of_robots
+            assert large_swarm or number_of_robots <= MAX_TESTBED_ROBOTS, "Requested %r robots per world when creating the RobotariumEnsemble object. The deployed number of robots must be at most %r. Use large_swarm=True to simulate more robots." % (number_of_robots, MAX_TESTBED_ROBOTS)
+            if (initial_conditions.size > 0):
+                assert initial_conditions.shape == (number_of_worlds, 3, number_of_robots), "Initial conditions provided when creating the RobotariumEnsemble object must be of size Mx3xN, where M is the number of worlds and N is the number of robots used. Expected a %r x 3 x %r array but recieved a %r array." % (number_of_worlds, number_of_robots, initial_conditions.shape)
+
+            M = number_of_worlds
+            N = number_of_robots
+            self.number_of_worlds = M
+
+            # The poses of all worlds are generated here, the base class gets those of world 0
+            # so that it does not generate poses of its own.
+            if initial_conditions.size > 0:
+                poses = np.array(initial_conditions, dtype=float)
+            else:
+                scale = arena_scale(N, large_swarm)
+                poses = np.stack([misc.generate_initial_conditions(N, spacing=0.2, width=2.5*scale, height=1.5*scale) for _ in range(M)])
+
+            super().__init__(N, False, False, poses[0], large_swarm)
+
+            self.poses = poses
+            self.initial_conditions = initial_conditions
+
+            #Initialize checks for step and get poses calls
+            self._called_step_already = True
+            self._checked_poses_already = False
+
+            #Initialize steps
+            self._iterations = 0
+
+        def _allocate_buffers(self):
+            # Replaces the single world buffers of RobotariumABC with per-world ones.
+            M = self.number_of_worlds
+            N = self.number_of_robots
+            self.velocities = np.zeros((M, 2, N))
+
+            # Error tallies, one row per world.
+            self._boundary_errors = np.zeros((M, N), dtype=int)
+            self._collision_errors = np.zeros((M, N), dtype=int)
+            self._actuator_errors = np.zeros(M, dtype=int)
+
+            # Every world is checked with the dense pair list, or all worlds share one cell grid.
+            if N <= DENSE_COLLISION_CHECK_MAX_ROBOTS:
+                self._pairs_i, self._pairs_j = np.triu_indices(N, 1)
+            else:
+                self._worlds = np.repeat(np.arange(M), N)
+
+        def get_poses(self):
+            """Returns the states of the agents in every world.
+
+            -> Mx3xN numpy array (of robot poses)
+            """
+
+            assert(not self._checked_poses_already), "Can only call get_poses() once per call of step()."
+            # Allow step() to be called again.
+            self._called_step_already = False
+            self._checked_poses_already = True
+
+            return self.poses
+
+        def set_velocities(self, ids, velocities):
+            """Sets the unicycle velocities of the agents in every world.
+
+            ids: unused, kept for compatibility with Robotarium.set_velocities
+            velocities: Mx2xN numpy array (of unicycle velocity commands)
+            """
+            assert velocities.shape == self.velocities.shape, "The velocities provided to the RobotariumEnsemble object must be of size Mx2xN. Expected a %r array but recieved a %r array." % (self.velocities.shape, velocities.shape)
+            self.velocities = velocities
+
+        def get_errors(self):
+            """Returns the errors of every world, in the format reported by call_at_scripts_end.
+
+            -> list of M dictionaries
+            """
+            return [errors_from_tallies(self._boundary_errors[k], self._collision_errors[k], self._actuator_errors[k]) for k in range(self.number_of_worlds)]
+
+        def call_at_scripts_end(self):
+            """Prints the errors of every world, in the same format as Robotarium.call_at_scripts_end."""
+            print('##### DEBUG OUTPUT #####')
+            print('Each simulation will take approximately {0} real seconds when deployed on the Robotarium. \n'.format(math.ceil(self._iterations*self.time_step)))
+            for k, errors in enumerate(self.get_errors()):
+                if bool(errors):
+                    print('World {0}:'.format(k))
+                    if "boundary" in errors:
+                        print('\t Simulation had {0} {1}'.format(max(errors["boundary"].values()), errors["boundary_string"]))
+                    if "collision" in errors:
+                        print('\t Simulation had {0} {1}'.format(max(errors["collision"].values()), errors["collision_string"]))
+                    if "actuator" in errors:
+                        print('\t Simulation had {0} {1}'.format(errors["actuator"], errors["actuator_string"]))
+                else:
+                    print('World {0}: No errors in your simulation!'.format(k))
+
+        def step(self):
+            """Increments every simulation by updating the dynamics.
+            """
+            assert(not self._called_step_already), "Make sure to call get_poses before calling step() again."
+
+            # Allow get_poses function to be called again.
+            self._called_step_already = True
+            self._checked_poses_already = False
+
+            # Validate before thresholding velocities
+            self._validate()
+            self._iterations += 1
+
+            #Perform Thresholding of Motors
+            self.velocities = self._threshold(self.velocities)
+
+            # Update dynamics of agents
+            self._integrate(self.poses, self.velocities, self.time_step)
+            # Ensure angles are wrapped
+            self.poses[:, 2, :] = np.arctan2(np.sin(self.poses[:, 2, :]), np.cos(self.poses[:, 2, :]))
+
+        def _validate(self):
+            # Batched version of RobotariumABC._validate, adds violations to the per-world tallies.
+
+            p = self.poses
+            b = self.boundaries
+            N = self.number_of_robots
+
+            # Boundary
+            outside = (p[:, 0, :] < b[0]) | (p[:, 0, :] > (b[0] + b[2])) | (p[:, 1, :] < b[1]) | (p[:, 1, :] > (b[1] + b[3]))
+            self._boundary_errors += outside
+
+            # Collisions
+            points = p[:, :2, :] + self.collision_offset*np.stack((np.cos(p[:, 2, :]), np.sin(p[:, 2, :])), axis=1)
+            if N <= DENSE_COLLISION_CHECK_MAX_ROBOTS:
+                diffs = points[:, :, self._pairs_i] - points[:, :, self._pairs_j]
+                worlds, pairs = np.nonzero(np.sum(diffs*diffs, axis=1) <= self.collision_diameter**2)
+                np.add.at(self._collision_errors, (worlds, self._pairs_i[pairs]), 1)
+                np.add.at(self._collision_errors, (worlds, self._pairs_j[pairs]), 1)
+            else:
+                # Flatten all worlds into one point set; the world index keeps them apart.
+                i, j = pairs_within(np.reshape(np.moveaxis(points, 1, 0), (2, -1)), self.collision_diameter, groups=self._worlds)
+                np.add.at(self._collision_errors, (i // N, i % N), 1)
+                np.add.at(self._collision_errors, (j // N, j % N), 1)
+
+            # Actuator limits
+            dxdd = self._uni_to_diff(self.velocities)
+            self._actuator_errors += np.any(np.absolute(dxdd) > self.max_wheel_velocity, axis=(1, 2))
@@ -1,31 +1,309 @@
-from cvxopt import matrix
-from cvxopt.blas import dot
-from cvxopt.solvers import qp, options
-from cvxopt import matrix, sparse
-
-# Unused for now, will include later for speed.
-# import quadprog as solver2
-
 import itertools
+import os
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import numpy as np
-from scipy.special import comb
+from scipy.sparse import coo_matrix, csr_matrix, identity
 
+from rps.utilities.qp_solvers import ActiveSetQPSolver, BatchedActiveSetQPSolver, create_qp_solver
+from rps.utilities.spatial import ObstacleIndex, pairs_within
+from rps.utilities.telemetry import BarrierTelemetry
 from rps.utilities.transformations import *
 
-# Disable output of CVXOPT
-options['show_progress'] = False
-# Change default options of CVXOPT for faster solving
-options['reltol'] = 1e-2 # was e-2
-options['feastol'] = 1e-2 # was e-4
-options['maxiters'] = 50 # default is 100
+class _PairwiseBarrierConstraints:
+    """Constraints of a single-integrator barrier certificate QP for a fixed number of
+    robots.  Row k < number_of_pairs constrains the pair (i[k], j[k]).  With a boundary,
+    the pair rows are followed by 4 rows per robot (+y, -y, +x, -x).
+
+    Without an interaction radius every pair of np.triu_indices gets a row, in the same
+    order as nested pair loops.  A is then a preallocated dense array of which only the
+    nonzero entries are rewritten on every update.
+
+    With an interaction radius only the pairs closer than it (found with a spatial grid)
+    get a row, and A is a scipy.sparse COO matrix rebuilt on every update, so the QP
+    grows with the number of nearby pairs instead of N^2.
+    """
+
+    def __init__(self, number_of_robots, boundary=False, interaction_radius=None):
+        N = number_of_robots
+        self.number_of_robots = N
+        self.boundary = boundary
+        self.interaction_radius = interaction_radius
+        self.H = 2*identity(2*N, format='csr')
+
+        # Constant boundary rows (relative to the first boundary row), columns and values
+        robots = np.arange(N)
+        self._boundary_rows = np.concatenate((4*robots, 4*robots+1, 4*robots+2, 4*robots+3))
+        self._boundary_cols = np.concatenate((2*robots+1, 2*robots+1, 2*robots, 2*robots))
+        self._boundary_values = np.repeat([1.0, -1.0, 1.0, -1.0], N)
+
+        if interaction_radius is None:
+            self._allocate(*np.triu_indices(N, 1))
+
+    def _allocate(self, i, j):
+        N = self.number_of_robots
+        self.i = i
+        self.j = j
+        P = i.size
+        self.number_of_pairs = P
+
+        num_constraints = P + 4*N if self.boundary else P
+        self.A = np.zeros((num_constraints, 2*N))
+        self.b = np.zeros(num_constraints)
+
+        # Flat positions of the 4 nonzero entries of every pair row: -2*error at the
+        # columns of robot i and 2*error at the columns of robot j.
+        rows = np.tile(np.arange(P), 4)
+        cols = np.concatenate((2*i, 2*i+1, 2*j, 2*j+1))
+        self._pair_entries = np.ravel_multi_index((rows, cols), self.A.shape)
+        self._pair_values = np.zeros((4, P))
+        self._errors = np.zeros((2, P))
+        self._errors_tmp = np.zeros((2, P))
+        self.h = np.zeros(P)
+
+        if self.boundary:
+            self.A[P + self._boundary_rows, self._boundary_cols] = self._boundary_values
+
+    def update_pairs(self, x, safety_radius):
+        # Writes the pair rows of A for the positions x and returns the barrier value h
+        # of every pair.  The caller fills the pair entries of b from h.
+        if self.interaction_radius is not None:
+            return self._update_nearby_pairs(x, safety_radius)
+
+        errors = np.take(x, self.i, axis=1, out=self._errors)
+        errors -= np.take(x, self.j, axis=1, out=self._errors_tmp)
+
+        h = np.multiply(errors[0], errors[0], out=self.h)
+        h += errors[1]*errors[1]
+        h -= safety_radius**2
+
+        np.multiply(errors, -2, out=self._pair_values[:2])
+        np.multiply(errors, 2, out=self._pair_values[2:])
+        np.put(self.A, self._pair_entries, self._pair_values)
+
+        return h
+
+    def _update_nearby_pairs(self, x, safety_radius):
+        N = self.number_of_robots
+        i, j = pairs_within(x, self.interaction_radius)
+        P = i.size
+        self.i = i
+        self.j = j
+        self.number_of_pairs = P
+
+        errors = x[:, i] - x[:, j]
+        h = errors[0]*errors[0] + errors[1]*errors[1] - safety_radius**2
+
+        rows = np.tile(np.arange(P), 4)
+        cols = np.concatenate((2*i, 2*i+1, 2*j, 2*j+1))
+        values = np.concatenate((-2*errors, 2*errors)).ravel()
+        num_constraints = P
+        if self.boundary:
+            rows = np.concatenate((rows, P + self._boundary_rows))
+            cols = np.concatenate((cols, self._boundary_cols))
+            values = np.concatenate((values, self._boundary_values))
+            num_constraints += 4*N
+
+        self.A = coo_matrix((values, (rows, cols)), shape=(num_constraints, 2*N))
+        self.b = np.zeros(num_constraints)
+        self.h = h
+
+        return h
+
+    def update_boundary(self, x, barrier_gain, safety_radius, boundary_points):
+        # Fills the boundary entries of b for the positions x.
+        b = np.reshape(self.b[self.number_of_pairs:], (self.number_of_robots, 4))
+        np.subtract(boundary_points[3] - safety_radius/2, x[1], out=b[:, 0])
+        np.add(-boundary_points[2] - safety_radius/2, x[1], out=b[:, 1])
+        np.subtract(boundary_points[1] - safety_radius/2, x[0], out=b[:, 2])
+        np.add(-boundary_points[0] - safety_radius/2, x[0], out=b[:, 3])
+        np.power(b, 3, out=b)
+        b *= 0.4*barrier_gain
+
+class _DifferentialDriveBarrierConstraints:
+    """Constraints A v <= b of a robust differential drive barrier certificate QP over
+    the wheel velocities v = [left_1, right_1, left_2, ...] for a fixed number of robots
+    and of obstacle points.  The rows are, in order: one per pair of robots
+    (np.triu_indices order), one per robot and obstacle point (robot major), with a
+    boundary 4 per robot (+y, -y, +x, -x), and 4 per robot bounding the wheel velocities.
+
+    With obstacle_neighbors, every robot gets rows for its obstacle_neighbors nearest
+    points of an ObstacleIndex within obstacle_range only.  Rows of points that were not
+    found are left empty.
+
+    Every matrix that only depends on the number of robots (H, the wheel rows, the
+    positions of the nonzero entries of A) is built once, and update() writes the state
+    dependent entries of A and b into preallocated buffers.
+    """
 
-def create_single_integrator_barrier_certificate(barrier_gain=100, safety_radius=0.17, magnitude_limit=0.2):
+    def __init__(self, number_of_robots, number_of_obstacles, D, projection_distance, wheel_vel_limit, boundary=False, obstacle_neighbors=None, obstacle_range=np.inf):
+        N = number_of_robots
+        K = number_of_obstacles if obstacle_neighbors is None else obstacle_neighbors
+        self.number_of_robots = N
+        self.number_of_obstacles = K
+        self.obstacle_neighbors = obstacle_neighbors
+        self.obstacle_range = obstacle_range
+        self.boundary = boundary
+        self.projection_distance = projection_distance
+        self.D = D
+
+        # Cost 1/2 v^T H v + f^T v of the distance between the projected point velocities
+        # L v and the nominal ones.  The nominal wheel velocities are inv(D) dxu, so
+        # f = -H inv(D) dxu, computed per robot with the 2x2 block F.
+        L = np.array([[1, 0], [0, projection_distance]]).dot(D)
+        H_block = 2*L.T.dot(L)
+        self.H = np.kron(np.eye(N), H_block)
+        self._F = -np.linalg.inv(D).T.dot(H_block)
+        self._f = np.zeros((N, 2))
+
+        i, j = np.triu_indices(N, 1)
+        P = i.size
+        self.i = i
+        self.j = j
+        self.number_of_pairs = P
+        num_boundary = 4*N if boundary else 0
+        num_constraints = P + N*K + num_boundary + 4*N
+        self.A = np.zeros((num_constraints, 2*N))
+        self.b = np.zeros(num_constraints)
+
+        # Flat positions of the state dependent entries of A, in the order of _values:
+        # 4 per pair row (robot i, then robot j), 2 per obstacle and boundary row.
+        robots = np.arange(N)
+        pair_cols = np.stack((2*i, 2*i+1, 2*j, 2*j+1), axis=1)
+        pair_rows = np.repeat(np.arange(P), 4).reshape(P, 4)
+        obstacle_rows = P + np.arange(N*K).reshape(N, K, 1)
+        boundary_rows = P + N*K + np.arange(num_boundary).reshape(-1, 4, 1)
+        robot_cols = np.stack((2*robots, 2*robots+1), axis=1)[:, np.newaxis, :]
+        self._entries = np.concatenate((
+            np.ravel_multi_index((pair_rows, pair_cols), self.A.shape).ravel(),
+            np.ravel_multi_index(np.broadcast_arrays(obstacle_rows, robot_cols), self.A.shape).ravel(),
+            np.ravel_multi_index(np.broadcast_arrays(boundary_rows, robot_cols[:num_boundary//4]), self.A.shape).ravel()))
+        self._values = np.zeros(self._entries.size)
+        self._pair_values = self._values[:4*P].reshape(P, 4)
+        self._obstacle_values = self._values[4*P:4*P+2*N*K].reshape(N, K, 2)
+        self._boundary_values = self._values[4*P+2*N*K:].reshape(-1, 4, 2)
+        self._pair_b = self.b[:P]
+        self._obstacle_b = self.b[P:P+N*K].reshape(N, K)
+        self._boundary_b = self.b[P+N*K:P+N*K+num_boundary].reshape(-1, 4)
+
+        # Wheel velocity bounds, v <= wheel_vel_limit and -v <= wheel_vel_limit
+        wheel_rows = P + N*K + num_boundary
+        self.A[wheel_rows:wheel_rows+2*N] = np.eye(2*N)
+        self.A[wheel_rows+2*N:] = -np.eye(2*N)
+        self.b[wheel_rows:] = wheel_vel_limit
+
+        # Work buffers
+        self._headings = np.zeros((2, N))
+        self._M = np.zeros((N, 2, 2))
+        self._J = np.zeros((N, 2, 2))
+        self._ps = np.zeros((2, N))
+        self._diffs = np.zeros((2, P))
+        self._diffs_tmp = np.zeros((2, P))
+        self._J_i = np.zeros((P, 2, 2))
+        self._h = np.zeros(P)
+        self._abs_pair_values = np.zeros((P, 4))
+        self._obstacle_diffs = np.zeros((2, N, K))
+        self._obstacle_h = np.zeros((N, K))
+        self._abs_obstacle_values = np.zeros((N, K, 2))
+
+    def update(self, x, obstacles, barrier_gain, safety_radius, disturbance, boundary_points=None):
+        # Writes the state dependent entries of A and b for the poses x.
+        l = self.projection_distance
+        c, s = self._headings
+        np.cos(x[2], out=c)
+        np.sin(x[2], out=s)
+
+        # Projected points and their Jacobians J = M D with respect to the wheel velocities
+        ps = np.multiply(self._headings, l, out=self._ps)
+        ps += x[:2]
+        M = self._M
+        M[:, 0, 0] = c
+        np.multiply(s, -l, out=M[:, 0, 1])
+        M[:, 1, 0] = s
+        np.multiply(c, l, out=M[:, 1, 1])
+        J = np.matmul(M, self.D, out=self._J)
+
+        # Pairs, h = ||p_i - p_j||^2 - safety_radius^2.  The disturbance may push both
+        # wheels of every robot by up to disturbance in either direction, which worsens
+        # h_dot by at most disturbance times the 1-norm of its gradient.
+        diffs = np.take(ps, self.i, axis=1, out=self._diffs)
+        diffs -= np.take(ps, self.j, axis=1, out=self._diffs_tmp)
+        values = self._pair_values
+        np.einsum('ap,pab->pb', diffs, np.take(J, self.i, axis=0, out=self._J_i), out=values[:, :2])
+        values[:, :2] *= -2
+        np.einsum('ap,pab->pb', diffs, np.take(J, self.j, axis=0, out=self._J_i), out=values[:, 2:])
+        values[:, 2:] *= 2
+        self._barrier_bounds(diffs, self._h, values, self._abs_pair_values, self._pair_b, barrier_gain, safety_radius, disturbance)
+
+        # Obstacle points, the same for every robot or the nearest ones of each robot
+        if self.number_of_obstacles > 0:
+            if self.obstacle_neighbors is None:
+                points = obstacles[:, np.newaxis, :]
+            else:
+                points, found = obstacles.nearest(ps, self.obstacle_neighbors, self.obstacle_range)
+            diffs = np.subtract(ps[:, :, np.newaxis], points, out=self._obstacle_diffs)
+            values = self._obstacle_values
+            np.einsum('ank,nab->nkb', diffs, J, out=values)
+            values *= -2
+            self._barrier_bounds(diffs, self._obstacle_h, values, self._abs_obstacle_values, self._obstacle_b, barrier_gain, safety_radius, disturbance)
+            if self.obstacle_neighbors is not None:
+                values[~found] = 0
+                self._obstacle_b[~found] = 1
+
+        if self.boundary:
+            values = self._boundary_values
+            values[:, 0] = J[:, 1]
+            np.negative(J[:, 1], out=values[:, 1])
+            values[:, 2] = J[:, 0]
+            np.negative(J[:, 0], out=values[:, 3])
+
+            b = self._boundary_b
+            np.subtract(boundary_points[3] - safety_radius/2, ps[1], out=b[:, 0])
+            np.add(-boundary_points[2] - safety_radius/2, ps[1], out=b[:, 1])
+            np.subtract(boundary_points[1] - safety_radius/2, ps[0], out=b[:, 2])
+            np.add(-boundary_points[0] - safety_radius/2, ps[0], out=b[:, 3])
+            np.power(b, 3, out=b)
+            b *= 0.4*barrier_gain
+
+        np.put(self.A, self._entries, self._values)
+
+    def _barrier_bounds(self, diffs, h, values, abs_values, b, barrier_gain, safety_radius, disturbance):
+        # b = barrier_gain*h^3 - disturbance*||gradient||_1
+        np.sum(np.square(diffs, out=diffs), axis=0, out=h)
+        h -= safety_radius**2
+        np.power(h, 3, out=h)
+        h *= barrier_gain
+        np.sum(np.absolute(values, out=abs_values).reshape(h.shape + (-1,)), axis=-1, out=b)
+        b *= -disturbance
+        b += h
+
+    def nominal_cost(self, dxu):
+        # Returns f for the nominal unicycle velocities dxu.
+        return np.dot(dxu.T, self._F, out=self._f).ravel()
+
+    def wheel_to_unicycle(self, v):
+        # Converts the QP solution back to 2xN unicycle velocities.
+        return self.D.dot(np.reshape(v, (self.number_of_robots, 2)).T)
+
+def _record_qp(telemetry, qp_solver, assembly_time, conversion_time, num_constraints, deviation):
+    # Records a certificate call that ran qp_solver once.
+    active_set = qp_solver.active_set
+    telemetry.record(assembly_time=assembly_time, solve_time=qp_solver.solve_time, conversion_time=conversion_time, constraints=num_constraints,
+                     active_constraints=np.count_nonzero(active_set) if active_set.dtype == bool else active_set.size,
+                     iterations=qp_solver.iterations, status=qp_solver.status, deviation=np.linalg.norm(deviation))
+
+def create_single_integrator_barrier_certificate(barrier_gain=100, safety_radius=0.17, magnitude_limit=0.2, interaction_radius=None, solver='cvxopt', telemetry=None):
     """Creates a barrier certificate for a single-integrator system.  This function
     returns another function for optimization reasons.
 
     barrier_gain: double (controls how quickly agents can approach each other.  lower = slower)
     safety_radius: double (how far apart the agents will stay)
     magnitude_limit: how fast the robot can move linearly.
+    interaction_radius: double (only robots closer than this are constrained, which keeps the QP small for large swarms.  All pairs are constrained if None)
+    solver: string ('cvxopt', 'quadprog' or 'active_set') or QPSolver (solves the barrier QP, pass a QPSolver to read its statistics)
+    telemetry: BarrierTelemetry (records every call of the certificate, no telemetry if None)
 
     -> function (the barrier certificate function)
     """
@@ -34,13 +312,19 @@ def create_single_integrator_barrier_certificate(barrier_gain=100, safety_radius
     assert isinstance(barrier_gain, (int, float)), "In the function create_single_integrator_barrier_certificate, the barrier gain (barrier_gain) must be an integer or float. Recieved type %r." % type(barrier_gain).__name__
     assert isinstance(safety_radius, (int, float)), "In the function create_single_integrator_barrier_certificate, the safe distance between robots (safety_radius) must be an integer or float. Recieved type %r." % type(safety_radius).__name__
     assert isinstance(magnitude_limit, (int, float)), "In the function create_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be an integer or float. Recieved type %r." % type(magnitude_limit).__name__
+    assert interaction_radius is None or isinstance(interaction_radius, (int, float)), "In the function create_single_integrator_barrier_certificate, the interaction radius (interaction_radius) must be an integer, float or None. Recieved type %r." % type(interaction_radius).__name__
+    assert telemetry is None or isinstance(telemetry, BarrierTelemetry), "In the function create_single_integrator_barrier_certificate, the telemetry (telemetry) must be a BarrierTelemetry or None. Recieved type %r." % type(telemetry).__name__
 
     #Check user input ranges/sizes
     assert barrier_gain > 0, "In the function create_single_integrator_barrier_certificate, the barrier gain (barrier_gain) must be positive. Recieved %r." % barrier_gain
     assert safety_radius >= 0.12, "In the function create_single_integrator_barrier_certificate, the safe distance between robots (safety_radius) must be greater than or equal to the diameter of the robot (0.12m) plus the distance to the look ahead point used in the diffeomorphism if that is being used. Recieved %r." % safety_radius
     assert magnitude_limit > 0, "In the function create_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be positive. Recieved %r." % magnitude_limit
     assert magnitude_limit <= 0.2, "In the function create_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be less than the max speed of the robot (0.2m/s). Recieved %r." % magnitude_limit
+    assert interaction_radius is None or interaction_radius > safety_radius, "In the function create_single_integrator_barrier_certificate, the interaction radius (interaction_radius) must be larger than the safe distance between robots (safety_radius). Recieved %r." % interaction_radius
+
 
+    qp_solver = create_qp_solver(solver)
+    constraints = None
 
     def f(dxi, x):
         #Check user input types
@@ -53,24 +337,16 @@ def create_single_integrator_barrier_certificate(barrier_gain=100, safety_radius
         assert x.shape[1] == dxi.shape[1], "In the function created by the create_single_integrator_barrier_certificate function, the number of robot states (x) must be equal to the number of robot single integrator velocity commands (dxi). Recieved a current robot pose input array (x) of size %r x %r and single integrator velocity array (dxi) of size %r x %r." % (x.shape[0], x.shape[1], dxi.shape[0], dxi.shape[1])
 
         
-        # Initialize some variables for computational savings
+        # Reuse the constraint buffers while the number of robots does not change
+        nonlocal constraints
+        start = time.perf_counter()
         N = dxi.shape[1]
-        num_constraints = int(comb(N, 2))
-        A = np.zeros((num_constraints, 2*N))
-        b = np.zeros(num_constraints)
-        H = sparse(matrix(2*np.identity(2*N)))
-
-        count = 0
-        for i in range(N-1):
-            for j in range(i+1, N):
-                error = x[:, i] - x[:, j]
-                h = (error[0]*error[0] + error[1]*error[1]) - np.power(safety_radius, 2)
-
-                A[count, (2*i, (2*i+1))] = -2*error
-                A[count, (2*j, (2*j+1))] = 2*error
-                b[count] = barrier_gain*np.power(h, 3)
+        if constraints is None or constraints.number_of_robots != N:
+            constraints = _PairwiseBarrierConstraints(N, interaction_radius=interaction_radius)
 
-                count += 1
+        h = constraints.update_pairs(x, safety_radius)
+        np.power(h, 3, out=constraints.b)
+        constraints.b *= barrier_gain
 
         # Threshold control inputs before QP
         norms = np.linalg.norm(dxi, 2, 0)
@@ -78,19 +354,34 @@ def create_single_integrator_barrier_certificate(barrier_gain=100, safety_radius
         dxi[:, idxs_to_normalize] *= magnitude_limit/norms[idxs_to_normalize]
 
         f = -2*np.reshape(dxi, 2*N, order='F')
-        result = qp(H, matrix(f), matrix(A), matrix(b))['x']
+        if constraints.b.size == 0:
+            # No robots are close enough to interact, the thresholded input is safe.
+            if telemetry is not None:
+                telemetry.record(assembly_time=time.perf_counter() - start, status='optimal')
+            return np.copy(dxi)
 
-        return np.reshape(result, (2, -1), order='F')
+        assembly_time = time.perf_counter() - start
+        result = qp_solver.solve(constraints.H, f, constraints.A, constraints.b)
+
+        start = time.perf_counter()
+        dxi_safe = np.reshape(result, (2, -1), order='F')
+        if telemetry is not None:
+            _record_qp(telemetry, qp_solver, assembly_time, time.perf_counter() - start, constraints.b.size, dxi_safe - dxi)
+
+        return dxi_safe
 
     return f
 
-def create_single_integrator_barrier_certificate_with_boundary(barrier_gain=100, safety_radius=0.17, magnitude_limit=0.2, boundary_points = np.array([-1.6, 1.6, -1.0, 1.0])):
+def create_single_integrator_barrier_certificate_with_boundary(barrier_gain=100, safety_radius=0.17, magnitude_limit=0.2, boundary_points = np.array([-1.6, 1.6, -1.0, 1.0]), interaction_radius=None, solver='cvxopt', telemetry=None):
     """Creates a barrier certificate for a single-integrator system with a rectangular boundary included.  This function
     returns another function for optimization reasons.
 
     barrier_gain: double (controls how quickly agents can approach each other.  lower = slower)
     safety_radius: double (how far apart the agents will stay)
     magnitude_limit: how fast the robot can move linearly.
+    interaction_radius: double (only robots closer than this are constrained, which keeps the QP small for large swarms.  All pairs are constrained if None)
+    solver: string ('cvxopt', 'quadprog' or 'active_set') or QPSolver (solves the barrier QP, pass a QPSolver to read its statistics)
+    telemetry: BarrierTelemetry (records every call of the certificate, no telemetry if None)
 
     -> function (the barrier certificate function)
     """
@@ -99,13 +390,19 @@ def create_single_integrator_barrier_certificate_with_boundary(barrier_gain=100,
     assert isinstance(barrier_gain, (int, float)), "In the function create_single_integrator_barrier_certificate, the barrier gain (barrier_gain) must be an integer or float. Recieved type %r." % type(barrier_gain).__name__
     assert isinstance(safety_radius, (int, float)), "In the function create_single_integrator_barrier_certificate, the safe distance between robots (safety_radius) must be an integer or float. Recieved type %r." % type(safety_radius).__name__
     assert isinstance(magnitude_limit, (int, float)), "In the function create_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be an integer or float. Recieved type %r." % type(magnitude_limit).__name__
+    assert interaction_radius is None or isinstance(interaction_radius, (int, float)), "In the function create_single_integrator_barrier_certificate, the interaction radius (interaction_radius) must be an integer, float or None. Recieved type %r." % type(interaction_radius).__name__
+    assert telemetry is None or isinstance(telemetry, BarrierTelemetry), "In the function create_single_integrator_barrier_certificate_with_boundary, the telemetry (telemetry) must be a BarrierTelemetry or None. Recieved type %r." % type(telemetry).__name__
 
     #Check user input ranges/sizes
     assert barrier_gain > 0, "In the function create_single_integrator_barrier_certificate, the barrier gain (barrier_gain) must be positive. Recieved %r." % barrier_gain
     assert safety_radius >= 0.12, "In the function create_single_integrator_barrier_certificate, the safe distance between robots (safety_radius) must be greater than or equal to the diameter of the robot (0.12m) plus the distance to the look ahead point used in the diffeomorphism if that is being used. Recieved %r." % safety_radius
     assert magnitude_limit > 0, "In the function create_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be positive. Recieved %r." % magnitude_limit
     assert magnitude_limit <= 0.2, "In the function create_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be less than the max speed of the robot (0.2m/s). Recieved %r." % magnitude_limit
+    assert interaction_radius is None or interaction_radius > safety_radius, "In the function create_single_integrator_barrier_certificate, the interaction radius (interaction_radius) must be larger than the safe distance between robots (safety_radius). Recieved %r." % interaction_radius
+
 
+    qp_solver = create_qp_solver(solver)
+    constraints = None
 
     def f(dxi, x):
         #Check user input types
@@ -118,62 +415,44 @@ def create_single_integrator_barrier_certificate_with_boundary(barrier_gain=100,
         assert x.shape[1] == dxi.shape[1], "In the function created by the create_single_integrator_barrier_certificate function, the number of robot states (x) must be equal to the number of robot single integrator velocity commands (dxi). Recieved a current robot pose input array (x) of size %r x %r and single integrator velocity array (dxi) of size %r x %r." % (x.shape[0], x.shape[1], dxi.shape[0], dxi.shape[1])
 
         
-        # Initialize some variables for computational savings
+        # Reuse the constraint buffers while the number of robots does not change
+        nonlocal constraints
+        start = time.perf_counter()
         N = dxi.shape[1]
-        num_constraints = int(comb(N, 2)) + 4*N
-        A = np.zeros((num_constraints, 2*N))
-        b = np.zeros(num_constraints)
-        #H = sparse(matrix(2*np.identity(2*N)))
-        H = 2*np.identity(2*N)
-
-        count = 0
-        for i in range(N-1):
-            for j in range(i+1, N):
-                error = x[:, i] - x[:, j]
-                h = (error[0]*error[0] + error[1]*error[1]) - np.power(safety_radius, 2)
-
-                A[count, (2*i, (2*i+1))] = -2*error
-                A[count, (2*j, (2*j+1))] = 2*error
-                b[count] = barrier_gain*np.power(h, 3)
-
-                count += 1
-        
-        for k in range(N):
-            #Pos Y
-            A[count, (2*k, 2*k+1)] = np.array([0,1])
-            b[count] = 0.4*barrier_gain*(boundary_points[3] - safety_radius/2 - x[1,k])**3;
-            count += 1
-
-            #Neg Y
-            A[count, (2*k, 2*k+1)] = -np.array([0,1])
-            b[count] = 0.4*barrier_gain*(-boundary_points[2] - safety_radius/2 + x[1,k])**3;
-            count += 1
-
-            #Pos X
-            A[count, (2*k, 2*k+1)] = np.array([1,0])
-            b[count] = 0.4*barrier_gain*(boundary_points[1] - safety_radius/2 - x[0,k])**3;
-            count += 1
-
-            #Neg X
-            A[count, (2*k, 2*k+1)] = -np.array([1,0])
-            b[count] = 0.4*barrier_gain*(-boundary_points[0] - safety_radius/2 + x[0,k])**3;
-            count += 1
-        
+        if constraints is None or constraints.number_of_robots != N:
+            constraints = _PairwiseBarrierConstraints(N, boundary=True, interaction_radius=interaction_radius)
+
+        h = constraints.update_pairs(x, safety_radius)
+        P = constraints.number_of_pairs
+        np.power(h, 3, out=constraints.b[:P])
+        constraints.b[:P] *= barrier_gain
+        constraints.update_boundary(x, barrier_gain, safety_radius, boundary_points)
+
         # Threshold control inputs before QP
         norms = np.linalg.norm(dxi, 2, 0)
         idxs_to_normalize = (norms > magnitude_limit)
         dxi[:, idxs_to_normalize] *= magnitude_limit/norms[idxs_to_normalize]
 
         f = -2*np.reshape(dxi, (2*N,1), order='F')
-        b = np.reshape(b, (count,1), order='F')
-        result = qp(matrix(H), matrix(f), matrix(A), matrix(b))['x']
-        #result = solver2.solve_qp(H, f, A, b, 0)[0]
+        if constraints.b.size == 0:
+            # No robots are close enough to interact, the thresholded input is safe.
+            if telemetry is not None:
+                telemetry.record(assembly_time=time.perf_counter() - start, status='optimal')
+            return np.copy(dxi)
 
-        return np.reshape(result, (2, N), order='F')
+        assembly_time = time.perf_counter() - start
+        result = qp_solver.solve(constraints.H, f, constraints.A, constraints.b)
+
+        start = time.perf_counter()
+        dxi_safe = np.reshape(result, (2, N), order='F')
+        if telemetry is not None:
+            _record_qp(telemetry, qp_solver, assembly_time, time.perf_counter() - start, constraints.b.size, dxi_safe - dxi)
+
+        return dxi_safe
 
     return f
 
-def create_single_integrator_barrier_certificate2(barrier_gain=100, unsafe_barrier_gain=1e6, safety_radius=0.17, magnitude_limit=0.2):
+def create_single_integrator_barrier_certificate2(barrier_gain=100, unsafe_barrier_gain=1e6, safety_radius=0.17, magnitude_limit=0.2, interaction_radius=None, solver='cvxopt', telemetry=None):
     """Creates a barrier certificate for a single-integrator system.  This function
     returns another function for optimization reasons. This function is different from 
     create_single_integrator_barrier_certificate as it changes the barrier gain to a large
@@ -182,6 +461,9 @@ def create_single_integrator_barrier_certificate2(barrier_gain=100, unsafe_barri
     barrier_gain: double (controls how quickly agents can approach each other.  lower = slower)
     safety_radius: double (how far apart the agents will stay)
     magnitude_limit: how fast the robot can move linearly.
+    interaction_radius: double (only robots closer than this are constrained, which keeps the QP small for large swarms.  All pairs are constrained if None)
+    solver: string ('cvxopt', 'quadprog' or 'active_set') or QPSolver (solves the barrier QP, pass a QPSolver to read its statistics)
+    telemetry: BarrierTelemetry (records every call of the certificate, no telemetry if None)
 
     -> function (the barrier certificate function)
     """
@@ -191,6 +473,8 @@ def create_single_integrator_barrier_certificate2(barrier_gain=100, unsafe_barri
     assert isinstance(unsafe_barrier_gain, (int, float)), "In the function create_single_integrator_barrier_certificate2, the barrier gain if outside the safe set (unsafe_barrier_gain) must be an integer or float. Recieved type %r." % type(unsafe_barrier_gain).__name__
     assert isinstance(safety_radius, (int, float)), "In the function create_single_integrator_barrier_certificate2, the safe distance between robots (safety_radius) must be an integer or float. Recieved type %r." % type(safety_radius).__name__
     assert isinstance(magnitude_limit, (int, float)), "In the function create_single_integrator_barrier_certificate2, the maximum linear velocity of the robot (magnitude_limit) must be an integer or float. Recieved type %r." % type(magnitude_limit).__name__
+    assert interaction_radius is None or isinstance(interaction_radius, (int, float)), "In the function create_single_integrator_barrier_certificate2, the interaction radius (interaction_radius) must be an integer, float or None. Recieved type %r." % type(interaction_radius).__name__
+    assert telemetry is None or isinstance(telemetry, BarrierTelemetry), "In the function create_single_integrator_barrier_certificate2, the telemetry (telemetry) must be a BarrierTelemetry or None. Recieved type %r." % type(telemetry).__name__
 
     #Check user input ranges/sizes
     assert barrier_gain > 0, "In the function create_single_integrator_barrier_certificate2, the barrier gain inside the safe set (barrier_gain) must be positive. Recieved %r." % barrier_gain
@@ -198,7 +482,11 @@ def create_single_integrator_barrier_certificate2(barrier_gain=100, unsafe_barri
     assert safety_radius >= 0.12, "In the function create_single_integrator_barrier_certificate2, the safe distance between robots (safety_radius) must be greater than or equal to the diameter of the robot (0.12m) plus the distance to the look ahead point used in the diffeomorphism if that is being used. Recieved %r." % safety_radius
     assert magnitude_limit > 0, "In the function create_single_integrator_barrier_certificate2, the maximum linear velocity of the robot (magnitude_limit) must be positive. Recieved %r." % magnitude_limit
     assert magnitude_limit <= 0.2, "In the function create_single_integrator_barrier_certificate2, the maximum linear velocity of the robot (magnitude_limit) must be less than the max speed of the robot (0.2m/s). Recieved %r." % magnitude_limit
+    assert interaction_radius is None or interaction_radius > safety_radius, "In the function create_single_integrator_barrier_certificate2, the interaction radius (interaction_radius) must be larger than the safe distance between robots (safety_radius). Recieved %r." % interaction_radius
+
 
+    qp_solver = create_qp_solver(solver)
+    constraints = None
 
     def f(dxi, x):
         #Check user input types
@@ -211,27 +499,16 @@ def create_single_integrator_barrier_certificate2(barrier_gain=100, unsafe_barri
         assert x.shape[1] == dxi.shape[1], "In the function created by the create_single_integrator_barrier_certificate2 function, the number of robot states (x) must be equal to the number of robot single integrator velocity commands (dxi). Recieved a current robot pose input array (x) of size %r x %r and single integrator velocity array (dxi) of size %r x %r." % (x.shape[0], x.shape[1], dxi.shape[0], dxi.shape[1])
 
         
-        # Initialize some variables for computational savings
+        # Reuse the constraint buffers while the number of robots does not change
+        nonlocal constraints
+        start = time.perf_counter()
         N = dxi.shape[1]
-        num_constraints = int(comb(N, 2))
-        A = np.zeros((num_constraints, 2*N))
-        b = np.zeros(num_constraints)
-        H = sparse(matrix(2*np.identity(2*N)))
-
-        count = 0
-        for i in range(N-1):
-            for j in range(i+1, N):
-                error = x[:, i] - x[:, j]
-                h = (error[0]*error[0] + error[1]*error[1]) - np.power(safety_radius, 2)
-
-                A[count, (2*i, (2*i+1))] = -2*error
-                A[count, (2*j, (2*j+1))] = 2*error
-                if h >= 0:
-                    b[count] = barrier_gain*np.power(h, 3)
-                else:
-                    b[count] = unsafe_barrier_gain*np.power(h, 3)
-
-                count += 1
+        if constraints is None or constraints.number_of_robots != N:
+            constraints = _PairwiseBarrierConstraints(N, interaction_radius=interaction_radius)
+
+        h = constraints.update_pairs(x, safety_radius)
+        np.power(h, 3, out=constraints.b)
+        constraints.b *= np.where(h >= 0, barrier_gain, unsafe_barrier_gain)
 
         # Threshold control inputs before QP
         norms = np.linalg.norm(dxi, 2, 0)
@@ -239,13 +516,310 @@ def create_single_integrator_barrier_certificate2(barrier_gain=100, unsafe_barri
         dxi[:, idxs_to_normalize] *= magnitude_limit/norms[idxs_to_normalize]
 
         f = -2*np.reshape(dxi, 2*N, order='F')
-        result = qp(H, matrix(f), matrix(A), matrix(b))['x']
+        if constraints.b.size == 0:
+            # No robots are close enough to interact, the thresholded input is safe.
+            if telemetry is not None:
+                telemetry.record(assembly_time=time.perf_counter() - start, status='optimal')
+            return np.copy(dxi)
+
+        assembly_time = time.perf_counter() - start
+        result = qp_solver.solve(constraints.H, f, constraints.A, constraints.b)
+
+        start = time.perf_counter()
+        dxi_safe = np.reshape(result, (2, -1), order='F')
+        if telemetry is not None:
+            _record_qp(telemetry, qp_solver, assembly_time, time.perf_counter() - start, constraints.b.size, dxi_safe - dxi)
 
-        return np.reshape(result, (2, -1), order='F')
+        return dxi_safe
 
     return f
 
-def create_unicycle_barrier_certificate(barrier_gain=100, safety_radius=0.12, projection_distance=0.05, magnitude_limit=0.2):
+class _WorkerPool:
+    # A thread or process pool that is only started when it is first used.
+
+    def __init__(self, executor, max_workers):
+        self.executor = executor
+        self.max_workers = max_workers
+        self.closed = False
+        self._pool = None
+
+    def get(self):
+        assert not self.closed, "The barrier certificate has been closed, its worker pool can not be used anymore."
+        if self._pool is None:
+            self._pool = (ThreadPoolExecutor if self.executor == 'thread' else ProcessPoolExecutor)(max_workers=self.max_workers)
+        return self._pool
+
+    def close(self):
+        self.closed = True
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+class _PooledBarrierCertificate:
+    # A barrier certificate function that owns a _WorkerPool.  The pool is shut down by
+    # close(), at the end of a with block, or at the latest when the certificate is garbage
+    # collected or the interpreter exits.
+
+    def __init__(self, certificate, pool):
+        self._certificate = certificate
+        self._finalizer = weakref.finalize(self, pool.close)
+
+    def __call__(self, dxi, x):
+        return self._certificate(dxi, x)
+
+    def close(self):
+        """Shuts down the worker pool.  The certificate can not be called afterwards."""
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def create_distributed_single_integrator_barrier_certificate(barrier_gain=100, safety_radius=0.17, magnitude_limit=0.2, interaction_radius=None, executor='thread', max_workers=None, telemetry=None):
+    """Creates a decentralized barrier certificate for a single-integrator system.  Instead
+    of one QP over all robots, every robot solves its own QP over its own velocity, as the
+    robots would do on-board.  Each robot takes responsibility for half of every pairwise
+    barrier constraint, so when all robots satisfy their own constraints the pairwise
+    constraints of the centralized certificate hold as well.  The small QPs are solved
+    concurrently on a pool of workers.  This function returns another function for
+    optimization reasons.
+
+    The returned certificate owns its pool, which is started on the first call.  Call its
+    close() method (or use it in a with block) to shut the pool down when the certificate is
+    no longer needed, otherwise the pool lives until the certificate is garbage collected.
+
+    barrier_gain: double (controls how quickly agents can approach each other.  lower = slower)
+    safety_radius: double (how far apart the agents will stay)
+    magnitude_limit: how fast the robot can move linearly.
+    interaction_radius: double (only neighbors closer than this enter a robot's QP.  All robots are neighbors if None)
+    executor: string ('thread' or 'process' to solve on a pool of threads or processes, 'serial' to solve in the calling thread,
+              which has the least overhead for small swarms or single core machines)
+    max_workers: int (number of workers of the pool, defaults to the number of CPUs)
+    telemetry: BarrierTelemetry (records every call of the certificate, summed over the QPs of all robots, no telemetry if None)
+
+    -> function (the barrier certificate function, with close() if executor is 'thread' or 'process')
+    """
+
+    #Check user input types
+    assert isinstance(barrier_gain, (int, float)), "In the function create_distributed_single_integrator_barrier_certificate, the barrier gain (barrier_gain) must be an integer or float. Recieved type %r." % type(barrier_gain).__name__
+    assert isinstance(safety_radius, (int, float)), "In the function create_distributed_single_integrator_barrier_certificate, the safe distance between robots (safety_radius) must be an integer or float. Recieved type %r." % type(safety_radius).__name__
+    assert isinstance(magnitude_limit, (int, float)), "In the function create_distributed_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be an integer or float. Recieved type %r." % type(magnitude_limit).__name__
+    assert interaction_radius is None or isinstance(interaction_radius, (int, float)), "In the function create_distributed_single_integrator_barrier_certificate, the interaction radius (interaction_radius) must be an integer, float or None. Recieved type %r." % type(interaction_radius).__name__
+    assert executor in ('thread', 'process', 'serial'), "In the function create_distributed_single_integrator_barrier_certificate, the executor (executor) must be 'thread', 'process' or 'serial'. Recieved %r." % executor
+    assert max_workers is None or isinstance(max_workers, int), "In the function create_distributed_single_integrator_barrier_certificate, the number of workers (max_workers) must be an integer or None. Recieved type %r." % type(max_workers).__name__
+    assert telemetry is None or isinstance(telemetry, BarrierTelemetry), "In the function create_distributed_single_integrator_barrier_certificate, the telemetry (telemetry) must be a BarrierTelemetry or None. Recieved type %r." % type(telemetry).__name__
+
+    #Check user input ranges/sizes
+    assert barrier_gain > 0, "In the function create_distributed_single_integrator_barrier_certificate, the barrier gain (barrier_gain) must be positive. Recieved %r." % barrier_gain
+    assert safety_radius >= 0.12, "In the function create_distributed_single_integrator_barrier_certificate, the safe distance between robots (safety_radius) must be greater than or equal to the diameter of the robot (0.12m) plus the distance to the look ahead point used in the diffeomorphism if that is being used. Recieved %r." % safety_radius
+    assert magnitude_limit > 0, "In the function create_distributed_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be positive. Recieved %r." % magnitude_limit
+    assert magnitude_limit <= 0.2, "In the function create_distributed_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be less than the max speed of the robot (0.2m/s). Recieved %r." % magnitude_limit
+    assert interaction_radius is None or interaction_radius > safety_radius, "In the function create_distributed_single_integrator_barrier_certificate, the interaction radius (interaction_radius) must be larger than the safe distance between robots (safety_radius). Recieved %r." % interaction_radius
+    assert max_workers is None or max_workers > 0, "In the function create_distributed_single_integrator_barrier_certificate, the number of workers (max_workers) must be positive. Recieved %r." % max_workers
+
+
+    workers = max_workers or os.cpu_count()
+    pool = None if executor == 'serial' else _WorkerPool(executor, workers)
+
+    def f(dxi, x):
+        #Check user input types
+        assert isinstance(dxi, np.ndarray), "In the function created by the create_distributed_single_integrator_barrier_certificate function, the single-integrator robot velocity command (dxi) must be a numpy array. Recieved type %r." % type(dxi).__name__
+        assert isinstance(x, np.ndarray), "In the function created by the create_distributed_single_integrator_barrier_certificate function, the robot states (x) must be a numpy array. Recieved type %r." % type(x).__name__
+
+        #Check user input ranges/sizes
+        assert x.shape[0] == 2, "In the function created by the create_distributed_single_integrator_barrier_certificate function, the dimension of the single integrator robot states (x) must be 2 ([x;y]). Recieved dimension %r." % x.shape[0]
+        assert dxi.shape[0] == 2, "In the function created by the create_distributed_single_integrator_barrier_certificate function, the dimension of the robot single integrator velocity command (dxi) must be 2 ([x_dot;y_dot]). Recieved dimension %r." % dxi.shape[0]
+        assert x.shape[1] == dxi.shape[1], "In the function created by the create_distributed_single_integrator_barrier_certificate function, the number of robot states (x) must be equal to the number of robot single integrator velocity commands (dxi). Recieved a current robot pose input array (x) of size %r x %r and single integrator velocity array (dxi) of size %r x %r." % (x.shape[0], x.shape[1], dxi.shape[0], dxi.shape[1])
+
+        start = time.perf_counter()
+        N = dxi.shape[1]
+        if N == 0:
+            # No robots, nothing to split among the workers.
+            if telemetry is not None:
+                telemetry.record(assembly_time=time.perf_counter() - start, status='optimal')
+            return np.copy(dxi)
+
+        if interaction_radius is None:
+            i, j = np.triu_indices(N, 1)
+        else:
+            i, j = pairs_within(x, interaction_radius)
+
+        # Both robots of a pair get a row, each with half of the barrier bound.
+        errors = x[:, i] - x[:, j]
+        h = errors[0]*errors[0] + errors[1]*errors[1] - safety_radius**2
+        half_bound = 0.5*barrier_gain*np.power(h, 3)
+
+        owners = np.concatenate((i, j))
+        order = np.argsort(owners, kind='stable')
+        rows = np.concatenate((-2*errors.T, 2*errors.T))[order]
+        bounds = np.concatenate((half_bound, half_bound))[order]
+        # The rows of robot r are rows[starts[r]:starts[r+1]]
+        starts = np.searchsorted(owners[order], np.arange(N+1))
+
+        # Threshold control inputs before QP
+        norms = np.linalg.norm(dxi, 2, 0)
+        idxs_to_normalize = (norms > magnitude_limit)
+        dxi[:, idxs_to_normalize] *= magnitude_limit/norms[idxs_to_normalize]
+
+        assembly_time = time.perf_counter() - start
+        start = time.perf_counter()
+        if pool is None:
+            results = [_solve_local_barrier_qps(dxi, starts, rows, bounds)]
+        else:
+            # Every worker gets a contiguous block of robots and only the rows of those robots.
+            tasks = []
+            executor_pool = pool.get()
+            for robots in np.array_split(np.arange(N), min(workers, N)):
+                first, last = robots[0], robots[-1] + 1
+                tasks.append(executor_pool.submit(_solve_local_barrier_qps, dxi[:, first:last], starts[first:last+1] - starts[first], rows[starts[first]:starts[last]], bounds[starts[first]:starts[last]]))
+            results = [task.result() for task in tasks]
+        solve_time = time.perf_counter() - start
+
+        dxi_safe = np.concatenate([result[0] for result in results], axis=1)
+        if telemetry is not None:
+            statuses = [result[3] for result in results if result[3] != 'optimal']
+            telemetry.record(assembly_time=assembly_time, solve_time=solve_time, constraints=bounds.size, active_constraints=sum(result[1] for result in results),
+                             iterations=sum(result[2] for result in results), status=statuses[0] if statuses else 'optimal', deviation=np.linalg.norm(dxi_safe - dxi))
+
+        return dxi_safe
+
+    return f if pool is None else _PooledBarrierCertificate(f, pool)
+
+def create_batched_single_integrator_barrier_certificate(barrier_gain=100, safety_radius=0.17, magnitude_limit=0.2, solver='batched', telemetry=None):
+    """Creates a barrier certificate for M independent worlds of N single-integrator robots
+    each, such as the worlds of a RobotariumEnsemble.  By default the QPs of all worlds are
+    solved together by a BatchedActiveSetQPSolver.  With any other solver they are stacked
+    into one block diagonal QP, from which the worlds whose nominal inputs already satisfy
+    all of their constraints are left out, and solved with a single solver call.  This
+    function returns another function for optimization reasons.
+
+    barrier_gain: double (controls how quickly agents can approach each other.  lower = slower)
+    safety_radius: double (how far apart the agents will stay)
+    magnitude_limit: how fast the robot can move linearly.
+    solver: string ('batched', or 'cvxopt', 'quadprog' or 'active_set' for the block diagonal QP), BatchedActiveSetQPSolver or QPSolver
+    telemetry: BarrierTelemetry (records every call of the certificate, summed over all worlds, no telemetry if None)
+
+    -> function (the batched barrier certificate function, called with Mx2xN velocities and states)
+    """
+
+    #Check user input types
+    assert isinstance(barrier_gain, (int, float)), "In the function create_batched_single_integrator_barrier_certificate, the barrier gain (barrier_gain) must be an integer or float. Recieved type %r." % type(barrier_gain).__name__
+    assert isinstance(safety_radius, (int, float)), "In the function create_batched_single_integrator_barrier_certificate, the safe distance between robots (safety_radius) must be an integer or float. Recieved type %r." % type(safety_radius).__name__
+    assert isinstance(magnitude_limit, (int, float)), "In the function create_batched_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be an integer or float. Recieved type %r." % type(magnitude_limit).__name__
+    assert telemetry is None or isinstance(telemetry, BarrierTelemetry), "In the function create_batched_single_integrator_barrier_certificate, the telemetry (telemetry) must be a BarrierTelemetry or None. Recieved type %r." % type(telemetry).__name__
+
+    #Check user input ranges/sizes
+    assert barrier_gain > 0, "In the function create_batched_single_integrator_barrier_certificate, the barrier gain (barrier_gain) must be positive. Recieved %r." % barrier_gain
+    assert safety_radius >= 0.12, "In the function create_batched_single_integrator_barrier_certificate, the safe distance between robots (safety_radius) must be greater than or equal to the diameter of the robot (0.12m) plus the distance to the look ahead point used in the diffeomorphism if that is being used. Recieved %r." % safety_radius
+    assert magnitude_limit > 0, "In the function create_batched_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be positive. Recieved %r." % magnitude_limit
+    assert magnitude_limit <= 0.2, "In the function create_batched_single_integrator_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be less than the max speed of the robot (0.2m/s). Recieved %r." % magnitude_limit
+
+
+    if isinstance(solver, BatchedActiveSetQPSolver):
+        qp_solver = solver
+    elif solver == 'batched':
+        qp_solver = BatchedActiveSetQPSolver()
+    else:
+        qp_solver = create_qp_solver(solver)
+    # Pairs and columns of the 4 nonzero entries of every pair row, for the current N
+    pairs = None
+
+    def f(dxi, x):
+        #Check user input types
+        assert isinstance(dxi, np.ndarray), "In the function created by the create_batched_single_integrator_barrier_certificate function, the single-integrator robot velocity commands (dxi) must be a numpy array. Recieved type %r." % type(dxi).__name__
+        assert isinstance(x, np.ndarray), "In the function created by the create_batched_single_integrator_barrier_certificate function, the robot states (x) must be a numpy array. Recieved type %r." % type(x).__name__
+
+        #Check user input ranges/sizes
+        assert x.ndim == 3 and x.shape[1] == 2, "In the function created by the create_batched_single_integrator_barrier_certificate function, the robot states (x) must be of size Mx2xN. Recieved a %r array." % (x.shape,)
+        assert dxi.shape == x.shape, "In the function created by the create_batched_single_integrator_barrier_certificate function, the single integrator velocity commands (dxi) must be of the same size as the robot states (x). Recieved a robot state array of size %r and a single integrator velocity array of size %r." % (x.shape, dxi.shape)
+
+        nonlocal pairs
+        start = time.perf_counter()
+        N = x.shape[2]
+        if pairs is None or pairs[0] != N:
+            i, j = np.triu_indices(N, 1)
+            pairs = (N, i, j, np.stack((2*i, 2*i+1, 2*j, 2*j+1), axis=1))
+        _, i, j, pair_cols = pairs
+
+        # Threshold control inputs before QP
+        norms = np.linalg.norm(dxi, 2, 1)
+        worlds_to_normalize, idxs_to_normalize = np.nonzero(norms > magnitude_limit)
+        dxi[worlds_to_normalize, :, idxs_to_normalize] *= (magnitude_limit/norms[worlds_to_normalize, idxs_to_normalize])[:, np.newaxis]
+
+        errors = x[:, :, i] - x[:, :, j]
+        b = barrier_gain*np.power(np.sum(errors*errors, axis=1) - safety_radius**2, 3)
+        M = x.shape[0]
+        P = i.size
+
+        if isinstance(qp_solver, BatchedActiveSetQPSolver):
+            # One QP per world over the velocities [x_1, y_1, x_2, ...] of its robots
+            A = np.zeros((M, P, 2*N))
+            rows = np.arange(P)[:, np.newaxis]
+            A[:, rows, pair_cols] = np.concatenate((-2*errors, 2*errors), axis=1).transpose(0, 2, 1)
+            assembly_time = time.perf_counter() - start
+            result = qp_solver.solve(2*np.identity(2*N), -2*dxi.transpose(0, 2, 1).reshape(M, 2*N), A, b)
+
+            start = time.perf_counter()
+            dxi_safe = np.reshape(result, (M, N, 2)).transpose(0, 2, 1)
+            if telemetry is not None:
+                _record_qp(telemetry, qp_solver, assembly_time, time.perf_counter() - start, b.size, dxi_safe - dxi)
+            return dxi_safe
+
+        # Row of pair (i, j): -2*error^T dxi_i + 2*error^T dxi_j <= b.  Only worlds in which
+        # the nominal inputs violate a row need to be solved.
+        nominal = -2*np.sum(errors*(dxi[:, :, i] - dxi[:, :, j]), axis=1)
+        worlds = np.flatnonzero(np.any(nominal > b, axis=1))
+
+        dxi_safe = np.copy(dxi)
+        if worlds.size == 0:
+            if telemetry is not None:
+                telemetry.record(assembly_time=time.perf_counter() - start, status='optimal')
+            return dxi_safe
+
+        # Block diagonal QP over the velocities [x_1, y_1, x_2, ...] of the unsafe worlds
+        W = worlds.size
+        world_errors = errors[worlds]
+        data = np.concatenate((-2*world_errors, 2*world_errors), axis=1).transpose(0, 2, 1)
+        indices = pair_cols + (2*N*np.arange(W))[:, np.newaxis, np.newaxis]
+        A = csr_matrix((data.ravel(), indices.ravel(), np.arange(0, 4*W*P+1, 4)), shape=(W*P, 2*N*W))
+        H = 2*identity(2*N*W, format='csr')
+        f = -2*dxi[worlds].transpose(0, 2, 1).ravel()
+
+        assembly_time = time.perf_counter() - start
+        result = qp_solver.solve(H, f, A, b[worlds].ravel())
+
+        start = time.perf_counter()
+        dxi_safe[worlds] = np.reshape(result, (W, N, 2)).transpose(0, 2, 1)
+        if telemetry is not None:
+            _record_qp(telemetry, qp_solver, assembly_time, time.perf_counter() - start, W*P, dxi_safe - dxi)
+
+        return dxi_safe
+
+    return f
+
+def _solve_local_barrier_qps(dxi, starts, rows, bounds):
+    # Solves the QP of every robot: stay as close as possible to its own nominal velocity
+    # subject to its own rows of the barrier constraints.  Module level so that process
+    # pools can run it.  Returns the safe velocities, the number of active constraints, the
+    # number of iterations and the first status other than 'optimal' (if any).
+    solver = ActiveSetQPSolver(warm_start=False)
+    H = 2*np.identity(2)
+    dxi_safe = np.copy(dxi)
+    active_constraints = 0
+    status = 'optimal'
+    for r in range(dxi.shape[1]):
+        if starts[r] == starts[r+1]:
+            continue
+        dxi_safe[:, r] = solver.solve(H, -2*dxi[:, r], rows[starts[r]:starts[r+1]], bounds[starts[r]:starts[r+1]])
+        active_constraints += solver.active_set.size
+        if solver.status != 'optimal' and status == 'optimal':
+            status = solver.status
+
+    return dxi_safe, active_constraints, solver.total_iterations, status
+
+def create_unicycle_barrier_certificate(barrier_gain=100, safety_radius=0.12, projection_distance=0.05, magnitude_limit=0.2, interaction_radius=None, solver='cvxopt', telemetry=None):
     """ Creates a unicycle barrier cetifcate to avoid collisions. Uses the diffeomorphism mapping
     and single integrator implementation. For optimization purposes, this function returns 
     another function.
@@ -253,6 +827,9 @@ def create_unicycle_barrier_certificate(barrier_gain=100, safety_radius=0.12, pr
     barrier_gain: double (how fast the robots can approach each other)
     safety_radius: double (how far apart the robots should stay)
     projection_distance: double (how far ahead to place the bubble)
+    interaction_radius: double (only robots whose bubbles are closer than this are constrained.  All pairs are constrained if None)
+    solver: string ('cvxopt', 'quadprog' or 'active_set') or QPSolver (solves the barrier QP of the single integrator certificate)
+    telemetry: BarrierTelemetry (records every call of the certificate, no telemetry if None)
 
     -> function (the unicycle barrier certificate function)
     """
@@ -262,6 +839,7 @@ def create_unicycle_barrier_certificate(barrier_gain=100, safety_radius=0.12, pr
     assert isinstance(safety_radius, (int, float)), "In the function create_unicycle_barrier_certificate, the safe distance between robots (safety_radius) must be an integer or float. Recieved type %r." % type(safety_radius).__name__
     assert isinstance(projection_distance, (int, float)), "In the function create_unicycle_barrier_certificate, the projected point distance for the diffeomorphism between sinlge integrator and unicycle (projection_distance) must be an integer or float. Recieved type %r." % type(projection_distance).__name__
     assert isinstance(magnitude_limit, (int, float)), "In the function create_unicycle_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be an integer or float. Recieved type %r." % type(magnitude_limit).__name__
+    assert telemetry is None or isinstance(telemetry, BarrierTelemetry), "In the function create_unicycle_barrier_certificate, the telemetry (telemetry) must be a BarrierTelemetry or None. Recieved type %r." % type(telemetry).__name__
 
     #Check user input ranges/sizes
     assert barrier_gain > 0, "In the function create_unicycle_barrier_certificate, the barrier gain (barrier_gain) must be positive. Recieved %r." % barrier_gain
@@ -271,11 +849,12 @@ def create_unicycle_barrier_certificate(barrier_gain=100, safety_radius=0.12, pr
     assert magnitude_limit <= 0.2, "In the function create_unicycle_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be less than the max speed of the robot (0.2m/s). Recieved %r." % magnitude_limit
 
 
-    si_barrier_cert = create_single_integrator_barrier_certificate(barrier_gain=barrier_gain, safety_radius=safety_radius+projection_distance)
+    si_barrier_cert = create_single_integrator_barrier_certificate(barrier_gain=barrier_gain, safety_radius=safety_radius+projection_distance, interaction_radius=interaction_radius, solver=solver, telemetry=telemetry)
 
     si_to_uni_dyn, uni_to_si_states = create_si_to_uni_mapping(projection_distance=projection_distance)
 
     uni_to_si_dyn = create_uni_to_si_dynamics(projection_distance=projection_distance)
+    headings = HeadingCache()
 
     def f(dxu, x):
         #Check user input types
@@ -288,17 +867,24 @@ def create_unicycle_barrier_certificate(barrier_gain=100, safety_radius=0.12, pr
         assert x.shape[1] == dxu.shape[1], "In the function created by the create_unicycle_barrier_certificate function, the number of robot states (x) must be equal to the number of robot unicycle velocity commands (dxu). Recieved a current robot pose input array (x) of size %r x %r and single integrator velocity array (dxi) of size %r x %r." % (x.shape[0], x.shape[1], dxu.shape[0], dxu.shape[1])
 
 
-        x_si = uni_to_si_states(x)
+        start = time.perf_counter()
+        headings.update(x)
+        x_si = uni_to_si_states(x, headings=headings)
         #Convert unicycle control command to single integrator one
-        dxi = uni_to_si_dyn(dxu, x)
+        dxi = uni_to_si_dyn(dxu, x, headings=headings)
+        conversion_time = time.perf_counter() - start
         #Apply single integrator barrier certificate
         dxi = si_barrier_cert(dxi, x_si)
         #Return safe unicycle command
-        return si_to_uni_dyn(dxi, x)
+        start = time.perf_counter()
+        dxu_safe = si_to_uni_dyn(dxi, x, headings=headings)
+        if telemetry is not None:
+            telemetry.amend(conversion_time=conversion_time + time.perf_counter() - start, deviation=np.linalg.norm(dxu_safe - dxu))
+        return dxu_safe
 
     return f
 
-def create_unicycle_barrier_certificate_with_boundary(barrier_gain=100, safety_radius=0.12, projection_distance=0.05, magnitude_limit=0.2, boundary_points = np.array([-1.6, 1.6, -1.0, 1.0])):
+def create_unicycle_barrier_certificate_with_boundary(barrier_gain=100, safety_radius=0.12, projection_distance=0.05, magnitude_limit=0.2, boundary_points = np.array([-1.6, 1.6, -1.0, 1.0]), interaction_radius=None, solver='cvxopt', telemetry=None):
     """ Creates a unicycle barrier cetifcate to avoid collisions. Uses the diffeomorphism mapping
     and single integrator implementation. For optimization purposes, this function returns 
     another function.
@@ -306,6 +892,9 @@ def create_unicycle_barrier_certificate_with_boundary(barrier_gain=100, safety_r
     barrier_gain: double (how fast the robots can approach each other)
     safety_radius: double (how far apart the robots should stay)
     projection_distance: double (how far ahead to place the bubble)
+    interaction_radius: double (only robots whose bubbles are closer than this are constrained.  All pairs are constrained if None)
+    solver: string ('cvxopt', 'quadprog' or 'active_set') or QPSolver (solves the barrier QP of the single integrator certificate)
+    telemetry: BarrierTelemetry (records every call of the certificate, no telemetry if None)
 
     -> function (the unicycle barrier certificate function)
     """
@@ -315,6 +904,7 @@ def create_unicycle_barrier_certificate_with_boundary(barrier_gain=100, safety_r
     assert isinstance(safety_radius, (int, float)), "In the function create_unicycle_barrier_certificate, the safe distance between robots (safety_radius) must be an integer or float. Recieved type %r." % type(safety_radius).__name__
     assert isinstance(projection_distance, (int, float)), "In the function create_unicycle_barrier_certificate, the projected point distance for the diffeomorphism between sinlge integrator and unicycle (projection_distance) must be an integer or float. Recieved type %r." % type(projection_distance).__name__
     assert isinstance(magnitude_limit, (int, float)), "In the function create_unicycle_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be an integer or float. Recieved type %r." % type(magnitude_limit).__name__
+    assert telemetry is None or isinstance(telemetry, BarrierTelemetry), "In the function create_unicycle_barrier_certificate_with_boundary, the telemetry (telemetry) must be a BarrierTelemetry or None. Recieved type %r." % type(telemetry).__name__
 
     #Check user input ranges/sizes
     assert barrier_gain > 0, "In the function create_unicycle_barrier_certificate, the barrier gain (barrier_gain) must be positive. Recieved %r." % barrier_gain
@@ -324,11 +914,12 @@ def create_unicycle_barrier_certificate_with_boundary(barrier_gain=100, safety_r
     assert magnitude_limit <= 0.2, "In the function create_unicycle_barrier_certificate, the maximum linear velocity of the robot (magnitude_limit) must be less than the max speed of the robot (0.2m/s). Recieved %r." % magnitude_limit
 
 
-    si_barrier_cert = create_single_integrator_barrier_certificate_with_boundary(barrier_gain=barrier_gain, safety_radius=safety_radius+projection_distance, boundary_points=boundary_points)
+    si_barrier_cert = create_single_integrator_barrier_certificate_with_boundary(barrier_gain=barrier_gain, safety_radius=safety_radius+projection_distance, boundary_points=boundary_points, interaction_radius=interaction_radius, solver=solver, telemetry=telemetry)
 
     si_to_uni_dyn, uni_to_si_states = create_si_to_uni_mapping(projection_distance=projection_distance)
 
     uni_to_si_dyn = create_uni_to_si_dynamics(projection_distance=projection_distance)
+    headings = HeadingCache()
 
     def f(dxu, x):
         #Check user input types
@@ -341,17 +932,24 @@ def create_unicycle_barrier_certificate_with_boundary(barrier_gain=100, safety_r
         assert x.shape[1] == dxu.shape[1], "In the function created by the create_unicycle_barrier_certificate function, the number of robot states (x) must be equal to the number of robot unicycle velocity commands (dxu). Recieved a current robot pose input array (x) of size %r x %r and single integrator velocity array (dxi) of size %r x %r." % (x.shape[0], x.shape[1], dxu.shape[0], dxu.shape[1])
 
 
-        x_si = uni_to_si_states(x)
+        start = time.perf_counter()
+        headings.update(x)
+        x_si = uni_to_si_states(x, headings=headings)
         #Convert unicycle control command to single integrator one
-        dxi = uni_to_si_dyn(dxu, x)
+        dxi = uni_to_si_dyn(dxu, x, headings=headings)
+        conversion_time = time.perf_counter() - start
         #Apply single integrator barrier certificate
         dxi = si_barrier_cert(dxi, x_si)
         #Return safe unicycle command
-        return si_to_uni_dyn(dxi, x)
+        start = time.perf_counter()
+        dxu_safe = si_to_uni_dyn(dxi, x, headings=headings)
+        if telemetry is not None:
+            telemetry.amend(conversion_time=conversion_time + time.perf_counter() - start, deviation=np.linalg.norm(dxu_safe - dxu))
+        return dxu_safe
 
     return f
 
-def create_unicycle_barrier_certificate2(barrier_gain=500, unsafe_barrier_gain=1e6, safety_radius=0.12, projection_distance=0.05, magnitude_limit=0.2):
+def create_unicycle_barrier_certificate2(barrier_gain=500, unsafe_barrier_gain=1e6, safety_radius=0.12, projection_distance=0.05, magnitude_limit=0.2, interaction_radius=None, solver='cvxopt', telemetry=None):
     """ Creates a unicycle barrier cetifcate to avoid collisions. Uses the diffeomorphism mapping
     and single integrator implementation. For optimization purposes, this function returns 
     another function.
@@ -359,6 +957,9 @@ def create_unicycle_barrier_certificate2(barrier_gain=500, unsafe_barrier_gain=1
     barrier_gain: double (how fast the robots can approach each other)
     safety_radius: double (how far apart the robots should stay)
     projection_distance: double (how far ahead to place the bubble)
+    interaction_radius: double (only robots whose bubbles are closer than this are constrained.  All pairs are constrained if None)
+    solver: string ('cvxopt', 'quadprog' or 'active_set') or QPSolver (solves the barrier QP of the single integrator certificate)
+    telemetry: BarrierTelemetry (records every call of the certificate, no telemetry if None)
 
     -> function (the unicycle barrier certificate function)
     """
@@ -369,6 +970,7 @@ def create_unicycle_barrier_certificate2(barrier_gain=500, unsafe_barrier_gain=1
     assert isinstance(safety_radius, (int, float)), "In the function create_unicycle_barrier_certificate2, the safe distance between robots (safety_radius) must be an integer or float. Recieved type %r." % type(safety_radius).__name__
     assert isinstance(projection_distance, (int, float)), "In the function create_unicycle_barrier_certificate2, the projected point distance for the diffeomorphism between sinlge integrator and unicycle (projection_distance) must be an integer or float. Recieved type %r." % type(projection_distance).__name__
     assert isinstance(magnitude_limit, (int, float)), "In the function create_unicycle_barrier_certificate2, the maximum linear velocity of the robot (magnitude_limit) must be an integer or float. Recieved type %r." % type(magnitude_limit).__name__
+    assert telemetry is None or isinstance(telemetry, BarrierTelemetry), "In the function create_unicycle_barrier_certificate2, the telemetry (telemetry) must be a BarrierTelemetry or None. Recieved type %r." % type(telemetry).__name__
 
     #Check user input ranges/sizes
     assert barrier_gain > 0, "In the function create_unicycle_barrier_certificate2, the barrier gain inside the safe set (barrier_gain) must be positive. Recieved %r." % barrier_gain
@@ -379,11 +981,12 @@ def create_unicycle_barrier_certificate2(barrier_gain=500, unsafe_barrier_gain=1
     assert magnitude_limit <= 0.2, "In the function create_unicycle_barrier_certificate2, the maximum linear velocity of the robot (magnitude_limit) must be less than the max speed of the robot (0.2m/s). Recieved %r." % magnitude_limit
 
 
-    si_barrier_cert = create_single_integrator_barrier_certificate2(barrier_gain=barrier_gain, unsafe_barrier_gain=unsafe_barrier_gain, safety_radius=safety_radius+projection_distance)
+    si_barrier_cert = create_single_integrator_barrier_certificate2(barrier_gain=barrier_gain, unsafe_barrier_gain=unsafe_barrier_gain, safety_radius=safety_radius+projection_distance, interaction_radius=interaction_radius, solver=solver, telemetry=telemetry)
 
     si_to_uni_dyn, uni_to_si_states = create_si_to_uni_mapping(projection_distance=projection_distance)
 
     uni_to_si_dyn = create_uni_to_si_dynamics(projection_distance=projection_distance)
+    headings = HeadingCache()
 
     def f(dxu, x):
         #Check user input types
@@ -396,243 +999,181 @@ def create_unicycle_barrier_certificate2(barrier_gain=500, unsafe_barrier_gain=1
         assert x.shape[1] == dxu.shape[1], "In the function created by the create_unicycle_barrier_certificate function, the number of robot states (x) must be equal to the number of robot unicycle velocity commands (dxu). Recieved a current robot pose input array (x) of size %r x %r and single integrator velocity array (dxi) of size %r x %r." % (x.shape[0], x.shape[1], dxu.shape[0], dxu.shape[1])
 
 
-        x_si = uni_to_si_states(x)
+        start = time.perf_counter()
+        headings.update(x)
+        x_si = uni_to_si_states(x, headings=headings)
         #Convert unicycle control command to single integrator one
-        dxi = uni_to_si_dyn(dxu, x)
+        dxi = uni_to_si_dyn(dxu, x, headings=headings)
+        conversion_time = time.perf_counter() - start
         #Apply single integrator barrier certificate
         dxi = si_barrier_cert(dxi, x_si)
         #Return safe unicycle command
-        return si_to_uni_dyn(dxi, x)
+        start = time.perf_counter()
+        dxu_safe = si_to_uni_dyn(dxi, x, headings=headings)
+        if telemetry is not None:
+            telemetry.amend(conversion_time=conversion_time + time.perf_counter() - start, deviation=np.linalg.norm(dxu_safe - dxu))
+        return dxu_safe
 
     return f
 
+def _prepare_obstacles(obstacles, obstacle_neighbors):
+    # Returns the obstacles in the form _DifferentialDriveBarrierConstraints.update expects
+    # (a 2xK array, or an ObstacleIndex with obstacle_neighbors) and the number of obstacle
+    # rows per robot.
+    if obstacle_neighbors is None:
+        if isinstance(obstacles, ObstacleIndex):
+            obstacles = obstacles.points
+        return obstacles, obstacles.shape[1] if obstacles.size != 0 else 0
+
+    if not isinstance(obstacles, ObstacleIndex):
+        obstacles = ObstacleIndex(obstacles)
+    return obstacles, obstacle_neighbors
+
 def create_unicycle_differential_drive_barrier_certificate(max_num_obstacle_points = 100, max_num_robots = 30, disturbance = 5, wheel_vel_limit = 12.5, base_length = 0.105, wheel_radius = 0.016,
-    projection_distance =0.05, barrier_gain = 150, safety_radius = 0.17):
-    
+    projection_distance =0.05, barrier_gain = 150, safety_radius = 0.17, solver = 'quadprog', obstacle_neighbors = None, obstacle_range = np.inf, telemetry = None):
+    """Creates a barrier certificate for differential drive robots that is robust to
+    bounded wheel velocity disturbances and also keeps the robots away from obstacle points.
+    The QP is solved over the wheel velocities, which are bounded by wheel_vel_limit.
+
+    max_num_obstacle_points, max_num_robots: int (unused, the constraints are sized from the inputs)
+    disturbance: double (bound on the disturbance of every wheel velocity)
+    wheel_vel_limit: double (bound on the wheel velocities)
+    base_length: double (distance between the wheels)
+    wheel_radius: double (radius of the wheels)
+    projection_distance: double (how far ahead to place the bubble)
+    barrier_gain: double (how fast the robots can approach each other)
+    safety_radius: double (how far apart the robots should stay)
+    solver: string or QPSolver (the QP solver, see create_qp_solver)
+    obstacle_neighbors: int (only this many nearest obstacle points of every robot are constrained.  All points are constrained if None)
+    obstacle_range: double (obstacle points farther than this from a robot are not constrained, used with obstacle_neighbors)
+    telemetry: BarrierTelemetry (records every call of the certificate, no telemetry if None)
 
-    D = np.matrix([[wheel_radius/2, wheel_radius/2], [-wheel_radius/base_length, wheel_radius/base_length]])
-    L = np.matrix([[1,0],[0,projection_distance]])* D
-    disturb = np.matrix([[-disturbance, -disturbance, disturbance, disturbance],[-disturbance, disturbance, disturbance, -disturbance]])
-    num_disturbs = np.size(disturb[1,:])
+    -> function (the barrier certificate function, called as f(dxu, x, obstacles), where obstacles is a 2xK numpy
+       array or an ObstacleIndex that can be updated between calls)
+    """
+
+    D = np.array([[wheel_radius/2, wheel_radius/2], [-wheel_radius/base_length, wheel_radius/base_length]])
 
-    max_num_constraints = (max_num_robots**2-max_num_robots)//2 + max_num_robots*max_num_obstacle_points
-    A = np.matrix(np.zeros([max_num_constraints, 2*max_num_robots]))
-    b = np.matrix(np.zeros([max_num_constraints, 1]))
-    Os = np.matrix(np.zeros([2,max_num_robots]))
-    ps = np.matrix(np.zeros([2,max_num_robots]))
-    Ms = np.matrix(np.zeros([2,2*max_num_robots]))
+    qp_solver = create_qp_solver(solver)
+    constraints = None
 
     def robust_barriers(dxu, x, obstacles=np.empty(0)):
+        nonlocal constraints
 
-        num_robots = np.size(dxu[0,:])
+        start = time.perf_counter()
+        num_robots = dxu.shape[1]
+        obstacles, num_obstacles = _prepare_obstacles(obstacles, obstacle_neighbors)
+        if constraints is None or constraints.number_of_robots != num_robots or constraints.number_of_obstacles != num_obstacles:
+            constraints = _DifferentialDriveBarrierConstraints(num_robots, num_obstacles, D, projection_distance, wheel_vel_limit, obstacle_neighbors=obstacle_neighbors, obstacle_range=obstacle_range)
 
-        if obstacles.size != 0:
-            num_obstacles = np.size(obstacles[0,:])
-        else:
-            num_obstacles = 0
+        constraints.update(x, obstacles, barrier_gain, safety_radius, disturbance)
+        f = constraints.nominal_cost(dxu)
+        assembly_time = time.perf_counter() - start
+        vnew = qp_solver.solve(constraints.H, f, constraints.A, constraints.b)
 
-        if(num_robots < 2):
-            temp = 0
-        else:
-            temp = (num_robots**2-num_robots)//2
-
-
-        # Generate constraints for barrier certificates based on the size of the safety radius
-        num_constraints = temp + num_robots*num_obstacles
-        A[0:num_constraints, 0:2*num_robots] = 0
-        Os[0, 0:num_robots] = np.cos(x[2, :])
-        Os[1, 0:num_robots] = np.sin(x[2, :])
-        ps[:, 0:num_robots] = x[0:2, :] + projection_distance*Os[:, 0:num_robots]
-        # Ms Real Form
-        # Ms[0, 0:2*num_robots:2] = Os[0, 0:num_robots]
-        # Ms[0, 1:2*num_robots:2] = -projection_distance*Os[1, 0:num_robots]
-        # Ms[1, 1:2*num_robots:2] = projection_distance*Os[0, 0:num_robots]
-        # Ms[1, 0:2*num_robots:2] = Os[1, 0:num_robots]
-        # Flipped Ms to be able to perform desired matrix multiplication
-        Ms[0, 0:2*num_robots:2] = Os[0, 0:num_robots]
-        Ms[0, 1:2*num_robots:2] = Os[1, 0:num_robots]
-        Ms[1, 1:2*num_robots:2] = projection_distance*Os[0, 0:num_robots]
-        Ms[1, 0:2*num_robots:2] = -projection_distance*Os[1, 0:num_robots]
-        MDs  = (Ms.T * D).T
-        temp = np.copy(MDs[1, 0:2*num_robots:2])
-        MDs[1, 0:2*num_robots:2] =  MDs[0, 1:2*num_robots:2]
-        MDs[0, 1:2*num_robots:2] = temp
-
-        count = 0
-
-        for i in range(num_robots-1):
-            diffs = ps[:,i] - ps[:, i+1:num_robots]
-            hs = np.sum(np.square(diffs),0) - safety_radius**2 # 1 by N
-            h_dot_is = 2*diffs.T*MDs[:,(2*i, 2*i+1)] # N by 2
-            h_dot_js = np.matrix(np.zeros((2,num_robots - (i+1))))
-            h_dot_js[0, :] = -np.sum(2*np.multiply(diffs, MDs[:,2*(i+1):2*num_robots:2]), 0)
-            h_dot_js[1, :] = -np.sum(2*np.multiply(diffs, MDs[:,2*(i+1)+1:2*num_robots:2]), 0)
-            new_constraints = num_robots - i - 1
-            A[count:count+new_constraints, (2*i):(2*i+2)] = h_dot_is
-            A[range(count,count+new_constraints), range(2*(i+1),2*num_robots,2)] = h_dot_js[0,:]
-            A[range(count,count+new_constraints), range(2*(i+1)+1,2*num_robots,2)] = h_dot_js[1,:]
-            b[count:count+new_constraints] = -barrier_gain*(np.power(hs,3)).T - np.min(h_dot_is*disturb,1) - np.min(h_dot_js.T*disturb,1)
-            count += new_constraints
-
-        if obstacles.size != 0:
-            # Do obstacles
-            for i in range(num_robots):
-                diffs = (ps[:, i] - obstacles)
-                h = np.sum(np.square(diffs),0) - safety_radius**2
-                h_dot_i = 2*diffs.T*MDs[:,2*i:2*i+2]
-                A[count:count+num_obstacles,(2*i):(2*i+2)] = h_dot_i
-                b[count:count+num_obstacles] = -barrier_gain*(np.power(h,3)).T  - np.min(h_dot_i*disturb, 1)
-                count = count + num_obstacles
-
-        # Adding Upper Bounds On Wheels
-        A[count:count+2*num_robots,0:2*num_robots] = -np.eye(2*num_robots)
-        b[count:count+2*num_robots] = -wheel_vel_limit
-        count += 2*num_robots
-        # # Adding Lower Bounds on Wheels
-        A[count:count+2*num_robots,0:2*num_robots] = np.eye(2*num_robots)
-        b[count:count+2*num_robots] = -wheel_vel_limit
-        count += 2*num_robots
-
-        # Solve QP program generated earlier
-        L_all = np.kron(np.eye(num_robots), L)
-        dxu = np.linalg.inv(D)*dxu # Convert user input to differential drive
-        vhat = np.matrix(np.reshape(dxu ,(2*num_robots,1), order='F'))
-        H = 2*L_all.T*L_all
-        f = np.transpose(-2*np.transpose(vhat)*np.transpose(L_all)*L_all)
-
-        # Alternative Solver
-        #start = time.time()
-        #vnew2 = solvers.qp(matrix(H), matrix(f), -matrix(A[0:count,0:2*num_robots]), -matrix( b[0:count]))['x'] # , A, b) Omit last 2 arguments since our QP has no equality constraints
-        #print("Time Taken by cvxOpt: {} s".format(time.time() - start))
-
-        vnew = solver2.solve_qp(H, -np.squeeze(np.array(f)), A[0:count,0:2*num_robots].T, np.squeeze(np.array(b[0:count])))[0]
-        # Initial Guess for Solver at the Next Iteration
-        # vnew = quadprog(H, double(f), -A(1:num_constraints,1:2*num_robots), -b(1:num_constraints), [], [], -wheel_vel_limit*ones(2*num_robots,1), wheel_vel_limit*ones(2*num_robots,1), [], opts);
-        # Set robot velocities to new velocities
-        dxu = np.reshape(vnew, (2, num_robots), order='F')
-        dxu = D*dxu
+        start = time.perf_counter()
+        dxu_safe = constraints.wheel_to_unicycle(vnew)
+        if telemetry is not None:
+            _record_qp(telemetry, qp_solver, assembly_time, time.perf_counter() - start, constraints.b.size, dxu_safe - dxu)
 
-        return dxu
+        return dxu_safe
 
     return robust_barriers
 
 def create_unicycle_differential_drive_barrier_certificate_with_boundary(max_num_obstacle_points = 100, max_num_robots = 30, disturbance = 5, wheel_vel_limit = 12.5, base_length = 0.105, wheel_radius = 0.016,
-    projection_distance =0.05, barrier_gain = 150, safety_radius = 0.17, boundary_points = np.array([-1.6, 1.6, -1.0, 1.0])):
-    
+    projection_distance =0.05, barrier_gain = 150, safety_radius = 0.17, boundary_points = np.array([-1.6, 1.6, -1.0, 1.0]), solver = 'cvxopt', obstacle_neighbors = None, obstacle_range = np.inf, telemetry = None):
+    """Creates a robust differential drive barrier certificate, as
+    create_unicycle_differential_drive_barrier_certificate, that also keeps the robots
+    inside the boundary.
+
+    boundary_points: 1x4 numpy array (the [x_min, x_max, y_min, y_max] of the arena)
+
+    -> function (the barrier certificate function, called as f(dxu, x, obstacles), where obstacles is a 2xK numpy
+       array or an ObstacleIndex that can be updated between calls)
+    """
 
     D = np.array([[wheel_radius/2, wheel_radius/2], [-wheel_radius/base_length, wheel_radius/base_length]])
-    L = np.array([[1,0],[0,projection_distance]]).dot(D)
-    disturb = np.array([[-disturbance, -disturbance, disturbance, disturbance],[-disturbance, disturbance, disturbance, -disturbance]])
-    num_disturbs = disturb.shape[1]
 
-    max_num_constraints = (max_num_robots**2-max_num_robots)//2 + max_num_robots*max_num_obstacle_points
-    A = np.zeros([max_num_constraints, 2*max_num_robots])
-    b = np.zeros([max_num_constraints, 1])
-    Os = np.zeros([2,max_num_robots])
-    ps = np.zeros([2,max_num_robots])
-    Ms = np.zeros([2,2*max_num_robots])
+    qp_solver = create_qp_solver(solver)
+    constraints = None
 
     def robust_barriers(dxu, x, obstacles=np.empty(0)):
+        nonlocal constraints
 
-        num_robots = np.size(dxu[0,:])
+        start = time.perf_counter()
+        num_robots = dxu.shape[1]
+        obstacles, num_obstacles = _prepare_obstacles(obstacles, obstacle_neighbors)
+        if constraints is None or constraints.number_of_robots != num_robots or constraints.number_of_obstacles != num_obstacles:
+            constraints = _DifferentialDriveBarrierConstraints(num_robots, num_obstacles, D, projection_distance, wheel_vel_limit, boundary=True, obstacle_neighbors=obstacle_neighbors, obstacle_range=obstacle_range)
 
-        if obstacles.size != 0:
-            num_obstacles = np.size(obstacles[0,:])
-        else:
-            num_obstacles = 0
+        constraints.update(x, obstacles, barrier_gain, safety_radius, disturbance, boundary_points)
+        f = constraints.nominal_cost(dxu)
+        assembly_time = time.perf_counter() - start
+        vnew = qp_solver.solve(constraints.H, f, constraints.A, constraints.b)
+
+        start = time.perf_counter()
+        dxu_safe = constraints.wheel_to_unicycle(vnew)
+        if telemetry is not None:
+            _record_qp(telemetry, qp_solver, assembly_time, time.perf_counter() - start, constraints.b.size, dxu_safe - dxu)
+
+        return dxu_safe
+
+    return robust_barriers
+
+def create_robust_barriers(max_num_obstacles = 100, max_num_robots = 30, d = 5, wheel_vel_limit = 12.5, base_length = 0.105, wheel_radius = 0.016,
+    projection_distance =0.05, gamma = 150, safety_radius = 0.12, solver = 'quadprog', obstacle_neighbors = None, obstacle_range = np.inf, telemetry = None): # gamma was 150
+    """Creates a barrier certificate for differential drive robots that is robust to bounded
+    wheel velocity disturbances and keeps the robots away from obstacle points.  The QP is
+    solved over the wheel velocities.
+
+    max_num_obstacles, max_num_robots: int (unused, the constraints are sized from the inputs)
+    d: double (bound on the disturbance of every wheel velocity)
+    wheel_vel_limit: double (bound on the wheel velocities)
+    base_length: double (distance between the wheels)
+    wheel_radius: double (radius of the wheels)
+    projection_distance: double (how far ahead to place the bubble)
+    gamma: double (how fast the robots can approach each other)
+    safety_radius: double (how far apart the robots should stay)
+    solver: string or QPSolver (the QP solver, see create_qp_solver)
+    obstacle_neighbors: int (only this many nearest obstacle points of every robot are constrained.  All points are constrained if None)
+    obstacle_range: double (obstacle points farther than this from a robot are not constrained, used with obstacle_neighbors)
+    telemetry: BarrierTelemetry (records every call of the certificate, no telemetry if None)
+
+    -> function (the barrier certificate function, called as f(dxu, x, obstacles), where obstacles is a 2xK numpy
+       array or an ObstacleIndex that can be updated between calls)
+    """
+    D = np.array([[wheel_radius/2, wheel_radius/2], [-wheel_radius/base_length, wheel_radius/base_length]])
+
+    qp_solver = create_qp_solver(solver)
+    # Constraint matrices, rebuilt only when the number of robots or obstacle points
+    # changes.  max_num_obstacles and max_num_robots are no longer needed to size them.
+    constraints = None
+
+    def robust_barriers(dxu, x, obstacles):
+        nonlocal constraints
+
+        start = time.perf_counter()
+        num_robots = dxu.shape[1]
+        if num_robots == 0:
+            return []
+
+        # obstacles is a 2xK array, or an ObstacleIndex whose obstacle_neighbors nearest
+        # points within obstacle_range of every robot are constrained.
+        obstacles, num_obstacles = _prepare_obstacles(obstacles, obstacle_neighbors)
+        if constraints is None or constraints.number_of_robots != num_robots or constraints.number_of_obstacles != num_obstacles:
+            constraints = _DifferentialDriveBarrierConstraints(num_robots, num_obstacles, D, projection_distance, wheel_vel_limit, obstacle_neighbors=obstacle_neighbors, obstacle_range=obstacle_range)
+
+        constraints.update(x, obstacles, gamma, safety_radius, d)
+        f = constraints.nominal_cost(dxu)
+        assembly_time = time.perf_counter() - start
+        vnew = qp_solver.solve(constraints.H, f, constraints.A, constraints.b)
 
-        if(num_robots < 2):
-            temp = 0
-        else:
-            temp = (num_robots**2-num_robots)//2
-
-
-        # Generate constraints for barrier certificates based on the size of the safety radius
-        num_constraints = temp + num_robots*num_obstacles + 4*num_robots
-        A[0:num_constraints, 0:2*num_robots] = 0
-        Os[0, 0:num_robots] = np.cos(x[2, :])
-        Os[1, 0:num_robots] = np.sin(x[2, :])
-        ps[:, 0:num_robots] = x[:2, :] + projection_distance*Os[:, 0:num_robots]
-        Ms[0, 0:2*num_robots:2] = Os[0, 0:num_robots]
-        Ms[0, 1:2*num_robots:2] = -projection_distance*Os[1, 0:num_robots]
-        Ms[1, 1:2*num_robots:2] = projection_distance*Os[0, 0:num_robots]
-        Ms[1, 0:2*num_robots:2] = Os[1, 0:num_robots]
-        ret = np.zeros([1,temp])
-
-        count = 0
-
-        for i in range(num_robots-1):
-            for j in range(i+1, num_robots):
-                diff = ps[:, [i]] - ps[:, [j]]
-                h = np.sum(np.square(diff),0) - safety_radius**2
-                h_dot_i = 2*diff.T.dot(Ms[:, ((2*i), (2*i+1))].dot(D))
-                h_dot_j = -2*diff.T.dot(Ms[:, ((2*j), (2*j+1))].dot(D))
-                h_dot_i = np.reshape(h_dot_i, (1,2))
-                h_dot_j = np.reshape(h_dot_j, (1,2))
-                A[count, ((2*i), (2*i+1))]=h_dot_i
-                A[count, ((2*j), (2*j+1))]=h_dot_j
-                b[count] = -barrier_gain*(np.power(h,3))  - np.min(h_dot_i.dot(disturb), 1) - np.min(h_dot_j.dot(disturb), 1)
-                count += 1
-
-        if obstacles.size != 0:
-            # Do obstacles
-            for i in range(num_robots):
-                diffs = (ps[:, i] - obstacles)
-                h = np.sum(np.square(diff),0) - safety_radius**2
-                h_dot_i = 2*diffs*Ms[:, (2*i, 2*i+1)].dot(D)
-                A[count:count+num_obstacles, ((2*i),(2*i+1))] = h_dot_i
-                b[count:count+num_obstacles] = -barrier_gain*(np.power(h,3))  - np.min(h_dot_i.dot(disturb), 1)
-                count = count + num_obstacles
-
-        for k in range(num_robots):
-            #Pos Y
-            A[count, (2*k, 2*k+1)] = -Ms[1,(2*k,2*k+1)].dot(D)
-            b[count] = -0.4*barrier_gain*(boundary_points[3] - safety_radius/2 - ps[1,k])**3;
-            count += 1
-
-            #Neg Y
-            A[count, (2*k, 2*k+1)] = Ms[1,(2*k,2*k+1)].dot(D)
-            b[count] = -0.4*barrier_gain*(-boundary_points[2] - safety_radius/2 + ps[1,k])**3;
-            count += 1
-
-            #Pos X
-            A[count, (2*k, 2*k+1)] = -Ms[0,(2*k,2*k+1)].dot(D)
-            b[count] = -0.4*barrier_gain*(boundary_points[1] - safety_radius/2 - ps[0,k])**3;
-            count += 1
-
-            #Neg X
-            A[count, (2*k, 2*k+1)] = Ms[0,(2*k,2*k+1)].dot(D)
-            b[count] = -0.4*barrier_gain*(-boundary_points[0] - safety_radius/2 + ps[0,k])**3;
-            count += 1
-
-        # Adding Upper Bounds On Wheels
-        A[count:count+2*num_robots,0:2*num_robots] = -np.eye(2*num_robots)
-        b[count:count+2*num_robots] = -wheel_vel_limit
-        count += 2*num_robots
-        # # Adding Lower Bounds on Wheels
-        A[count:count+2*num_robots,0:2*num_robots] = np.eye(2*num_robots)
-        b[count:count+2*num_robots] = -wheel_vel_limit
-        count += 2*num_robots
-
-        # Solve QP program generated earlier
-        L_all = np.kron(np.eye(num_robots), L)
-        dxu = np.linalg.inv(D).dot(dxu) # Convert user input to differential drive
-        vhat = np.reshape(dxu ,(2*num_robots,1), order='F')
-        H = 2*L_all.T.dot(L_all)
-        f = -2*vhat.T.dot(L_all.T.dot(L_all))
-
-        # Alternative Solver
-        #start = time.time()
-        vnew = qp(matrix(H), matrix(f.T), -matrix(A[0:count,0:2*num_robots]), -matrix( b[0:count]))['x'] # , A, b) Omit last 2 arguments since our QP has no equality constraints
-        #print("Time Taken by cvxOpt: {} s".format(time.time() - start))
-
-        # vnew = solver2.solve_qp(H, np.float64(f), -A[0:count,0:2*num_robots], -np.array(b[0:count]))[0]
-        # Initial Guess for Solver at the Next Iteration
-        # vnew = quadprog(H, double(f), -A(1:num_constraints,1:2*num_robots), -b(1:num_constraints), [], [], -wheel_vel_limit*ones(2*num_robots,1), wheel_vel_limit*ones(2*num_robots,1), [], opts);
         # Set robot velocities to new velocities
-        dxu = np.reshape(vnew, (2, -1), order='F')
-        dxu = D.dot(dxu)
+        start = time.perf_counter()
+        dxu_safe = constraints.wheel_to_unicycle(vnew)
+        if telemetry is not None:
+            _record_qp(telemetry, qp_solver, assembly_time, time.perf_counter() - start, constraints.b.size, dxu_safe - dxu)
 
-        return dxu
+        return dxu_safe
 
     return robust_barriers
@@ -128,32 +128,57 @@ def create_clf_unicycle_pose_controller(approach_angle_gain=1, desired_angle_gai
     -> function
     """
 
+    #Check user input types
+    assert isinstance(approach_angle_gain, (int, float)), "In the function create_clf_unicycle_pose_controller, the approach angle gain (approach_angle_gain) must be an integer or float. Recieved type %r." % type(approach_angle_gain).__name__
+    assert isinstance(desired_angle_gain, (int, float)), "In the function create_clf_unicycle_pose_controller, the desired angle gain (desired_angle_gain) must be an integer or float. Recieved type %r." % type(desired_angle_gain).__name__
+    assert isinstance(rotation_error_gain, (int, float)), "In the function create_clf_unicycle_pose_controller, the rotation error gain (rotation_error_gain) must be an integer or float. Recieved type %r." % type(rotation_error_gain).__name__
+
     gamma = approach_angle_gain
     k = desired_angle_gain
     h = rotation_error_gain
 
-    def R(theta):
-        return np.array([[np.cos(theta), -np.sin(theta)],[np.sin(theta),np.cos(theta)]])
-
-    def pose_uni_clf_controller(states, poses):
-
-        N_states = states.shape[1]
-        dxu = np.zeros((2,N_states))
-
-        for i in range(N_states):
-            translate = R(-poses[2,i]).dot((poses[:2,i]-states[:2,i]))
-            e = np.linalg.norm(translate)
-            theta = np.arctan2(translate[1],translate[0])
-            alpha = theta - (states[2,i]-poses[2,i])
-            alpha = np.arctan2(np.sin(alpha),np.cos(alpha))
+    def pose_uni_clf_controller(states, poses, out=None):
+        """
+        states: 3xN numpy array (of unicycle states, [x;y;theta])
+        poses: 3xN numpy array (of desired poses, [x_goal;y_goal;theta_goal])
+        out: 2xN numpy array (optional, receives the control inputs instead of a new array)
 
-            ca = np.cos(alpha)
-            sa = np.sin(alpha)
+        -> 2xN numpy array (of unicycle control inputs)
+        """
 
-            dxu[0,i] = gamma* e* ca
-            dxu[1,i] = k*alpha + gamma*((ca*sa)/alpha)*(alpha + h*theta)
+        #Check user input types
+        assert isinstance(states, np.ndarray), "In the function created by the create_clf_unicycle_pose_controller function, the unicycle robot states (states) must be a numpy array. Recieved type %r." % type(states).__name__
+        assert isinstance(poses, np.ndarray), "In the function created by the create_clf_unicycle_pose_controller function, the robot goal poses (poses) must be a numpy array. Recieved type %r." % type(poses).__name__
 
-        return dxu
+        #Check user input ranges/sizes
+        assert states.shape[0] == 3, "In the function created by the create_clf_unicycle_pose_controller function, the dimension of the unicycle robot states (states) must be 3 ([x;y;theta]). Recieved dimension %r." % states.shape[0]
+        assert poses.shape[0] == 3, "In the function created by the create_clf_unicycle_pose_controller function, the dimension of the robot goal poses (poses) must be 3 ([x_goal;y_goal;theta_goal]). Recieved dimension %r." % poses.shape[0]
+        assert states.shape[1] == poses.shape[1], "In the function created by the create_clf_unicycle_pose_controller function, the number of unicycle robot states (states) must be equal to the number of robot goal poses (poses). Recieved a current robot pose input array (states) of size %r x %r and desired pose array (poses) of size %r x %r." % (states.shape[0], states.shape[1], poses.shape[0], poses.shape[1])
+        if out is not None:
+            assert isinstance(out, np.ndarray) and out.shape == (2, states.shape[1]), "In the function created by the create_clf_unicycle_pose_controller function, the output array (out) must be a 2xN numpy array. Recieved %r." % (out.shape if isinstance(out, np.ndarray) else type(out).__name__,)
+        else:
+            out = np.empty((2, states.shape[1]))
+
+        # Position error in the frame of the goal pose
+        c = np.cos(poses[2])
+        s = np.sin(poses[2])
+        dx = poses[0] - states[0]
+        dy = poses[1] - states[1]
+        tx = c*dx + s*dy
+        ty = c*dy - s*dx
+
+        e = np.hypot(tx, ty)
+        theta = np.arctan2(ty, tx)
+        alpha = theta - (states[2] - poses[2])
+        alpha = np.arctan2(np.sin(alpha), np.cos(alpha))
+
+        # sin(alpha)/alpha as sinc, which is 1 (instead of 0/0) at alpha = 0.
+        ca = np.cos(alpha)
+        np.multiply(gamma*e, ca, out=out[0])
+        np.multiply(gamma*ca*np.sinc(alpha/np.pi), alpha + h*theta, out=out[1])
+        out[1] += k*alpha
+
+        return out
 
     return pose_uni_clf_controller
 
@@ -171,40 +196,74 @@ def create_hybrid_unicycle_pose_controller(linear_velocity_gain=1, angular_veloc
     position_epsilon - the amount of translational distance that is allowed by the rotation before correcting position again.
     rotation_error - the error tolerance for the final orientation of the robot
 
+    The returned controller keeps the mode (approach or rotate) of every robot between calls, in its
+    approach_state attribute (N boolean array).  Its reset() method puts every robot back into the
+    approach mode.
+
+    -> function
     '''
 
-    si_to_uni_dyn = create_si_to_uni_dynamics(linear_velocity_gain=linear_velocity_gain, angular_velocity_limit=angular_velocity_limit)
+    return _HybridUnicyclePoseController(linear_velocity_gain, angular_velocity_gain, velocity_magnitude_limit, angular_velocity_limit, position_error, position_epsilon, rotation_error)
+
+class _HybridUnicyclePoseController:
+    # The controller returned by create_hybrid_unicycle_pose_controller.  Every robot is
+    # either approaching its goal position (driving straight to it) or rotating to its
+    # goal orientation, and the modes are kept in approach_state between calls.  A robot
+    # switches to rotating once it is within position_error - position_epsilon of its
+    # goal, and back to approaching once it is pushed more than position_error away.
+    # Both modes are computed for all robots at once and selected with masks.
+
+    def __init__(self, linear_velocity_gain, angular_velocity_gain, velocity_magnitude_limit, angular_velocity_limit, position_error, position_epsilon, rotation_error):
+        self.angular_velocity_gain = angular_velocity_gain
+        self.velocity_magnitude_limit = velocity_magnitude_limit
+        self.position_error = position_error
+        self.position_epsilon = position_epsilon
+        self.rotation_error = rotation_error
+        self.si_to_uni_dyn = create_si_to_uni_dynamics(linear_velocity_gain=linear_velocity_gain, angular_velocity_limit=angular_velocity_limit)
+        self.approach_state = np.ones(0, dtype=bool)
+
+    def reset(self):
+        """Puts every robot back into the approach mode."""
+        self.approach_state[:] = True
+
+    def __call__(self, states, poses):
+        """
+        states: 3xN numpy array (of unicycle states, [x;y;theta])
+        poses: 3xN numpy array (of desired poses, [x_goal;y_goal;theta_goal])
+
+        -> 2xN numpy array (of unicycle control inputs)
+        """
+
+        #Check user input types
+        assert isinstance(states, np.ndarray), "In the function created by the create_hybrid_unicycle_pose_controller function, the unicycle robot states (states) must be a numpy array. Recieved type %r." % type(states).__name__
+        assert isinstance(poses, np.ndarray), "In the function created by the create_hybrid_unicycle_pose_controller function, the robot goal poses (poses) must be a numpy array. Recieved type %r." % type(poses).__name__
+
+        #Check user input ranges/sizes
+        assert states.shape[0] == 3, "In the function created by the create_hybrid_unicycle_pose_controller function, the dimension of the unicycle robot states (states) must be 3 ([x;y;theta]). Recieved dimension %r." % states.shape[0]
+        assert poses.shape[0] == 3, "In the function created by the create_hybrid_unicycle_pose_controller function, the dimension of the robot goal poses (poses) must be 3 ([x_goal;y_goal;theta_goal]). Recieved dimension %r." % poses.shape[0]
+        assert states.shape[1] == poses.shape[1], "In the function created by the create_hybrid_unicycle_pose_controller function, the number of unicycle robot states (states) must be equal to the number of robot goal poses (poses). Recieved a current robot pose input array (states) of size %r x %r and desired pose array (poses) of size %r x %r." % (states.shape[0], states.shape[1], poses.shape[0], poses.shape[1])
 
-    def pose_uni_hybrid_controller(states, poses, approach_state = np.empty([0,0])):
-        N=states.shape[1]
-        dxu = np.zeros((2,N))
+        N = states.shape[1]
+        if self.approach_state.size != N:
+            self.approach_state = np.ones(N, dtype=bool)
 
-        #This is essentially a hack since default arguments are evaluated only once we will mutate it with each call
-        if approach_state.shape[1] != N: 
-            approach_state = np.ones((1,N))[0]
+        wrapped = poses[2] - states[2]
+        wrapped = np.arctan2(np.sin(wrapped), np.cos(wrapped))
 
-        for i in range(N):
-            wrapped = poses[2,i] - states[2,i]
-            wrapped = np.arctan2(np.sin(wrapped),np.cos(wrapped))
+        dxi = poses[:2] - states[:2]
+        norms = np.hypot(dxi[0], dxi[1])
 
-            dxi = poses[:2,[i]] - states[:2,[i]]
+        # Approach: drive straight to the goal position at a limited speed
+        approaching = self.approach_state & (norms > (self.position_error - self.position_epsilon))
+        too_fast = norms > self.velocity_magnitude_limit
+        dxi[:, too_fast] *= self.velocity_magnitude_limit/norms[too_fast]
+        dxu = self.si_to_uni_dyn(dxi, states)
 
-            #Normalize Vector
-            norm_ = np.linalg.norm(dxi)
+        # Rotate: turn in place to the goal orientation, or stop once it is reached
+        rotating = ~approaching
+        dxu[0, rotating] = 0
+        dxu[1, rotating] = np.where(np.absolute(wrapped[rotating]) > self.rotation_error, self.angular_velocity_gain*wrapped[rotating], 0)
 
-            if(norm_ > (position_error - position_epsilon) and approach_state[i]):
-                if(norm_ > velocity_magnitude_limit):
-                    dxi = velocity_magnitude_limit*dxi/norm_
-                dxu[:,[i]] = si_to_uni_dyn(dxi, states[:,[i]])
-            elif(np.absolute(wrapped) > rotation_error):
-                approach_state[i] = 0
-                if(norm_ > position_error):
-                    approach_state = 1
-                dxu[0,i] = 0
-                dxu[1,i] = angular_velocity_gain*wrapped
-            else:
-                dxu[:,[i]] = np.zeros((2,1))
+        self.approach_state = approaching | (norms > self.position_error)
 
         return dxu
-
-    return pose_uni_hybrid_controller
@@ -1,68 +1,94 @@
 import numpy as np
+import scipy.sparse as sparse
 
-def cycle_GL(N):
+from rps.utilities.spatial import pairs_within
+
+def cycle_GL(N, csr=False):
     """ Generates a graph Laplacian for a cycle graph
 
     N: int (number of agents)
+    csr: bool (whether to return a scipy.sparse CSR matrix instead of a numpy array)
 
-    -> NxN numpy array (representing the graph Laplacian)
+    -> NxN numpy array or scipy.sparse CSR matrix (representing the graph Laplacian)
     """
     #Check user input types
     assert isinstance(N, int), "In the cycle_GL function, the number of nodes (N) must be an integer. Recieved type %r." % type(N).__name__
+    assert isinstance(csr, bool), "In the cycle_GL function, the sparse output flag (csr) must be boolean type. Recieved type %r." % type(csr).__name__
     #Check user input ranges/sizes
     assert N > 0, "In the cycle_GL function, number of nodes (N) must be positive. Recieved %r." % N
 
     ones = np.ones(N-1)
+    if csr:
+        L = sparse.diags([-ones, 2*np.ones(N), -ones], [-1, 0, 1], format='lil')
+        L[N-1, 0] = -1
+        L[0, N-1] = -1
+        return L.tocsr()
+
     L = 2*np.identity(N) - np.diag(ones, 1) - np.diag(ones, -1)
     L[N-1, 0] = -1
     L[0, N-1] = -1
 
     return L
 
-def lineGL(N):
+def lineGL(N, csr=False):
     """ Generates a graph Laplacian for a line graph
 
     N: int (number of agents)
+    csr: bool (whether to return a scipy.sparse CSR matrix instead of a numpy array)
 
-    -> NxN numpy array (representing the graph Laplacian)
+    -> NxN numpy array or scipy.sparse CSR matrix (representing the graph Laplacian)
     """
     #Check user input types
     assert isinstance(N, int), "In the lineGL function, the number of nodes (N) must be an integer. Recieved type %r." % type(N).__name__
+    assert isinstance(csr, bool), "In the lineGL function, the sparse output flag (csr) must be boolean type. Recieved type %r." % type(csr).__name__
     #Check user input ranges/sizes
     assert N > 0, "In the lineGL function, number of nodes (N) must be positive. Recieved %r." % N
 
     ones = np.ones(N-1)
+    if csr:
+        L = sparse.diags([-ones, 2*np.ones(N), -ones], [-1, 0, 1], format='lil')
+        L[0, 0] = 1
+        L[N-1, N-1] = 1
+        return L.tocsr()
+
     L = 2*np.identity(N) - np.diag(ones, 1) - np.diag(ones, -1)
     L[0,0] = 1
     L[N-1,N-1] = 1
 
     return L
 
-def completeGL(N):
+def completeGL(N, csr=False):
     """ Generates a graph Laplacian for a complete graph
 
     N: int (number of agents)
+    csr: bool (whether to return a scipy.sparse CSR matrix instead of a numpy array)
 
-    -> NxN numpy array (representing the graph Laplacian)
+    -> NxN numpy array or scipy.sparse CSR matrix (representing the graph Laplacian)
     """
 
     #Check user input types
     assert isinstance(N, int), "In the completeGL function, the number of nodes (N) must be an integer. Recieved type %r." % type(N).__name__
+    assert isinstance(csr, bool), "In the completeGL function, the sparse output flag (csr) must be boolean type. Recieved type %r." % type(csr).__name__
     #Check user input ranges/sizes
     assert N > 0, "In the completeGL function, number of nodes (N) must be positive. Recieved %r." % N
 
     L = N*np.identity(N)-np.ones((N,N))
 
-    return L
+    # A complete graph is dense anyway, the CSR matrix is only for interchangeability.
+    return sparse.csr_matrix(L) if csr else L
 
-def random_connectedGL(v, e):
+def random_connectedGL(v, e, csr=False):
     """ Generates a Laplacian for a random, connected graph with v verticies 
     and (v-1) + e edges.
 
     v: int (number of nodes)
     e: number of additional edges
+    csr: bool (whether to return a scipy.sparse CSR matrix instead of a numpy array)
 
-    -> vxv numpy array (representing the graph Laplacian)
+    The CSR graph is drawn without enumerating all vxv node pairs, so it scales to thousands of
+    nodes.  It is drawn differently from the dense one, so the same seed gives different graphs.
+
+    -> vxv numpy array or scipy.sparse CSR matrix (representing the graph Laplacian)
     """
 
     #Check user input types
@@ -72,6 +98,12 @@ def random_connectedGL(v, e):
     assert v > 0, "In the random_connectedGL function, number of verticies (v) must be positive. Recieved %r." % v
     assert e >= 0, "In the random_connectedGL function, number of additional edges (e) must be greater than or equal to zero. Recieved %r." % e
 
+    if csr:
+        # A random tree (every node attached to an earlier one), plus e random extra edges
+        i = np.arange(1, v)
+        j = (np.random.random(v-1)*i).astype(int)
+        extra_i, extra_j = _random_edges(v, e, np.minimum(i, j)*v + np.maximum(i, j))
+        return _sparse_laplacian(v, np.concatenate((i, extra_i)), np.concatenate((j, extra_j)))
 
     L = np.zeros((v,v))
 
@@ -111,16 +143,24 @@ def random_connectedGL(v, e):
 
     return L
 
-def randomGL(v, e):
+def randomGL(v, e, csr=False):
     """ Generates a Laplacian for a random graph with v verticies 
     and e edges.
 
     v: int (number of nodes)
     e: number of additional edges
+    csr: bool (whether to return a scipy.sparse CSR matrix instead of a numpy array)
+
+    The CSR graph is drawn without enumerating all vxv node pairs, so it scales to thousands of
+    nodes.  It is drawn differently from the dense one, so the same seed gives different graphs.
 
-    -> vxv numpy array (representing the graph Laplacian)
+    -> vxv numpy array or scipy.sparse CSR matrix (representing the graph Laplacian)
     """
 
+    if csr:
+        i, j = _random_edges(v, e, np.zeros(0, dtype=int))
+        return _sparse_laplacian(v, i, j)
+
     L = np.tril(np.ones((v,v)))
 
     #This works because you can't select diagonals
@@ -144,27 +184,109 @@ def randomGL(v, e):
 
     return L
 
+def _random_edges(v, e, existing):
+    # Draws min(e, number of free node pairs) distinct edges between v nodes that are not
+    # among the existing edges (encoded as i*v + j with i < j).  Node pairs are drawn in
+    # batches and duplicates are rejected, which is fast as long as most pairs are free.
+    # Returns (i, j) with i < j.
+    existing = np.unique(existing)
+    free = v*(v-1)//2 - existing.size
+    e = min(e, free)
+    if 2*e > free:
+        # Most pairs are taken, so the graph is dense anyway and the pairs can be enumerated
+        i, j = np.triu_indices(v, 1)
+        keys = i*v + j
+        keys = np.random.permutation(keys[~np.isin(keys, existing)])[:e]
+        return keys // v, keys % v
+
+    keys = np.zeros(0, dtype=int)
+    while keys.size < e:
+        n = 2*(e - keys.size) + 16
+        i = np.random.randint(v, size=n)
+        j = np.random.randint(v, size=n)
+        drawn = np.minimum(i, j)*v + np.maximum(i, j)
+        drawn = drawn[i != j]
+        drawn = drawn[~np.isin(drawn, existing) & ~np.isin(drawn, keys)]
+        # Keep the first occurrence of every new pair, in the order drawn
+        _, first = np.unique(drawn, return_index=True)
+        keys = np.concatenate((keys, drawn[np.sort(first)][:e - keys.size]))
+
+    return keys // v, keys % v
+
+def _sparse_laplacian(N, i, j):
+    # The NxN CSR Laplacian L = D - A of the undirected graph with the (distinct) edges i - j.
+    A = sparse.coo_matrix((np.ones(2*i.size), (np.concatenate((i, j)), np.concatenate((j, i)))), shape=(N, N)).tocsr()
+    return (sparse.diags(np.asarray(A.sum(axis=1)).ravel()) - A).tocsr()
 
 def topological_neighbors(L, agent):
-    """ Returns the neighbors of a particular agent using the graph Laplacian
+    """ Returns the neighbors of a particular agent using the graph Laplacian.  L is not
+    modified.  To look up the neighbors of many agents, build an AdjacencyIndex once instead.
 
-    L: NxN numpy array (representing the graph Laplacian)
+    L: NxN numpy array or scipy.sparse matrix (representing the graph Laplacian)
     agent: int (agent: 0 - N-1)
 
     -> 1xM numpy array (with M neighbors)
     """
     #Check user input types
-    assert isinstance(L, np.ndarray), "In the topological_neighbors function, the graph Laplacian (L) must be a numpy ndarray. Recieved type %r." % type(L).__name__
+    assert isinstance(L, np.ndarray) or sparse.issparse(L), "In the topological_neighbors function, the graph Laplacian (L) must be a numpy ndarray or a scipy.sparse matrix. Recieved type %r." % type(L).__name__
     assert isinstance(agent, int), "In the topological_neighbors function, the agent number (agent) must be an integer. Recieved type %r." % type(agent).__name__
     
     #Check user input ranges/sizes
     assert agent >= 0, "In the topological_neighbors function, the agent number (agent) must be greater than or equal to zero. Recieved %r." % agent
     assert agent <= L.shape[0], "In the topological_neighbors function, the agent number (agent) must be within the dimension of the provided Laplacian (L). Recieved agent number %r and Laplactian size %r by %r." % (agent, L.shape[0], L.shape[1])
 
-    row = L[agent, :]
-    row[agent]=0
+    if sparse.issparse(L):
+        # A copy of the row in canonical CSR form (summed duplicates, sorted indices), so the
+        # neighbors come out in the same order as from a dense Laplacian.
+        row = sparse.csr_matrix(L)[agent, :]
+        row.sum_duplicates()
+        neighbors = row.indices[row.data != 0]
+    else:
+        neighbors = np.flatnonzero(L[agent, :])
     # Since L = D - A
-    return np.where(row != 0)[0]
+    return neighbors[neighbors != agent]
+
+class AdjacencyIndex:
+    """The neighbors of every agent of a graph, stored once in CSR form so that looking up
+    the neighbors of an agent takes O(degree) time.  Built from a graph Laplacian (or any
+    matrix whose off-diagonal nonzeros are the edges), which is not modified.
+
+    degrees: N numpy array (number of neighbors of every agent)
+    """
+
+    def __init__(self, L):
+        """
+        L: NxN numpy array or scipy.sparse matrix (representing the graph Laplacian)
+        """
+
+        #Check user input types
+        assert isinstance(L, np.ndarray) or sparse.issparse(L), "In the AdjacencyIndex class, the graph Laplacian (L) must be a numpy ndarray or a scipy.sparse matrix. Recieved type %r." % type(L).__name__
+
+        #Check user input ranges/sizes
+        assert L.ndim == 2 and L.shape[0] == L.shape[1], "In the AdjacencyIndex class, the graph Laplacian (L) must be a square matrix. Recieved a matrix of size %r." % (L.shape,)
+
+        A = sparse.csr_matrix(L, copy=True)
+        A.setdiag(0)
+        A.eliminate_zeros()
+        A.sort_indices()
+
+        self._indptr = A.indptr
+        self._indices = A.indices
+        # The returned neighbor arrays are views of the index
+        self._indices.flags.writeable = False
+        self.degrees = np.diff(A.indptr)
+
+    def __len__(self):
+        return self.degrees.size
+
+    def neighbors(self, agent):
+        """Returns the neighbors of an agent, as a read-only view into the index.
+
+        agent: int (agent: 0 - N-1)
+
+        -> 1xM numpy array (with M neighbors)
+        """
+        return self._indices[self._indptr[agent]:self._indptr[agent+1]]
 
 def delta_disk_neighbors(poses, agent, delta):
     ''' Returns the agents within the 2-norm of the supplied agent (not including the agent itself)
@@ -187,9 +309,30 @@ def delta_disk_neighbors(poses, agent, delta):
 
 
 
+    diffs = poses[:2, :] - poses[:2, agent, None]
+    within_distance = np.sum(diffs*diffs, axis=0) <= delta*delta
+    within_distance[agent] = False
+    return np.nonzero(within_distance)[0]
+
+def delta_disk_adjacency(poses, delta):
+    ''' Returns the adjacency matrix of the delta disk graph of all agents at once.  Agents are
+    bucketed into a spatial grid, so this scales to thousands of agents.
+    poses: 3xN numpy array (representing the unicycle states of the robots)
+    delta: float (radius of delta disk considered)
+
+    -> NxN scipy.sparse CSR matrix (symmetric, with ones between agents within delta of each other)
+
+    '''
+    #Check user input types
+    assert isinstance(poses, np.ndarray), "In the delta_disk_adjacency function, the robot poses (poses) must be a numpy ndarray. Recieved type %r." % type(poses).__name__
+    assert isinstance(delta, (int,float)), "In the delta_disk_adjacency function, the sensing/communication radius (delta) must be an integer or float. Recieved type %r." % type(delta).__name__
+
+    #Check user input ranges/sizes
+    assert delta > 0, "In the delta_disk_adjacency function, the sensing/communication radius (delta) must be positive. Recieved %r." % delta
+
     N = poses.shape[1]
-    agents = np.arange(N)
+    i, j = pairs_within(poses[:2, :], delta)
+    rows = np.concatenate((i, j))
+    cols = np.concatenate((j, i))
 
-    within_distance = [np.linalg.norm(poses[:2,x]-poses[:2,agent])<=delta for x in agents]
-    within_distance[agent] = False
-    return agents[within_distance]
\ No newline at end of file
+    return sparse.csr_matrix((np.ones(rows.size), (rows, cols)), shape=(N, N))
\ No newline at end of file
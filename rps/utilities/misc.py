@@ -1,5 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 def generate_initial_conditions(N, spacing=0.3, width=3, height=1.8):
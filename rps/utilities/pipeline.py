@@ -0,0 +1,170 @@
+import time
+
+import numpy as np
+
+# A fused unicycle control pipeline.  Most experiments compute their velocities with the
+# same chain of stages every step:
+#
+#   uni_to_si_states -> si position controller -> barrier certificate -> si_to_uni_dyn
+#
+# ControlPipeline wires these stages together once for a fixed number of robots.  Inputs
+# are validated when the pipeline is created, and every step runs the stages on
+# preallocated buffers without revalidating or allocating (apart from whatever the
+# barrier certificate allocates itself).
+
+class ControlPipeline:
+    """Computes unicycle velocities that drive N robots to goal points.  Every call runs the
+    stages
+
+    states: projects the unicycle poses to single integrator points, projection_distance in
+            front of the robots (as uni_to_si_states of create_si_to_uni_mapping)
+    controller: proportional single integrator position controller with a magnitude limit (as
+            create_si_position_controller), or the given position_controller
+    barrier: the given barrier_certificate, skipped if there is none
+    dynamics: maps the single integrator velocities to unicycle velocities, either with the
+            projection of create_si_to_uni_mapping (dynamics='projection') or by turning
+            towards them as create_si_to_uni_dynamics (dynamics='turn')
+
+    Both the states and the dynamics stage use the same cosines and sines of the headings.
+    The time spent in every stage is added up in stage_times (stage name -> seconds), over
+    calls calls.
+    """
+
+    STAGES = ('states', 'controller', 'barrier', 'dynamics')
+
+    def __init__(self, number_of_robots, x_velocity_gain=1, y_velocity_gain=1, velocity_magnitude_limit=0.15, barrier_certificate=None,
+                 position_controller=None, projection_distance=0.05, dynamics='projection', linear_velocity_gain=1, angular_velocity_limit=np.pi):
+        """
+        number_of_robots: int (number of robots N)
+        x_velocity_gain: double (gain of the x velocity of the position controller)
+        y_velocity_gain: double (gain of the y velocity of the position controller)
+        velocity_magnitude_limit: double (maximum magnitude of the single integrator velocities of the position controller)
+        barrier_certificate: function (optional, a single integrator barrier certificate taking 2xN velocities and 2xN states)
+        position_controller: function (optional, replaces the proportional position controller, takes 2xN states and 2xN goal points)
+        projection_distance: double (distance of the single integrator points in front of the robots, 0 uses the robot positions)
+        dynamics: string ('projection' or 'turn', the single integrator to unicycle mapping)
+        linear_velocity_gain: double (gain of the linear velocity of the 'turn' mapping)
+        angular_velocity_limit: double (maximum magnitude of the angular velocities)
+        """
+
+        #Check user input types
+        assert isinstance(number_of_robots, int), "In the ControlPipeline class, the number of robots (number_of_robots) must be an integer. Recieved type %r." % type(number_of_robots).__name__
+        assert isinstance(x_velocity_gain, (int, float)), "In the ControlPipeline class, the x linear velocity gain (x_velocity_gain) must be an integer or float. Recieved type %r." % type(x_velocity_gain).__name__
+        assert isinstance(y_velocity_gain, (int, float)), "In the ControlPipeline class, the y linear velocity gain (y_velocity_gain) must be an integer or float. Recieved type %r." % type(y_velocity_gain).__name__
+        assert isinstance(velocity_magnitude_limit, (int, float)), "In the ControlPipeline class, the velocity magnitude limit (velocity_magnitude_limit) must be an integer or float. Recieved type %r." % type(velocity_magnitude_limit).__name__
+        assert barrier_certificate is None or callable(barrier_certificate), "In the ControlPipeline class, the barrier certificate (barrier_certificate) must be a function. Recieved type %r." % type(barrier_certificate).__name__
+        assert position_controller is None or callable(position_controller), "In the ControlPipeline class, the position controller (position_controller) must be a function. Recieved type %r." % type(position_controller).__name__
+        assert isinstance(projection_distance, (int, float)), "In the ControlPipeline class, the projection distance (projection_distance) must be an integer or float. Recieved type %r." % type(projection_distance).__name__
+        assert isinstance(linear_velocity_gain, (int, float)), "In the ControlPipeline class, the linear velocity gain (linear_velocity_gain) must be an integer or float. Recieved type %r." % type(linear_velocity_gain).__name__
+        assert isinstance(angular_velocity_limit, (int, float)), "In the ControlPipeline class, the angular velocity limit (angular_velocity_limit) must be an integer or float. Recieved type %r." % type(angular_velocity_limit).__name__
+
+        #Check user input ranges/sizes
+        assert number_of_robots > 0, "In the ControlPipeline class, the number of robots (number_of_robots) must be positive. Recieved %r." % number_of_robots
+        assert x_velocity_gain > 0, "In the ControlPipeline class, the x linear velocity gain (x_velocity_gain) must be positive. Recieved %r." % x_velocity_gain
+        assert y_velocity_gain > 0, "In the ControlPipeline class, the y linear velocity gain (y_velocity_gain) must be positive. Recieved %r." % y_velocity_gain
+        assert velocity_magnitude_limit >= 0, "In the ControlPipeline class, the velocity magnitude limit (velocity_magnitude_limit) must not be negative. Recieved %r." % velocity_magnitude_limit
+        assert projection_distance >= 0, "In the ControlPipeline class, the projection distance (projection_distance) must not be negative. Recieved %r." % projection_distance
+        assert dynamics in ('projection', 'turn'), "In the ControlPipeline class, the mapping to unicycle dynamics (dynamics) must be 'projection' or 'turn'. Recieved %r." % (dynamics,)
+        assert dynamics != 'projection' or projection_distance > 0, "In the ControlPipeline class, the 'projection' mapping to unicycle dynamics requires a positive projection distance (projection_distance). Recieved %r." % projection_distance
+        assert linear_velocity_gain > 0, "In the ControlPipeline class, the linear velocity gain (linear_velocity_gain) must be positive. Recieved %r." % linear_velocity_gain
+        assert angular_velocity_limit >= 0, "In the ControlPipeline class, the angular velocity limit (angular_velocity_limit) must not be negative. Recieved %r." % angular_velocity_limit
+
+        N = number_of_robots
+        self.number_of_robots = N
+        self.velocity_magnitude_limit = velocity_magnitude_limit
+        self.barrier_certificate = barrier_certificate
+        self.position_controller = position_controller
+        self.projection_distance = projection_distance
+        self.dynamics = dynamics
+        self.linear_velocity_gain = linear_velocity_gain
+        self.angular_velocity_limit = angular_velocity_limit
+
+        # Lower bound of the velocity norms, keeps a zero limit from dividing by zero
+        self._norm_floor = max(velocity_magnitude_limit, np.finfo(float).tiny)
+        self._gain = np.array([[x_velocity_gain], [y_velocity_gain]], dtype=float)
+        self._cs = np.zeros((2, N))
+        self._tmp = np.zeros(N)
+        self.si_states = np.zeros((2, N))
+        self.dxi = np.zeros((2, N))
+        self.dxu = np.zeros((2, N))
+
+        self.reset_timing()
+
+    def reset_timing(self):
+        """Sets the stage times and the number of calls to zero."""
+        self.stage_times = dict.fromkeys(self.STAGES, 0.0)
+        self.calls = 0
+
+    def __call__(self, poses, goal_points):
+        """Computes the unicycle velocities.  The inputs are not checked (see __init__).  The
+        returned array is a buffer of the pipeline, so it is overwritten by the next call (copy it
+        to keep it).  The single integrator states and velocities of the call are left in the
+        si_states and dxi attributes.
+
+        poses: 3xN numpy array (of unicycle states, [x;y;theta])
+        goal_points: 2xN numpy array (of desired points, [x_goal;y_goal])
+
+        -> 2xN numpy array (of unicycle control inputs)
+        """
+
+        cs = self._cs
+        tmp = self._tmp
+        si = self.si_states
+        dxi = self.dxi
+        dxu = self.dxu
+        times = self.stage_times
+
+        t0 = time.perf_counter()
+
+        # States
+        np.cos(poses[2], out=cs[0])
+        np.sin(poses[2], out=cs[1])
+        np.multiply(cs, self.projection_distance, out=si)
+        si += poses[:2]
+
+        t1 = time.perf_counter()
+
+        # Controller
+        if self.position_controller is None:
+            np.subtract(goal_points[:2], si, out=dxi)
+            dxi *= self._gain
+            # Scale the velocities above the limit down to it
+            np.hypot(dxi[0], dxi[1], out=tmp)
+            np.maximum(tmp, self._norm_floor, out=tmp)
+            np.divide(self.velocity_magnitude_limit, tmp, out=tmp)
+            dxi *= tmp
+        else:
+            np.copyto(dxi, self.position_controller(si, goal_points[:2]))
+
+        t2 = time.perf_counter()
+
+        # Barrier
+        if self.barrier_certificate is not None:
+            np.copyto(dxi, self.barrier_certificate(dxi, si))
+
+        t3 = time.perf_counter()
+
+        # Dynamics
+        np.multiply(cs[0], dxi[0], out=dxu[0])
+        np.multiply(cs[1], dxi[1], out=tmp)
+        dxu[0] += tmp
+        np.multiply(cs[0], dxi[1], out=dxu[1])
+        np.multiply(cs[1], dxi[0], out=tmp)
+        dxu[1] -= tmp
+        if self.dynamics == 'projection':
+            dxu[1] /= self.projection_distance
+            np.clip(dxu[1], -self.angular_velocity_limit, self.angular_velocity_limit, out=dxu[1])
+        else:
+            dxu[0] *= self.linear_velocity_gain
+            np.arctan2(dxu[1], dxu[0], out=dxu[1])
+            dxu[1] *= self.angular_velocity_limit/(np.pi/2)
+
+        t4 = time.perf_counter()
+
+        times['states'] += t1 - t0
+        times['controller'] += t2 - t1
+        times['barrier'] += t3 - t2
+        times['dynamics'] += t4 - t3
+        self.calls += 1
+
+        return dxu
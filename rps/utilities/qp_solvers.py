@@ -0,0 +1,541 @@
+import functools
+import itertools
+import time
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve
+from scipy.sparse import issparse
+
+from cvxopt import matrix, spmatrix
+from cvxopt.solvers import qp
+
+# QP solvers shared by the barrier certificates.  Every solver solves
+#
+#     minimize    1/2 x^T H x + f^T x
+#     subject to  A x <= b
+#
+# for a positive definite H, where H and A are numpy arrays or scipy.sparse matrices.
+# Solvers are objects so that they can warm start from their previous solution (where
+# the method allows it) and keep statistics about their solves.
+
+# Options of the cvxopt solver, tuned for speed over accuracy
+CVXOPT_DEFAULT_OPTIONS = {'show_progress': False, 'reltol': 1e-2, 'feastol': 1e-2, 'maxiters': 50}
+
+class QPSolver:
+    """Base class of the QP solvers.
+
+    Before running the solver, solve() checks whether the unconstrained minimum
+    -H^-1 f satisfies every constraint.  It is then the solution, and is returned without
+    running the solver.  For a barrier certificate this is the nominal input, and it is
+    the common case whenever robots are far apart.
+
+    Small QPs whose Hessian is a multiple of the identity, such as the single integrator
+    barrier QPs of 2 to 4 robots, are projections of the unconstrained minimum onto the
+    constraints.  Those with at most exact_max_constraints constraints are solved exactly
+    by trying every active set at once (see _project_onto_constraints), which is much
+    cheaper than setting up a general solver.  Set exact_max_constraints to 0 to always
+    run the solver.
+
+    After every call of solve() the following statistics are available:
+
+    solve_time: double (seconds the last solve took)
+    iterations: int (iterations of the last solve, 0 if it was skipped)
+    status: string ('optimal' or the reason the last solve stopped)
+    active_set: 1D integer numpy array (rows of A active at the last solution)
+    solves, total_solve_time, total_iterations: totals over all solves since reset()
+    skipped_solves: int (solves since reset() answered by the unconstrained minimum)
+    exact_solves: int (solves since reset() answered by the exact projection)
+    """
+
+    # Default size limit of the exact projection, 8 constraints means at most 255 active sets.
+    EXACT_MAX_CONSTRAINTS = 8
+
+    def __init__(self, warm_start=True):
+        """
+        warm_start: bool (whether to start every solve from the previous solution)
+        """
+        assert isinstance(warm_start, bool), "In the QPSolver class, the warm start flag (warm_start) must be boolean type. Recieved type %r." % type(warm_start).__name__
+
+        self.warm_start = warm_start
+        self.exact_max_constraints = self.EXACT_MAX_CONSTRAINTS
+        self.reset()
+
+    def reset(self):
+        """Forgets the previous solution and the statistics."""
+        self.solution = None
+        self.active_set = np.zeros(0, dtype=int)
+        self.solve_time = 0.0
+        self.iterations = 0
+        self.status = None
+        self.solves = 0
+        self.total_solve_time = 0.0
+        self.total_iterations = 0
+        self.skipped_solves = 0
+        self.exact_solves = 0
+
+    def solve(self, H, f, A, b):
+        """Solves the QP.
+
+        H: nxn numpy array or scipy.sparse matrix (positive definite Hessian)
+        f: length n numpy array (linear cost)
+        A: mxn numpy array or scipy.sparse matrix (constraint matrix)
+        b: length m numpy array (constraint bounds)
+
+        -> length n numpy array (the solution)
+        """
+        if not issparse(H):
+            H = np.asarray(H, dtype=float)
+        if not issparse(A):
+            A = np.asarray(A, dtype=float)
+        f = np.ravel(np.asarray(f, dtype=float))
+        b = np.ravel(np.asarray(b, dtype=float))
+
+        start = time.perf_counter()
+        x = -_hessian_solver(H)(f)
+        if np.all(A.dot(x) <= b):
+            iterations, active_set, status = 0, np.zeros(0, dtype=int), 'optimal'
+            self.skipped_solves += 1
+        else:
+            projection = None
+            if b.size <= self.exact_max_constraints and _is_scaled_identity(H):
+                projection = _project_onto_constraints(x, A.toarray() if issparse(A) else A, b)
+            if projection is not None:
+                x, active_set = projection
+                iterations, status = active_set.size, 'optimal'
+                self.exact_solves += 1
+            else:
+                x, iterations, active_set, status = self._solve(H, f, A, b)
+        self.solve_time = time.perf_counter() - start
+
+        self.solution = x
+        self.iterations = iterations
+        self.active_set = active_set
+        self.status = status
+        self.solves += 1
+        self.total_solve_time += self.solve_time
+        self.total_iterations += iterations
+
+        return x
+
+    def _solve(self, H, f, A, b):
+        # Returns (solution, iterations, active set, status).
+        raise NotImplementedError()
+
+class CvxoptQPSolver(QPSolver):
+    """Interior point solver of cvxopt.  Sparse matrices are passed to cvxopt as sparse
+    matrices.  The previous solution lies on the boundary of the feasible set, which is a
+    poor starting point for an interior point method, so warm starting has no effect.
+    """
+
+    def __init__(self, warm_start=True, options=None):
+        """
+        warm_start: bool (unused, see above)
+        options: dictionary (cvxopt solver options, on top of CVXOPT_DEFAULT_OPTIONS)
+        """
+        super().__init__(warm_start)
+        self.options = dict(CVXOPT_DEFAULT_OPTIONS)
+        if options is not None:
+            self.options.update(options)
+
+    def _solve(self, H, f, A, b):
+        result = qp(cvxopt_matrix(H), matrix(f), cvxopt_matrix(A), matrix(b), options=self.options)
+
+        s = np.ravel(result['s'])
+        z = np.ravel(result['z'])
+        return np.ravel(result['x']), result['iterations'], np.flatnonzero(z > s), result['status']
+
+class QuadprogQPSolver(QPSolver):
+    """Dual active set solver of quadprog (Goldfarb and Idnani).  Matrices are
+    converted to dense arrays.  quadprog always starts from the unconstrained minimum, so
+    warm starting has no effect.
+    """
+
+    def __init__(self, warm_start=True):
+        """
+        warm_start: bool (unused, quadprog cannot be warm started)
+        """
+        # quadprog is optional, only required when this solver is used.
+        import quadprog
+
+        super().__init__(warm_start)
+        self._quadprog = quadprog
+
+    def _solve(self, H, f, A, b):
+        if issparse(H):
+            H = H.toarray()
+        if issparse(A):
+            A = A.toarray()
+
+        # quadprog solves min 1/2 x^T G x - a^T x s.t. C^T x >= b
+        x, _, _, iterations, _, active = self._quadprog.solve_qp(H, -f, -A.T, -b)
+        return x, int(iterations[0]), np.sort(active[active > 0] - 1), 'optimal'
+
+class ActiveSetQPSolver(QPSolver):
+    """Pure NumPy active set solver.  It solves the dual of the QP, a QP over the
+    non-negative constraint multipliers, with a Lawson-Hanson style active set method, so
+    it does not need a feasible starting point.  Only the constraints in the active set
+    enter the linear systems, which makes it fast when few constraints are active, as is
+    the case for barrier certificates.
+
+    Warm starting begins from the active set of the previous solution.  Between two
+    steps of a simulation the active set rarely changes, so most warm started solves
+    finish after one linear solve.
+    """
+
+    def __init__(self, warm_start=True, tolerance=1e-9, max_iterations=500):
+        """
+        warm_start: bool (whether to start every solve from the previous active set)
+        tolerance: double (constraint violations below this are treated as 0)
+        max_iterations: int (maximum number of active set changes)
+        """
+        assert isinstance(max_iterations, int), "In the ActiveSetQPSolver class, the maximum number of iterations (max_iterations) must be an integer. Recieved type %r." % type(max_iterations).__name__
+        assert tolerance > 0, "In the ActiveSetQPSolver class, the tolerance (tolerance) must be positive. Recieved %r." % tolerance
+        assert max_iterations > 0, "In the ActiveSetQPSolver class, the maximum number of iterations (max_iterations) must be positive. Recieved %r." % max_iterations
+
+        super().__init__(warm_start)
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+
+    def _solve(self, H, f, A, b):
+        tol = self.tolerance
+        m = b.size
+        if issparse(A):
+            A = A.tocsr()
+        solve_H = _hessian_solver(H)
+
+        # Unconstrained minimum.  The multipliers give x = x0 - H^-1 A_F^T lambda_F.
+        x0 = -solve_H(f)
+
+        # The dual Hessian A_F H^-1 A_F^T is singular when active constraints are linearly
+        # dependent, which is common for robots placed on a grid.  A tiny regularization
+        # keeps every subproblem strictly convex, so the method cannot cycle.
+        regularization = 1e-12*max(1.0, np.max(_dual_diagonal(A, solve_H))) if m > 0 else 0.0
+
+        active = np.zeros(0, dtype=int)
+        if self.warm_start and self.active_set.size > 0 and self.active_set[-1] < m:
+            active = self.active_set
+        multipliers = np.zeros(0)
+
+        iterations = 0
+        status = 'optimal'
+        while True:
+            # Minimize over the multipliers of the active set, dropping the constraints
+            # whose multipliers would become negative.
+            while active.size > 0:
+                iterations += 1
+                A_active = A[active].toarray() if issparse(A) else A[active]
+                HA = solve_H(A_active.T)
+                slack = b[active] - A_active.dot(x0)
+                Q = A_active.dot(HA)
+                Q[np.diag_indices_from(Q)] += regularization
+                z = np.linalg.solve(Q, -slack)
+
+                if np.all(z > 0):
+                    multipliers = z
+                    break
+
+                if multipliers.size != active.size:
+                    # No feasible multipliers yet (first pass or warm start), drop every
+                    # constraint that would get a negative multiplier.
+                    keep = z > 0
+                else:
+                    # Move towards z as far as the multipliers stay non-negative, and drop
+                    # the constraint whose multiplier reaches zero first.
+                    blocking = np.flatnonzero(z <= 0)
+                    step = multipliers[blocking] - z[blocking]
+                    ratios = np.divide(multipliers[blocking], step, out=np.zeros(blocking.size), where=step > 0)
+                    first = np.argmin(ratios)
+                    multipliers = multipliers + ratios[first]*(z - multipliers)
+                    multipliers[blocking[first]] = 0
+                    keep = multipliers > 0
+                    multipliers = multipliers[keep]
+                active = active[keep]
+                if multipliers.size != active.size:
+                    multipliers = np.zeros(0)
+
+                if iterations >= self.max_iterations:
+                    break
+
+            if active.size > 0 and multipliers.size == active.size:
+                A_active = A[active].toarray() if issparse(A) else A[active]
+                x = x0 - solve_H(A_active.T.dot(multipliers))
+            else:
+                active = np.zeros(0, dtype=int)
+                multipliers = np.zeros(0)
+                x = x0.copy()
+
+            # The most violated constraint enters the active set.
+            violation = A.dot(x) - b
+            violation[active] = -np.inf
+            k = int(np.argmax(violation)) if m > 0 else 0
+            if m == 0 or violation[k] <= tol:
+                break
+
+            if iterations >= self.max_iterations:
+                status = 'max_iterations'
+                break
+
+            iterations += 1
+            active = np.append(active, k)
+            multipliers = np.append(multipliers, 0.0)
+
+        order = np.argsort(active)
+        return x, iterations, active[order], status
+
+class BatchedActiveSetQPSolver:
+    """Solves M independent QPs with the same numbers of variables and constraints at
+    once, e.g. the barrier certificate QPs of the worlds of an ensemble.  It runs the
+    dual active set method of ActiveSetQPSolver on every QP in lockstep, with every
+    linear algebra operation batched over the QPs that are not finished yet, so the
+    number of Python level iterations is that of the hardest QP rather than the sum over
+    all of them.
+
+    QPs whose unconstrained minimum satisfies every constraint are finished before the
+    first iteration.  Warm starting begins every QP from its previous active set.
+
+    After every call of solve() the following statistics are available:
+
+    solve_time: double (seconds the last solve took)
+    iterations: int (iterations of the last solve)
+    status: string ('optimal' or 'max_iterations')
+    active_set: MxK boolean numpy array (constraints active at the last solutions)
+    solves, total_solve_time, total_iterations: totals over all calls of solve() since reset()
+    skipped_solves: int (QPs since reset() answered by their unconstrained minimum)
+    """
+
+    def __init__(self, warm_start=True, tolerance=1e-9, max_iterations=500):
+        """
+        warm_start: bool (whether to start every QP from its previous active set)
+        tolerance: double (constraint violations below this are treated as 0)
+        max_iterations: int (maximum number of iterations)
+        """
+        assert isinstance(warm_start, bool), "In the BatchedActiveSetQPSolver class, the warm start flag (warm_start) must be boolean type. Recieved type %r." % type(warm_start).__name__
+        assert isinstance(max_iterations, int), "In the BatchedActiveSetQPSolver class, the maximum number of iterations (max_iterations) must be an integer. Recieved type %r." % type(max_iterations).__name__
+        assert tolerance > 0, "In the BatchedActiveSetQPSolver class, the tolerance (tolerance) must be positive. Recieved %r." % tolerance
+        assert max_iterations > 0, "In the BatchedActiveSetQPSolver class, the maximum number of iterations (max_iterations) must be positive. Recieved %r." % max_iterations
+
+        self.warm_start = warm_start
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.reset()
+
+    def reset(self):
+        """Forgets the previous active sets and the statistics."""
+        self.active_set = None
+        self.solve_time = 0.0
+        self.iterations = 0
+        self.status = None
+        self.solves = 0
+        self.total_solve_time = 0.0
+        self.total_iterations = 0
+        self.skipped_solves = 0
+
+    def solve(self, H, f, A, b):
+        """Solves the QPs.
+
+        H: nxn numpy array (positive definite Hessian shared by all QPs) or Mxnxn numpy array
+        f: Mxn numpy array (linear costs)
+        A: MxKxn numpy array (constraint matrices)
+        b: MxK numpy array (constraint bounds)
+
+        -> Mxn numpy array (the solutions)
+        """
+        start = time.perf_counter()
+        tol = self.tolerance
+        M, K = b.shape
+
+        # Unconstrained minima x0 = -H^-1 f, and the dual problems
+        #     minimize 1/2 z^T Q z + c^T z  subject to  z >= 0
+        # with Q = A H^-1 A^T and c = b - A x0, whose gradient Q z + c is the slack of the
+        # constraints at x = x0 - H^-1 A^T z.
+        if H.ndim == 2:
+            # Shared Hessian, inverted once instead of once per QP
+            H_inv = np.linalg.inv(H)
+            HA = np.ascontiguousarray(np.swapaxes(np.reshape(np.reshape(A, (-1, A.shape[2])).dot(H_inv.T), A.shape), 1, 2))
+            x0 = -f.dot(H_inv.T)
+        else:
+            HA = np.linalg.solve(H, np.swapaxes(A, 1, 2))
+            x0 = -np.linalg.solve(H, f[..., np.newaxis])[..., 0]
+        c = b - np.matmul(A, x0[..., np.newaxis])[..., 0]
+
+        active = np.zeros((M, K), dtype=bool)
+        if self.warm_start and self.active_set is not None and self.active_set.shape == (M, K):
+            active[:] = self.active_set
+        multipliers = np.zeros((M, K))
+        # Whether the multipliers are feasible for the active set, which is false until the
+        # first solve after a warm start.
+        valid = ~np.any(active, axis=1)
+
+        # QPs with a feasible unconstrained minimum are finished.
+        running = ~(valid & np.all(c >= -tol, axis=1))
+        self.skipped_solves += M - np.count_nonzero(running)
+
+        # The dual Hessians are only needed for the QPs that are not finished, with a tiny
+        # regularization against linearly dependent active constraints (see ActiveSetQPSolver).
+        # Q[slot[i]] belongs to QP i.
+        unfinished = np.flatnonzero(running)
+        slot = np.zeros(M, dtype=int)
+        slot[unfinished] = np.arange(unfinished.size)
+        Q = np.matmul(A[unfinished], HA[unfinished])
+        regularization = 1e-12*np.maximum(1.0, np.max(np.diagonal(Q, axis1=1, axis2=2), axis=1, initial=0.0))
+
+        iterations = 0
+        while np.any(running) and iterations < self.max_iterations:
+            iterations += 1
+            k = np.flatnonzero(running)
+            F = active[k]
+
+            # Minimize over the multipliers of the active sets: Q_FF z_F = -c_F, z = 0
+            # elsewhere.  The active constraints of every QP are gathered into the first
+            # columns, padded with identity rows up to the largest active set.
+            counts = np.count_nonzero(F, axis=1)
+            size = max(int(counts.max()), 1)
+            members = np.argsort(~F, axis=1, kind='stable')[:, :size]
+            padded = np.arange(size) < counts[:, np.newaxis]
+            rows = np.arange(k.size)[:, np.newaxis]
+            Q_F = Q[slot[k][:, np.newaxis, np.newaxis], members[:, :, np.newaxis], members[:, np.newaxis, :]]
+            Q_F[~(padded[:, :, np.newaxis] & padded[:, np.newaxis, :])] = 0.0
+            diagonal = np.einsum('kii->ki', Q_F)
+            diagonal += np.where(padded, regularization[slot[k], np.newaxis], 1.0)
+            z_F = np.linalg.solve(Q_F, np.where(padded, -c[k[:, np.newaxis], members], 0.0)[..., np.newaxis])[..., 0]
+            z_F[~padded] = 0.0
+            z = np.zeros(F.shape)
+            z[rows, members] = z_F
+
+            feasible = np.all(z > 0, axis=1, where=F)
+
+            # Feasible: accept z and add the most violated constraint, or finish.
+            done = np.zeros(k.size, dtype=bool)
+            if np.any(feasible):
+                kf = k[feasible]
+                multipliers[kf] = z[feasible]
+                valid[kf] = True
+                # Slack b - A x of the constraints at x = x0 - H^-1 A^T z
+                x = x0[kf] - np.matmul(HA[kf], z[feasible][..., np.newaxis])[..., 0]
+                slack = b[kf] - np.matmul(A[kf], x[..., np.newaxis])[..., 0]
+                slack[active[kf]] = np.inf
+                worst = np.argmin(slack, axis=1)
+                violated = slack[np.arange(kf.size), worst] < -tol
+                active[kf[violated], worst[violated]] = True
+                done[np.flatnonzero(feasible)[~violated]] = True
+
+            # Infeasible without valid multipliers: drop every constraint with z <= 0.
+            reset = ~feasible & ~valid[k]
+            if np.any(reset):
+                kr = k[reset]
+                active[kr] &= z[reset] > 0
+                multipliers[kr] = 0.0
+                valid[kr] = ~np.any(active[kr], axis=1)
+
+            # Infeasible: move towards z as far as the multipliers stay non-negative, and
+            # drop the constraint whose multiplier reaches zero first.
+            step = ~feasible & ~reset
+            if np.any(step):
+                ks = k[step]
+                lam = multipliers[ks]
+                zs = z[step]
+                blocking = active[ks] & (zs <= 0)
+                ratios = np.full(lam.shape, np.inf)
+                np.divide(lam, lam - zs, out=ratios, where=blocking & (lam - zs > 0))
+                ratios[blocking & ~(lam - zs > 0)] = 0.0
+                first = np.argmin(ratios, axis=1)
+                rows = np.arange(ks.size)
+                lam = lam + ratios[rows, first][:, np.newaxis]*(zs - lam)
+                lam[rows, first] = 0.0
+                active[ks] &= lam > 0
+                lam[~active[ks]] = 0.0
+                multipliers[ks] = lam
+
+            running[k[done]] = False
+
+        x = x0 - np.matmul(HA, multipliers[..., np.newaxis])[..., 0]
+
+        self.solve_time = time.perf_counter() - start
+        self.iterations = iterations
+        self.status = 'max_iterations' if np.any(running) else 'optimal'
+        self.active_set = active
+        self.solves += 1
+        self.total_solve_time += self.solve_time
+        self.total_iterations += iterations
+
+        return x
+
+def _is_scaled_identity(H):
+    # Whether H is c*I for some c > 0.
+    d = H.diagonal()
+    off_diagonal = H.nnz - np.count_nonzero(d) if issparse(H) else np.count_nonzero(H) - np.count_nonzero(d)
+    return off_diagonal == 0 and d[0] > 0 and np.all(d == d[0])
+
+@functools.lru_cache(maxsize=None)
+def _active_set_candidates(m, k):
+    # Every set of k of the m constraints, one per row.
+    return np.array(list(itertools.combinations(range(m), k)), dtype=int).reshape(-1, k)
+
+def _project_onto_constraints(x0, A, b):
+    # Exact Euclidean projection of x0 onto {x : A x <= b} for a small dense A.  The
+    # projection is the unique point satisfying the KKT conditions for some active set S:
+    # x = x0 - A_S^T lambda with A_S x = b_S, lambda >= 0 and A x <= b.  All active sets of
+    # the same size are tried at once with batched linear algebra, from the smallest size
+    # up, and the first one satisfying the conditions gives the solution.  Returns
+    # (x, active set), or None if no active set passed the (tolerance based) checks.
+    m, n = A.shape
+    tol = 1e-9*(1.0 + np.max(np.absolute(b)))
+    violation = A.dot(x0) - b
+    for k in range(1, min(m, n) + 1):
+        candidates = _active_set_candidates(m, k)
+        A_S = A[candidates]
+        G = np.matmul(A_S, np.swapaxes(A_S, 1, 2))
+        # Dependent rows make G singular, which a tiny regularization turns into a
+        # least squares solution that the checks below reject or accept as usual.
+        G[:, np.arange(k), np.arange(k)] += 1e-12*(1.0 + np.max(np.absolute(G)))
+        multipliers = np.linalg.solve(G, violation[candidates][..., np.newaxis])[..., 0]
+        x = x0 - np.einsum('ckn,ck->cn', A_S, multipliers)
+        solutions = np.flatnonzero(np.all(multipliers >= -tol, axis=1) & np.all(x.dot(A.T) <= b + tol, axis=1))
+        if solutions.size > 0:
+            return x[solutions[0]], candidates[solutions[0]]
+
+    return None
+
+def _hessian_solver(H):
+    # Returns a function computing H^-1 v, exploiting a diagonal H.
+    d = H.diagonal()
+    off_diagonal = H.nnz - np.count_nonzero(d) if issparse(H) else np.count_nonzero(H) - np.count_nonzero(d)
+    if off_diagonal == 0:
+        return lambda v: (v.T/d).T
+
+    factor = cho_factor(H.toarray() if issparse(H) else H)
+    return lambda v: cho_solve(factor, v)
+
+def _dual_diagonal(A, solve_H):
+    # Diagonal of A H^-1 A^T, one entry per constraint.
+    if issparse(A):
+        return np.asarray(A.multiply(solve_H(A.toarray().T).T).sum(axis=1)).ravel()
+    return np.einsum('ij,ji->i', A, solve_H(A.T))
+
+def cvxopt_matrix(A):
+    """Converts a numpy array or a scipy.sparse matrix to the matching cvxopt matrix.
+
+    A: numpy array or scipy.sparse matrix
+
+    -> cvxopt matrix or spmatrix
+    """
+    if issparse(A):
+        A = A.tocoo()
+        return spmatrix(A.data, A.row, A.col, A.shape)
+    return matrix(A)
+
+QP_SOLVERS = {'cvxopt': CvxoptQPSolver, 'quadprog': QuadprogQPSolver, 'active_set': ActiveSetQPSolver}
+
+def create_qp_solver(solver='cvxopt'):
+    """Creates a QP solver for a barrier certificate.
+
+    solver: string ('cvxopt', 'quadprog' or 'active_set') or QPSolver (returned as is, e.g.
+            to configure a solver or to keep a reference to read its statistics)
+
+    -> QPSolver
+    """
+    if isinstance(solver, QPSolver):
+        return solver
+
+    assert solver in QP_SOLVERS, "The QP solver (solver) must be one of %r or a QPSolver. Recieved %r." % (sorted(QP_SOLVERS), solver)
+    return QP_SOLVERS[solver]()
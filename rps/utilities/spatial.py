@@ -0,0 +1,175 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Half of the 3x3 cell neighborhood (dx, dy).  Together with the pairs inside a cell this
+# visits every pair of neighboring cells exactly once.
+_HALF_STENCIL = ((1, -1), (1, 0), (1, 1), (0, 1))
+
+def pairs_within(points, distance, groups=None):
+    """Finds every pair of points that are at most distance apart.  The points are
+    bucketed into a uniform grid of cells with side length distance, so only points in the
+    same or in neighboring cells are compared.  This takes O(N + number of close pairs)
+    time instead of O(N^2).
+
+    points: 2xN numpy array (of positions)
+    distance: double (pairs this close or closer are returned)
+    groups: length N integer numpy array (optional, points in different groups are never paired)
+
+    -> (1D numpy array, 1D numpy array) (the indices i, j of every close pair, with i < j)
+    """
+
+    #Check user input types
+    assert isinstance(points, np.ndarray), "In the pairs_within function, the point positions (points) must be a numpy ndarray. Recieved type %r." % type(points).__name__
+    assert isinstance(distance, (int, float)), "In the pairs_within function, the pairing distance (distance) must be an integer or float. Recieved type %r." % type(distance).__name__
+
+    #Check user input ranges/sizes
+    assert points.shape[0] == 2, "In the pairs_within function, the dimension of the point positions (points) must be 2 ([x;y]). Recieved dimension %r." % points.shape[0]
+    assert distance > 0, "In the pairs_within function, the pairing distance (distance) must be positive. Recieved %r." % distance
+
+    N = points.shape[1]
+    if N < 2:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    # Integer cell coordinates, padded by one cell on every side so that neighbor keys
+    # never wrap into another row or group.
+    cells = np.floor((points - points.min(axis=1, keepdims=True))/distance).astype(np.int64) + 1
+    x_stride = cells[1].max() + 2
+    keys = cells[0]*x_stride + cells[1]
+    if groups is not None:
+        keys += groups.astype(np.int64)*((cells[0].max() + 2)*x_stride)
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    positions = np.arange(N)
+
+    # Pairs inside one cell: every point is paired with the points sorted after it.
+    cell_ends = np.searchsorted(sorted_keys, sorted_keys, side='right')
+    firsts = [positions + 1]
+    counts = [cell_ends - positions - 1]
+
+    # Pairs between neighboring cells
+    for dx, dy in _HALF_STENCIL:
+        neighbor_keys = sorted_keys + (dx*x_stride + dy)
+        starts = np.searchsorted(sorted_keys, neighbor_keys, side='left')
+        firsts.append(starts)
+        counts.append(np.searchsorted(sorted_keys, neighbor_keys, side='right') - starts)
+
+    firsts = np.concatenate(firsts)
+    counts = np.concatenate(counts)
+    sources = np.tile(positions, len(_HALF_STENCIL) + 1)
+
+    # Expand (source, first partner, number of partners) into one row per candidate pair.
+    total = counts.sum()
+    run_starts = np.cumsum(counts) - counts
+    candidates_i = np.repeat(sources, counts)
+    candidates_j = np.repeat(firsts - run_starts, counts) + np.arange(total)
+
+    i = order[candidates_i]
+    j = order[candidates_j]
+    diffs = points[:, i] - points[:, j]
+    close = (diffs[0]*diffs[0] + diffs[1]*diffs[1]) <= distance*distance
+
+    i = i[close]
+    j = j[close]
+    return np.minimum(i, j), np.maximum(i, j)
+
+class ObstacleIndex:
+    """A set of obstacle points indexed by a KD-tree, for barrier certificates that only
+    constrain every robot against its nearest obstacle points.  Points can be added,
+    moved and removed between steps.  They are identified by the integer ids returned by
+    add().  The tree is rebuilt on the first query after a change, so any number of
+    changes between two steps costs one rebuild.
+    """
+
+    def __init__(self, points=np.empty((2, 0))):
+        """
+        points: 2xK numpy array (of initial obstacle positions)
+        """
+        self._points = np.zeros((2, 0))
+        self._ids = np.zeros(0, dtype=int)
+        self._next_id = 0
+        self._tree = None
+        self.add(points)
+
+    @property
+    def points(self):
+        """2xK numpy array (of the obstacle positions, in the order of ids)"""
+        return self._points
+
+    @property
+    def ids(self):
+        """length K integer numpy array (of the ids of the obstacle points)"""
+        return self._ids
+
+    def __len__(self):
+        return self._ids.size
+
+    def add(self, points):
+        """Adds obstacle points.
+
+        points: 2xK numpy array (of obstacle positions)
+
+        -> length K integer numpy array (the ids of the new points)
+        """
+        #Check user input types
+        assert isinstance(points, np.ndarray), "In the ObstacleIndex class, the obstacle positions (points) must be a numpy ndarray. Recieved type %r." % type(points).__name__
+
+        #Check user input ranges/sizes
+        points = np.reshape(points, (2, -1)) if points.size == 0 else points
+        assert points.shape[0] == 2, "In the ObstacleIndex class, the dimension of the obstacle positions (points) must be 2 ([x;y]). Recieved dimension %r." % points.shape[0]
+
+        ids = np.arange(self._next_id, self._next_id + points.shape[1])
+        self._next_id += ids.size
+        self._points = np.concatenate((self._points, points), axis=1)
+        self._ids = np.concatenate((self._ids, ids))
+        self._tree = None
+        return ids
+
+    def remove(self, ids):
+        """Removes obstacle points.
+
+        ids: integer numpy array (of the ids of the points to remove, unknown ids are ignored)
+        """
+        keep = ~np.isin(self._ids, ids)
+        self._points = self._points[:, keep]
+        self._ids = self._ids[keep]
+        self._tree = None
+
+    def move(self, ids, points):
+        """Moves obstacle points to new positions.
+
+        ids: length K integer numpy array (of the ids of the points to move)
+        points: 2xK numpy array (of their new positions)
+        """
+        #Check user input ranges/sizes
+        assert np.shape(points) == (2, np.size(ids)), "In the ObstacleIndex class, the new obstacle positions (points) must be of size 2xK for K ids. Recieved %r positions for %r ids." % (np.shape(points), np.size(ids))
+
+        sorter = np.argsort(self._ids)
+        positions = sorter[np.searchsorted(self._ids, ids, sorter=sorter)]
+        assert np.all(self._ids[positions] == ids), "In the ObstacleIndex class, every moved obstacle point (ids) must have been added before."
+        self._points[:, positions] = points
+        self._tree = None
+
+    def nearest(self, positions, k, max_distance=np.inf):
+        """Finds the k nearest obstacle points of every position that are at most
+        max_distance away.
+
+        positions: 2xN numpy array (of query positions, e.g. of the robots)
+        k: int (number of obstacle points per position)
+        max_distance: double (obstacle points farther away than this are not returned)
+
+        -> (2xNxk numpy array, Nxk boolean numpy array) (the obstacle points sorted by
+           distance, and whether each one was found.  Points that were not found are NaN)
+        """
+        N = positions.shape[1]
+        points = np.full((2, N, k), np.nan)
+        if self._ids.size == 0 or k == 0:
+            return points, np.zeros((N, k), dtype=bool)
+
+        if self._tree is None:
+            self._tree = cKDTree(self._points.T)
+
+        distances, neighbors = self._tree.query(positions.T, k=np.arange(1, k+1), distance_upper_bound=max_distance)
+        found = np.isfinite(distances)
+        points[:, found] = self._points[:, neighbors[found]]
+        return points, found
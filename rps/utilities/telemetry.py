@@ -0,0 +1,81 @@
+import numpy as np
+
+# Telemetry of the barrier certificates.  A BarrierTelemetry object passed to a
+# create_*_barrier_certificate function gets one record per call of the certificate,
+# stored in a fixed size ring buffer that can be read after (or during) a run.
+
+class BarrierTelemetry:
+    """Ring buffer of barrier certificate calls.  Every record has the fields:
+
+    assembly_time: double (seconds spent building the constraints)
+    solve_time: double (seconds spent in the QP solver(s))
+    conversion_time: double (seconds spent converting the result, e.g. back to unicycle velocities)
+    constraints: int (number of constraints of the QP(s))
+    active_constraints: int (number of constraints active at the solution(s))
+    iterations: int (solver iterations)
+    status: string (solver status, 'optimal' when every QP was solved)
+    deviation: double (norm of the difference between the returned and the nominal input)
+
+    Once capacity records are stored, every new record overwrites the oldest one.
+    """
+
+    FIELDS = (('assembly_time', float), ('solve_time', float), ('conversion_time', float), ('constraints', int),
+              ('active_constraints', int), ('iterations', int), ('status', object), ('deviation', float))
+
+    def __init__(self, capacity=10000):
+        """
+        capacity: int (number of most recent records kept)
+        """
+
+        #Check user input types
+        assert isinstance(capacity, int), "In the BarrierTelemetry class, the capacity (capacity) must be an integer. Recieved type %r." % type(capacity).__name__
+
+        #Check user input ranges/sizes
+        assert capacity > 0, "In the BarrierTelemetry class, the capacity (capacity) must be positive. Recieved %r." % capacity
+
+        self.capacity = capacity
+        self._buffers = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.FIELDS}
+        self.clear()
+
+    def clear(self):
+        """Removes every record."""
+        self.count = 0
+        self._buffers['status'][:] = None
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def record(self, **values):
+        """Appends a record.  Fields that are not given are 0 (None for the status)."""
+        k = self.count % self.capacity
+        for name, dtype in self.FIELDS:
+            self._buffers[name][k] = values.pop(name, None if dtype is object else 0)
+        assert not values, "In the BarrierTelemetry class, unknown telemetry fields %r." % sorted(values)
+        self.count += 1
+
+    def amend(self, **values):
+        """Updates fields of the most recent record, e.g. for the conversion done by a
+        certificate that wraps another one."""
+        assert self.count > 0, "In the BarrierTelemetry class, there is no record to amend."
+        k = (self.count - 1) % self.capacity
+        for name, value in values.items():
+            self._buffers[name][k] = value
+
+    def records(self):
+        """Returns the stored records, oldest first.
+
+        -> dictionary (field name -> numpy array with one entry per record)
+        """
+        if self.count <= self.capacity:
+            return {name: buffer[:self.count].copy() for name, buffer in self._buffers.items()}
+
+        order = np.roll(np.arange(self.capacity), -(self.count % self.capacity))
+        return {name: buffer[order] for name, buffer in self._buffers.items()}
+
+    def summary(self):
+        """Returns the mean of every numeric field over the stored records.
+
+        -> dictionary (field name -> double)
+        """
+        records = self.records()
+        return {name: float(np.mean(records[name])) if len(self) > 0 else 0.0 for name, dtype in self.FIELDS if dtype is not object}
@@ -1,5 +1,70 @@
 import numpy as np
 
+# Every transformation accepts 2xN/3xN arrays, or stacked Mx2xN/Mx3xN arrays (e.g., the
+# poses of a RobotariumEnsemble), and optionally
+#
+#   out: numpy array of the shape of the result, receives the result instead of a new array
+#   headings: HeadingCache of the poses, supplies the cosines and sines of the headings
+#
+# so that converting the states and the dynamics of a step computes the trigonometric
+# functions only once.  The velocity transformations compute both rows of the result before
+# writing it, so out may be the input velocity array itself.
+
+class HeadingCache:
+    """The cosines and sines of the headings of a 3xN (or Mx3xN) pose array.  Call update
+    whenever the poses change, e.g. once per step after get_poses.
+
+    cos: N (or MxN) numpy array
+    sin: N (or MxN) numpy array
+    """
+
+    def __init__(self, poses=None):
+        """
+        poses: 3xN or Mx3xN numpy array (optional, of unicycle poses to compute the cache of)
+        """
+        self.cos = None
+        self.sin = None
+        if poses is not None:
+            self.update(poses)
+
+    def update(self, poses):
+        """Computes the cosines and sines of the headings of the poses, reusing the arrays of
+        the previous update if the shape is the same.
+
+        poses: 3xN or Mx3xN numpy array (of unicycle poses)
+
+        -> HeadingCache (self)
+        """
+
+        #Check user input types
+        assert isinstance(poses, np.ndarray), "In the HeadingCache class, the robot poses (poses) must be a numpy array. Recieved type %r." % type(poses).__name__
+
+        #Check user input ranges/sizes
+        assert poses.ndim in (2, 3) and poses.shape[-2] == 3, "In the HeadingCache class, the robot poses (poses) must be a 3xN or Mx3xN array. Recieved an array of size %r." % (poses.shape,)
+
+        theta = poses[..., 2, :]
+        if self.cos is None or self.cos.shape != theta.shape:
+            self.cos = np.empty(theta.shape)
+            self.sin = np.empty(theta.shape)
+        np.cos(theta, out=self.cos)
+        np.sin(theta, out=self.sin)
+
+        return self
+
+def _headings(poses, headings):
+    # The cosines and sines of the headings of the poses, from the cache if there is one.
+    if headings is None:
+        return np.cos(poses[..., 2, :]), np.sin(poses[..., 2, :])
+    assert headings.cos is not None and headings.cos.shape == poses.shape[:-2] + poses.shape[-1:], "The heading cache (headings) does not match the robot poses (poses). Call headings.update(poses) after the poses change."
+    return headings.cos, headings.sin
+
+def _output(out, shape):
+    # The array receiving a result, either the given out array or a new one.
+    if out is None:
+        return np.empty(shape)
+    assert isinstance(out, np.ndarray) and out.shape == shape, "The output array (out) must be a numpy array of size %r. Recieved %r." % (shape, out.shape if isinstance(out, np.ndarray) else type(out).__name__)
+    return out
+
 def create_si_to_uni_dynamics(linear_velocity_gain=1, angular_velocity_limit=np.pi):
     """ Returns a function mapping from single-integrator to unicycle dynamics with angular velocity magnitude restrictions.
 
@@ -18,13 +83,15 @@ def create_si_to_uni_dynamics(linear_velocity_gain=1, angular_velocity_limit=np.
     assert angular_velocity_limit >= 0, "In the function create_si_to_uni_dynamics, the angular velocity limit (angular_velocity_limit) must not be negative. Recieved %r." % angular_velocity_limit
     
 
-    def si_to_uni_dyn(dxi, poses):
+    def si_to_uni_dyn(dxi, poses, out=None, headings=None):
         """A mapping from single-integrator to unicycle dynamics.
 
-        dxi: 2xN numpy array with single-integrator control inputs
-        poses: 2xN numpy array with single-integrator poses
+        dxi: 2xN (or Mx2xN) numpy array with single-integrator control inputs
+        poses: 3xN (or Mx3xN) numpy array with unicycle poses
+        out: 2xN (or Mx2xN) numpy array (optional, receives the result, may be the input velocities)
+        headings: HeadingCache (optional, of the poses)
 
-        -> 2xN numpy array of unicycle control inputs
+        -> 2xN (or Mx2xN) numpy array of unicycle control inputs
         """
 
         #Check user input types
@@ -32,18 +99,18 @@ def create_si_to_uni_dynamics(linear_velocity_gain=1, angular_velocity_limit=np.
         assert isinstance(poses, np.ndarray), "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics function, the current robot poses (poses) must be a numpy array. Recieved type %r." % type(poses).__name__
 
         #Check user input ranges/sizes
-        assert dxi.shape[0] == 2, "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics function, the dimension of the single integrator velocity inputs (dxi) must be 2 ([x_dot;y_dot]). Recieved dimension %r." % dxi.shape[0]
-        assert poses.shape[0] == 3, "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics function, the dimension of the current pose of each robot must be 3 ([x;y;theta]). Recieved dimension %r." % poses.shape[0]
-        assert dxi.shape[1] == poses.shape[1], "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics function, the number of single integrator velocity inputs must be equal to the number of current robot poses. Recieved a single integrator velocity input array of size %r x %r and current pose array of size %r x %r." % (dxi.shape[0], dxi.shape[1], poses.shape[0], poses.shape[1])
+        assert dxi.shape[-2] == 2, "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics function, the dimension of the single integrator velocity inputs (dxi) must be 2 ([x_dot;y_dot]). Recieved dimension %r." % dxi.shape[-2]
+        assert poses.shape[-2] == 3, "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics function, the dimension of the current pose of each robot must be 3 ([x;y;theta]). Recieved dimension %r." % poses.shape[-2]
+        assert dxi.shape[:-2] + dxi.shape[-1:] == poses.shape[:-2] + poses.shape[-1:], "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics function, the number of single integrator velocity inputs must be equal to the number of current robot poses (in every world). Recieved a single integrator velocity input array of size %r and current pose array of size %r." % (dxi.shape, poses.shape)
 
-        M,N = np.shape(dxi)
+        a, b = _headings(poses, headings)
+        dxu = _output(out, dxi.shape)
 
-        a = np.cos(poses[2, :])
-        b = np.sin(poses[2, :])
-
-        dxu = np.zeros((2, N))
-        dxu[0, :] = linear_velocity_gain*(a*dxi[0, :] + b*dxi[1, :])
-        dxu[1, :] = angular_velocity_limit*np.arctan2(-b*dxi[0, :] + a*dxi[1, :], dxu[0, :])/(np.pi/2)
+        v = linear_velocity_gain*(a*dxi[..., 0, :] + b*dxi[..., 1, :])
+        w = -b*dxi[..., 0, :] + a*dxi[..., 1, :]
+        dxu[..., 0, :] = v
+        np.arctan2(w, v, out=dxu[..., 1, :])
+        dxu[..., 1, :] *= angular_velocity_limit/(np.pi/2)
 
         return dxu
 
@@ -68,13 +135,15 @@ def create_si_to_uni_dynamics_with_backwards_motion(linear_velocity_gain=1, angu
     assert angular_velocity_limit >= 0, "In the function create_si_to_uni_dynamics, the angular velocity limit (angular_velocity_limit) must not be negative. Recieved %r." % angular_velocity_limit
     
 
-    def si_to_uni_dyn(dxi, poses):
+    def si_to_uni_dyn(dxi, poses, out=None, headings=None):
         """A mapping from single-integrator to unicycle dynamics.
 
-        dxi: 2xN numpy array with single-integrator control inputs
-        poses: 2xN numpy array with single-integrator poses
+        dxi: 2xN (or Mx2xN) numpy array with single-integrator control inputs
+        poses: 3xN (or Mx3xN) numpy array with unicycle poses
+        out: 2xN (or Mx2xN) numpy array (optional, receives the result, may be the input velocities)
+        headings: HeadingCache (optional, of the poses)
 
-        -> 2xN numpy array of unicycle control inputs
+        -> 2xN (or Mx2xN) numpy array of unicycle control inputs
         """
 
         #Check user input types
@@ -82,18 +151,18 @@ def create_si_to_uni_dynamics_with_backwards_motion(linear_velocity_gain=1, angu
         assert isinstance(poses, np.ndarray), "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics_with_backwards_motion function, the current robot poses (poses) must be a numpy array. Recieved type %r." % type(poses).__name__
 
         #Check user input ranges/sizes
-        assert dxi.shape[0] == 2, "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics_with_backwards_motion function, the dimension of the single integrator velocity inputs (dxi) must be 2 ([x_dot;y_dot]). Recieved dimension %r." % dxi.shape[0]
-        assert poses.shape[0] == 3, "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics_with_backwards_motion function, the dimension of the current pose of each robot must be 3 ([x;y;theta]). Recieved dimension %r." % poses.shape[0]
-        assert dxi.shape[1] == poses.shape[1], "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics_with_backwards_motion function, the number of single integrator velocity inputs must be equal to the number of current robot poses. Recieved a single integrator velocity input array of size %r x %r and current pose array of size %r x %r." % (dxi.shape[0], dxi.shape[1], poses.shape[0], poses.shape[1])
-
-        M,N = np.shape(dxi)
+        assert dxi.shape[-2] == 2, "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics_with_backwards_motion function, the dimension of the single integrator velocity inputs (dxi) must be 2 ([x_dot;y_dot]). Recieved dimension %r." % dxi.shape[-2]
+        assert poses.shape[-2] == 3, "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics_with_backwards_motion function, the dimension of the current pose of each robot must be 3 ([x;y;theta]). Recieved dimension %r." % poses.shape[-2]
+        assert dxi.shape[:-2] + dxi.shape[-1:] == poses.shape[:-2] + poses.shape[-1:], "In the si_to_uni_dyn function created by the create_si_to_uni_dynamics_with_backwards_motion function, the number of single integrator velocity inputs must be equal to the number of current robot poses (in every world). Recieved a single integrator velocity input array of size %r and current pose array of size %r." % (dxi.shape, poses.shape)
 
-        a = np.cos(poses[2, :])
-        b = np.sin(poses[2, :])
+        a, b = _headings(poses, headings)
+        dxu = _output(out, dxi.shape)
 
-        dxu = np.zeros((2, N))
-        dxu[0, :] = linear_velocity_gain*(a*dxi[0, :] + b*dxi[1, :])
-        dxu[1, :] = angular_velocity_limit*np.arctan2(-b*dxi[0, :] + a*dxi[1, :], dxu[0, :])/(np.pi/2)
+        v = linear_velocity_gain*(a*dxi[..., 0, :] + b*dxi[..., 1, :])
+        w = -b*dxi[..., 0, :] + a*dxi[..., 1, :]
+        dxu[..., 0, :] = v
+        np.arctan2(w, v, out=dxu[..., 1, :])
+        dxu[..., 1, :] *= angular_velocity_limit/(np.pi/2)
 
         return dxu
 
@@ -120,14 +189,16 @@ def create_si_to_uni_mapping(projection_distance=0.05, angular_velocity_limit =
     assert projection_distance > 0, "In the function create_si_to_uni_mapping, the projection distance of the new control point (projection_distance) must be positive. Recieved %r." % projection_distance
     assert projection_distance >= 0, "In the function create_si_to_uni_mapping, the maximum angular velocity command (angular_velocity_limit) must be greater than or equal to zero. Recieved %r." % angular_velocity_limit
 
-    def si_to_uni_dyn(dxi, poses):
+    def si_to_uni_dyn(dxi, poses, out=None, headings=None):
         """Takes single-integrator velocities and transforms them to unicycle
         control inputs.
 
-        dxi: 2xN numpy array of single-integrator control inputs
-        poses: 3xN numpy array of unicycle poses
+        dxi: 2xN (or Mx2xN) numpy array of single-integrator control inputs
+        poses: 3xN (or Mx3xN) numpy array of unicycle poses
+        out: 2xN (or Mx2xN) numpy array (optional, receives the result, may be the input velocities)
+        headings: HeadingCache (optional, of the poses)
 
-        -> 2xN numpy array of unicycle control inputs
+        -> 2xN (or Mx2xN) numpy array of unicycle control inputs
         """
 
         #Check user input types
@@ -135,39 +206,39 @@ def create_si_to_uni_mapping(projection_distance=0.05, angular_velocity_limit =
         assert isinstance(poses, np.ndarray), "In the si_to_uni_dyn function created by the create_si_to_uni_mapping function, the current robot poses (poses) must be a numpy array. Recieved type %r." % type(poses).__name__
 
         #Check user input ranges/sizes
-        assert dxi.shape[0] == 2, "In the si_to_uni_dyn function created by the create_si_to_uni_mapping function, the dimension of the single integrator velocity inputs (dxi) must be 2 ([x_dot;y_dot]). Recieved dimension %r." % dxi.shape[0]
-        assert poses.shape[0] == 3, "In the si_to_uni_dyn function created by the create_si_to_uni_mapping function, the dimension of the current pose of each robot must be 3 ([x;y;theta]). Recieved dimension %r." % poses.shape[0]
-        assert dxi.shape[1] == poses.shape[1], "In the si_to_uni_dyn function created by the create_si_to_uni_mapping function, the number of single integrator velocity inputs must be equal to the number of current robot poses. Recieved a single integrator velocity input array of size %r x %r and current pose array of size %r x %r." % (dxi.shape[0], dxi.shape[1], poses.shape[0], poses.shape[1])
+        assert dxi.shape[-2] == 2, "In the si_to_uni_dyn function created by the create_si_to_uni_mapping function, the dimension of the single integrator velocity inputs (dxi) must be 2 ([x_dot;y_dot]). Recieved dimension %r." % dxi.shape[-2]
+        assert poses.shape[-2] == 3, "In the si_to_uni_dyn function created by the create_si_to_uni_mapping function, the dimension of the current pose of each robot must be 3 ([x;y;theta]). Recieved dimension %r." % poses.shape[-2]
+        assert dxi.shape[:-2] + dxi.shape[-1:] == poses.shape[:-2] + poses.shape[-1:], "In the si_to_uni_dyn function created by the create_si_to_uni_mapping function, the number of single integrator velocity inputs must be equal to the number of current robot poses (in every world). Recieved a single integrator velocity input array of size %r and current pose array of size %r." % (dxi.shape, poses.shape)
 
 
-        M,N = np.shape(dxi)
+        cs, ss = _headings(poses, headings)
+        dxu = _output(out, dxi.shape)
 
-        cs = np.cos(poses[2, :])
-        ss = np.sin(poses[2, :])
-
-        dxu = np.zeros((2, N))
-        dxu[0, :] = (cs*dxi[0, :] + ss*dxi[1, :])
-        dxu[1, :] = (1/projection_distance)*(-ss*dxi[0, :] + cs*dxi[1, :])
+        v = cs*dxi[..., 0, :] + ss*dxi[..., 1, :]
+        w = (1/projection_distance)*(-ss*dxi[..., 0, :] + cs*dxi[..., 1, :])
+        dxu[..., 0, :] = v
 
         #Impose angular velocity cap.
-        dxu[1,dxu[1,:]>angular_velocity_limit] = angular_velocity_limit
-        dxu[1,dxu[1,:]<-angular_velocity_limit] = -angular_velocity_limit 
+        np.clip(w, -angular_velocity_limit, angular_velocity_limit, out=dxu[..., 1, :])
 
         return dxu
 
-    def uni_to_si_states(poses):
+    def uni_to_si_states(poses, out=None, headings=None):
         """Takes unicycle states and returns single-integrator states
 
-        poses: 3xN numpy array of unicycle states
+        poses: 3xN (or Mx3xN) numpy array of unicycle states
+        out: 2xN (or Mx2xN) numpy array (optional, receives the result)
+        headings: HeadingCache (optional, of the poses)
 
-        -> 2xN numpy array of single-integrator states
+        -> 2xN (or Mx2xN) numpy array of single-integrator states
         """
 
-        _,N = np.shape(poses)
+        cs, ss = _headings(poses, headings)
+        si_states = _output(out, poses.shape[:-2] + (2, poses.shape[-1]))
 
-        si_states = np.zeros((2, N))
-        si_states[0, :] = poses[0, :] + projection_distance*np.cos(poses[2, :])
-        si_states[1, :] = poses[1, :] + projection_distance*np.sin(poses[2, :])
+        np.multiply(cs, projection_distance, out=si_states[..., 0, :])
+        np.multiply(ss, projection_distance, out=si_states[..., 1, :])
+        si_states += poses[..., :2, :]
 
         return si_states
 
@@ -192,35 +263,35 @@ def create_uni_to_si_dynamics(projection_distance=0.05):
     assert projection_distance > 0, "In the function create_uni_to_si_dynamics, the projection distance of the new control point (projection_distance) must be positive. Recieved %r." % projection_distance
     
 
-    def uni_to_si_dyn(dxu, poses):
+    def uni_to_si_dyn(dxu, poses, out=None, headings=None):
         """A function for converting from unicycle to single-integrator dynamics.
         Utilizes a virtual point placed in front of the unicycle.
 
-        dxu: 2xN numpy array of unicycle control inputs
-        poses: 3xN numpy array of unicycle poses
+        dxu: 2xN (or Mx2xN) numpy array of unicycle control inputs
+        poses: 3xN (or Mx3xN) numpy array of unicycle poses
         projection_distance: How far ahead of the unicycle model to place the point
+        out: 2xN (or Mx2xN) numpy array (optional, receives the result, may be the input velocities)
+        headings: HeadingCache (optional, of the poses)
 
-        -> 2xN numpy array of single-integrator control inputs
+        -> 2xN (or Mx2xN) numpy array of single-integrator control inputs
         """
 
         #Check user input types
-        assert isinstance(dxu, np.ndarray), "In the uni_to_si_dyn function created by the create_uni_to_si_dynamics function, the unicycle velocity inputs (dxu) must be a numpy array. Recieved type %r." % type(dxi).__name__
+        assert isinstance(dxu, np.ndarray), "In the uni_to_si_dyn function created by the create_uni_to_si_dynamics function, the unicycle velocity inputs (dxu) must be a numpy array. Recieved type %r." % type(dxu).__name__
         assert isinstance(poses, np.ndarray), "In the uni_to_si_dyn function created by the create_uni_to_si_dynamics function, the current robot poses (poses) must be a numpy array. Recieved type %r." % type(poses).__name__
 
         #Check user input ranges/sizes
-        assert dxu.shape[0] == 2, "In the uni_to_si_dyn function created by the create_uni_to_si_dynamics function, the dimension of the unicycle velocity inputs (dxu) must be 2 ([v;w]). Recieved dimension %r." % dxu.shape[0]
-        assert poses.shape[0] == 3, "In the uni_to_si_dyn function created by the create_uni_to_si_dynamics function, the dimension of the current pose of each robot must be 3 ([x;y;theta]). Recieved dimension %r." % poses.shape[0]
-        assert dxu.shape[1] == poses.shape[1], "In the uni_to_si_dyn function created by the create_uni_to_si_dynamics function, the number of unicycle velocity inputs must be equal to the number of current robot poses. Recieved a unicycle velocity input array of size %r x %r and current pose array of size %r x %r." % (dxu.shape[0], dxu.shape[1], poses.shape[0], poses.shape[1])
-
-        
-        M,N = np.shape(dxu)
+        assert dxu.shape[-2] == 2, "In the uni_to_si_dyn function created by the create_uni_to_si_dynamics function, the dimension of the unicycle velocity inputs (dxu) must be 2 ([v;w]). Recieved dimension %r." % dxu.shape[-2]
+        assert poses.shape[-2] == 3, "In the uni_to_si_dyn function created by the create_uni_to_si_dynamics function, the dimension of the current pose of each robot must be 3 ([x;y;theta]). Recieved dimension %r." % poses.shape[-2]
+        assert dxu.shape[:-2] + dxu.shape[-1:] == poses.shape[:-2] + poses.shape[-1:], "In the uni_to_si_dyn function created by the create_uni_to_si_dynamics function, the number of unicycle velocity inputs must be equal to the number of current robot poses (in every world). Recieved a unicycle velocity input array of size %r and current pose array of size %r." % (dxu.shape, poses.shape)
 
-        cs = np.cos(poses[2, :])
-        ss = np.sin(poses[2, :])
+        cs, ss = _headings(poses, headings)
+        dxi = _output(out, dxu.shape)
 
-        dxi = np.zeros((2, N))
-        dxi[0, :] = (cs*dxu[0, :] - projection_distance*ss*dxu[1, :])
-        dxi[1, :] = (ss*dxu[0, :] + projection_distance*cs*dxu[1, :])
+        x = cs*dxu[..., 0, :] - projection_distance*ss*dxu[..., 1, :]
+        y = ss*dxu[..., 0, :] + projection_distance*cs*dxu[..., 1, :]
+        dxi[..., 0, :] = x
+        dxi[..., 1, :] = y
 
         return dxi
 